@@ -0,0 +1,162 @@
+"""
+動畫模組
+多幀圖片 (GIF / APNG / WebP) 的每一幀只渲染一次（可分散到多個 worker），
+相鄰幀以 DirtyRectDetector 預先編碼為 DELTA_UPDATE，播放時只改寫序號
+
+頻寬隨幀間變化的大小而定，而不是畫面大小
+"""
+
+import io
+from typing import List, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+from compressor import DirtyRectDetector
+from frame_cache import frame_digest
+from image_processor import ImageProcessor, RenderParams
+from protocol import Protocol
+
+# 檔案未標明時的每幀時間 (ms)
+DEFAULT_FRAME_DURATION = 100
+
+# 視為動畫的格式（手機相機常見的 JPEG MPO 也有多幀，但那是同一張照片的不同版本）
+ANIMATED_FORMATS = ('GIF', 'PNG', 'WEBP')
+
+
+class Animation(NamedTuple):
+    """已渲染並編碼的動畫"""
+    frames: Tuple[bytes, ...]                # 打包後的各幀
+    digests: Tuple[bytes, ...]               # frame_digest(各幀)
+    durations: Tuple[int, ...]               # 各幀時間 (ms)
+    packets: Tuple[Optional[bytes], ...]     # 前一幀 → 此幀的差分封包（第 0 幀為最後一幀 → 第 0 幀，無變化為 None）
+    
+    def payload_bytes(self) -> int:
+        """循環播放時每一輪的傳輸量"""
+        return sum(len(packet) for packet in self.packets if packet is not None)
+
+
+def frame_count(source: bytes) -> int:
+    """
+    圖片的幀數（單幀圖片或非 ANIMATED_FORMATS 的多幀圖片為 1）
+    
+    Args:
+        source: 圖片檔案內容
+    
+    Returns:
+        幀數
+    """
+    with Image.open(io.BytesIO(source)) as img:
+        if not getattr(img, 'is_animated', False) or img.format not in ANIMATED_FORMATS:
+            return 1
+        return img.n_frames
+
+
+def render_frame_range(processor: ImageProcessor, source: bytes, start: int, stop: int,
+                       params: RenderParams = RenderParams()) -> List[Tuple[bytes, int]]:
+    """
+    渲染連續的幀（模組層級函式，可傳給 worker 程序）
+    
+    GIF 等格式只能從頭依序解碼，每個 worker 處理一段連續的幀，避免重複 seek
+    
+    Args:
+        processor: 目標尺寸的處理器
+        source: 圖片檔案內容
+        start: 起始幀
+        stop: 結束幀（不含）
+        params: 渲染參數
+    
+    Returns:
+        [(打包後的畫面, 時間 ms), ...]
+    """
+    frames = []
+    with Image.open(io.BytesIO(source)) as img:
+        for index in range(start, stop):
+            img.seek(index)
+            duration = img.info.get('duration') or DEFAULT_FRAME_DURATION
+            # 合成後的完整畫面（GIF 的 disposal 由 Pillow 處理），透明處以白色為底
+            frame = Image.new('RGBA', img.size, 'white')
+            frame.alpha_composite(img.convert('RGBA'))
+            frames.append((processor.render_packed(frame.convert('RGB'), params), int(duration)))
+    return frames
+
+
+def split_ranges(count: int, parts: int) -> List[Tuple[int, int]]:
+    """
+    將 count 幀平均分成 parts 段連續範圍
+    
+    Args:
+        count: 幀數
+        parts: 段數
+    
+    Returns:
+        [(start, stop), ...]
+    """
+    parts = max(1, min(parts, count))
+    bounds = [count * i // parts for i in range(parts + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(parts)]
+
+
+def encode_animation(frames: List[bytes], durations: List[int], width: int, height: int,
+                     merge_overhead: int = 64) -> Animation:
+    """
+    預先編碼動畫封包（模組層級函式，可傳給 worker 程序）
+    
+    packets[i] 只在設備正顯示第 i - 1 幀時有效（第 0 幀對應最後一幀，供循環播放）；
+    差分比完整畫面大時改用完整畫面。封包序號為 0，播放時以 Protocol.with_seq_id() 改寫
+    
+    Args:
+        frames: 打包後的各幀
+        durations: 各幀時間 (ms)
+        width: 畫面寬度
+        height: 畫面高度
+        merge_overhead: 區域合併門檻（見 DirtyRectDetector）
+    
+    Returns:
+        Animation
+    """
+    detector = DirtyRectDetector(width, height, merge_overhead)
+    
+    def delta_packet(previous: bytes, current: bytes) -> Optional[bytes]:
+        regions = detector.regions(previous, current)
+        if not regions:
+            return None
+        if DirtyRectDetector.payload_size(regions) >= len(current):
+            return Protocol.pack_full_frame(0, current)
+        return Protocol.pack_delta(0, regions)
+    
+    packets = tuple(delta_packet(frames[i - 1], frames[i]) for i in range(len(frames)))
+    return Animation(tuple(frames), tuple(frame_digest(frame) for frame in frames), tuple(durations), packets)
+
+
+if __name__ == "__main__":
+    # 測試程式：以測試圖片合成移動方塊的 GIF
+    import time
+    
+    print("=== 動畫測試 ===")
+    
+    base = Image.open("CAT_800.png").convert('L').resize((400, 240))
+    gif_frames = []
+    for i in range(12):
+        frame = base.copy()
+        frame.paste(0, (20 + i * 25, 100, 60 + i * 25, 140))
+        gif_frames.append(frame)
+    buffer = io.BytesIO()
+    gif_frames[0].save(buffer, format='GIF', save_all=True, append_images=gif_frames[1:], duration=200, loop=0)
+    source = buffer.getvalue()
+    
+    processor = ImageProcessor(400, 240, dither_mode='bayer8')
+    count = frame_count(source)
+    start = time.perf_counter()
+    rendered = render_frame_range(processor, source, 0, count)
+    render_ms = (time.perf_counter() - start) * 1000
+    
+    start = time.perf_counter()
+    animation = encode_animation([frame for frame, _ in rendered], [duration for _, duration in rendered],
+                                 processor.width, processor.height)
+    encode_ms = (time.perf_counter() - start) * 1000
+    
+    print(f"{count} 幀: 渲染 {render_ms:.1f} ms, 編碼 {encode_ms:.1f} ms")
+    print(f"每輪差分傳輸: {animation.payload_bytes()} bytes "
+          f"(完整畫面需 {count * processor.total_bytes} bytes)")
+    
+    print("\n測試完成！")
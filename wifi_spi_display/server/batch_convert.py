@@ -0,0 +1,261 @@
+"""
+批次轉換工具
+將整個資料夾的圖片預先轉換為打包好的 1-bit 畫面 (.bin)，
+伺服器發送時直接讀取，不需在請求時解碼、縮放或抖動
+（編碼與連線模式和上一幀有關，仍在發送時進行，有 payload 快取）
+
+- 以 process pool 分散到所有 CPU 核心
+- 來源的 mtime / 大小未變時直接跳過；變了但內容雜湊相同時只更新紀錄
+- 結果記錄在輸出資料夾的 manifest.json
+
+使用方式:
+    python batch_convert.py test_images_800x480
+    python batch_convert.py photos -o photos_packed -j 4 --dither atkinson
+    python batch_convert.py photos --force          # 全部重新轉換
+"""
+
+import argparse
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from frame_cache import frame_digest
+from image_processor import ImageProcessor
+import config_rpi as config
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 2
+
+# 打包畫面的副檔名（接在來源檔名之後，例如 cat.png.bin）
+PACKED_SUFFIX = ".bin"
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp'}
+
+
+def find_images(input_dir: Path) -> List[Path]:
+    """
+    列出資料夾（含子資料夾）中的圖片
+    
+    Args:
+        input_dir: 來源資料夾
+    
+    Returns:
+        相對於 input_dir 的路徑（已排序）
+    """
+    return sorted(path.relative_to(input_dir) for path in input_dir.rglob('*')
+                  if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def render_settings(processor: ImageProcessor) -> dict:
+    """
+    影響輸出結果的設定（與 manifest 中的不同時全部重新轉換）
+    
+    Args:
+        processor: 目標尺寸的處理器
+    
+    Returns:
+        設定字典
+    """
+    return {
+        'width': processor.width,
+        'height': processor.height,
+        'dither_mode': processor.dither_mode,
+        'resample': int(processor.resample),
+        'max_intermediate_size': processor.max_intermediate_size,
+    }
+
+
+def load_manifest(output_dir: Path) -> dict:
+    """
+    讀取 manifest（不存在或版本不符時回傳空的 manifest）
+    
+    Args:
+        output_dir: 輸出資料夾
+    
+    Returns:
+        manifest 字典
+    """
+    try:
+        with open(output_dir / MANIFEST_NAME, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'settings': None, 'frames': {}}
+
+
+def save_manifest(output_dir: Path, manifest: dict):
+    """
+    寫入 manifest（先寫暫存檔再取代，中斷時不會留下損壞的 manifest）
+    
+    Args:
+        output_dir: 輸出資料夾
+        manifest: manifest 字典
+    """
+    temp_path = output_dir / (MANIFEST_NAME + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(temp_path, output_dir / MANIFEST_NAME)
+
+
+def _write_atomic(path: Path, data: bytes):
+    """先寫暫存檔再取代"""
+    temp_path = path.with_name(path.name + '.tmp')
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def convert_image(processor: ImageProcessor, source_path: str, output_path: str) -> dict:
+    """
+    轉換單張圖片（模組層級函式，在 worker 程序中執行）
+    
+    Args:
+        processor: 目標尺寸的處理器
+        source_path: 來源圖片路徑
+        output_path: 輸出路徑前綴（加上 PACKED_SUFFIX）
+    
+    Returns:
+        manifest 紀錄
+    """
+    start = time.perf_counter()
+    with open(source_path, 'rb') as f:
+        source = f.read()
+    stat = os.stat(source_path)
+    
+    frame = processor.render_packed(Image.open(io.BytesIO(source)))
+    
+    output = Path(output_path)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    _write_atomic(output.with_name(output.name + PACKED_SUFFIX), frame)
+    
+    return {
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'source_hash': frame_digest(source).hex(),
+        'frame_hash': frame_digest(frame).hex(),
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+def _output_exists(output_dir: Path, name: str) -> bool:
+    """輸出檔案是否還在"""
+    return (output_dir / (name + PACKED_SUFFIX)).exists()
+
+
+def batch_convert(input_dir: str, output_dir: str, processor: ImageProcessor,
+                  workers: Optional[int] = None, force: bool = False, log=print) -> Dict[str, int]:
+    """
+    批次轉換資料夾
+    
+    Args:
+        input_dir: 來源資料夾
+        output_dir: 輸出資料夾（輸出檔案保留來源的相對路徑）
+        processor: 目標尺寸的處理器
+        workers: worker 程序數（None 則為 CPU 核心數）
+        force: 忽略 manifest，全部重新轉換
+        log: 輸出訊息的函式
+    
+    Returns:
+        統計 {'converted', 'unchanged', 'rehashed', 'removed', 'failed'}
+    """
+    input_path, output_path = Path(input_dir), Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    
+    manifest = load_manifest(output_path)
+    settings = render_settings(processor)
+    if force or manifest['settings'] != settings:
+        manifest = {'version': MANIFEST_VERSION, 'settings': settings, 'frames': {}}
+    old_frames = manifest['frames']
+    
+    stats = dict.fromkeys(('converted', 'unchanged', 'rehashed', 'removed', 'failed'), 0)
+    frames = {}
+    pending = []
+    
+    for relative in find_images(input_path):
+        name = relative.as_posix()
+        source = input_path / relative
+        record = old_frames.get(name)
+        
+        if record is not None and _output_exists(output_path, name):
+            stat = source.stat()
+            if (stat.st_mtime_ns, stat.st_size) == (record['mtime_ns'], record['size']):
+                frames[name] = record
+                stats['unchanged'] += 1
+                continue
+            
+            # mtime 變了（例如重新複製），內容相同則不需重新轉換
+            with open(source, 'rb') as f:
+                if frame_digest(f.read()).hex() == record['source_hash']:
+                    frames[name] = dict(record, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                    stats['rehashed'] += 1
+                    continue
+        
+        pending.append(name)
+    
+    # 來源已刪除的項目：移除輸出檔案
+    for name in old_frames.keys() - frames.keys() - set(pending):
+        (output_path / (name + PACKED_SUFFIX)).unlink(missing_ok=True)
+        stats['removed'] += 1
+    
+    if pending:
+        workers = workers or os.cpu_count() or 1
+        log(f"轉換 {len(pending)} 張圖片 ({workers} 個 worker)...")
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+            futures = {name: executor.submit(convert_image, processor,
+                                             str(input_path / name), str(output_path / name))
+                       for name in pending}
+            for name, future in futures.items():
+                try:
+                    frames[name] = future.result()
+                    record = frames[name]
+                    log(f"  ✓ {name} ({record['elapsed_ms']:.0f} ms)")
+                    stats['converted'] += 1
+                except Exception as e:
+                    # 來源已變更：舊的輸出不再對應來源，一併刪除（下次執行時重新轉換）
+                    (output_path / (name + PACKED_SUFFIX)).unlink(missing_ok=True)
+                    log(f"  ✗ {name}: {e}")
+                    stats['failed'] += 1
+    
+    manifest['frames'] = frames
+    save_manifest(output_path, manifest)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批次將圖片轉換為打包的 1-bit 畫面")
+    parser.add_argument('input', help="來源資料夾")
+    parser.add_argument('-o', '--output', help="輸出資料夾（預設為 <來源>_packed）")
+    parser.add_argument('-j', '--workers', type=int, help="worker 程序數（預設為 CPU 核心數）")
+    parser.add_argument('--size', default=f"{config.FULLSCREEN_WIDTH}x{config.FULLSCREEN_HEIGHT}",
+                        help="目標尺寸（預設 800x480）")
+    parser.add_argument('--dither', default=config.DITHER_MODE, choices=ImageProcessor.DITHER_MODES,
+                        help="抖動演算法")
+    parser.add_argument('--resample', default=config.RESIZE_ALGORITHM,
+                        choices=list(ImageProcessor.RESAMPLE_FILTERS), help="縮放演算法")
+    parser.add_argument('--force', action='store_true', help="忽略 manifest，全部重新轉換")
+    args = parser.parse_args()
+    
+    width, height = (int(value) for value in args.size.lower().split('x'))
+    processor = ImageProcessor(width, height, dither_mode=args.dither, resample=args.resample,
+                               max_intermediate_size=config.MAX_INTERMEDIATE_SIZE)
+    output = args.output or args.input.rstrip('/\\') + "_packed"
+    
+    start = time.perf_counter()
+    stats = batch_convert(args.input, output, processor, args.workers, args.force)
+    elapsed = time.perf_counter() - start
+    
+    print(f"\n完成 ({elapsed:.1f} 秒): 轉換 {stats['converted']}, 未變更 {stats['unchanged']}, "
+          f"內容相同 {stats['rehashed']}, 移除 {stats['removed']}, 失敗 {stats['failed']}")
+    print(f"輸出: {output}/{MANIFEST_NAME}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+"""
+影像管線效能測試工具
+
+量測圖片轉換各階段的耗時，用於比較不同演算法在目標主機（如 RPi 1）上的成本
+
+使用方式:
+    python benchmark_pipeline.py              # 執行全部測試
+    python benchmark_pipeline.py dither       # 只測試抖動演算法
+    python benchmark_pipeline.py dither -i CAT_800.png -n 5
+    python benchmark_pipeline.py resize --photo IMG_1234.jpg
+    python benchmark_pipeline.py bilevel      # 黑白來源快速路徑
+"""
+
+import argparse
+import io
+import multiprocessing
+import time
+from functools import partial
+from typing import Callable, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from image_processor import ImageProcessor, RenderParams, fit_text, load_font, text_width
+from compressor import CodecRegistry, CodecSelector
+from protocol import Protocol
+from render_pool import render_source, render_source_info
+from static_frames import default_static_frames
+
+DEFAULT_IMAGE = "CAT_800.png"
+
+# 未指定 --photo 時合成的手機照片尺寸（12MP）
+PHOTO_SIZE = (4032, 3024)
+
+
+def measure(func: Callable, repeat: int = 3) -> Tuple[float, object]:
+    """
+    重複執行並取最短耗時
+    
+    Args:
+        func: 要量測的函式（無參數）
+        repeat: 重複次數
+    
+    Returns:
+        (最短耗時 ms, 最後一次的回傳值)
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def bench_dither(image: Image.Image, repeat: int):
+    """比較各抖動演算法（輸入已縮放的灰階圖）"""
+    print("\n【抖動演算法】800x480 灰階 → 1-bit")
+    print("-" * 60)
+    
+    processor = ImageProcessor(800, 480)
+    gray = image.resize((800, 480), Image.Resampling.LANCZOS).convert('L')
+    mean = np.asarray(gray).mean() / 255
+    
+    baseline = None
+    for mode in ImageProcessor.DITHER_MODES:
+        ms, result = measure(lambda: processor.dither(gray, mode), repeat)
+        if baseline is None:
+            baseline = ms
+        white = np.asarray(result).mean()
+        print(f"  {mode:16s} {ms:8.1f} ms  ({ms / baseline:5.2f}x)  "
+              f"亮度誤差: {abs(white - mean) * 100:.2f}%")
+
+
+def synthetic_photo(image: Image.Image) -> bytes:
+    """
+    以測試圖片放大並加入雜訊，合成 12MP JPEG（模擬手機照片）
+    
+    Args:
+        image: 測試圖片
+    
+    Returns:
+        JPEG 檔案內容
+    """
+    base = image.convert('RGB').resize(PHOTO_SIZE, Image.Resampling.BILINEAR)
+    noise = np.random.default_rng(0).integers(-24, 24, (PHOTO_SIZE[1], PHOTO_SIZE[0], 1), dtype=np.int16)
+    pixels = np.clip(np.asarray(base, dtype=np.int16) + noise, 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def _read_status_kb(field: str) -> int:
+    """讀取 /proc/self/status 的記憶體欄位 (KB)"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def _peak_rss_worker(func: Callable, queue):
+    """子程序: 回報執行 func 期間的峰值 RSS 增量 (KB)"""
+    # 重設峰值 (VmHWM)，只計算 func 本身
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    before = _read_status_kb('VmRSS')
+    func()
+    queue.put(_read_status_kb('VmHWM') - before)
+
+
+def peak_memory_kb(func: Callable) -> int:
+    """
+    在全新的子程序中量測峰值記憶體增量（包含 PIL 在 C 層的配置，需 Linux /proc）
+    
+    使用 spawn 而非 fork，避免子程序沿用父程序已釋放的記憶體；
+    峰值取 VmHWM（ru_maxrss 會跨 exec 保留父程序的峰值）
+    
+    Args:
+        func: 要量測的函式（無參數，需可 pickle，例如模組層級函式的 functools.partial）
+    
+    Returns:
+        峰值 RSS 增量 (KB)
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_peak_rss_worker, args=(func, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def legacy_resize(photo: bytes) -> Image.Image:
+    """原本的縮放流程：全解析度 LANCZOS → 灰階"""
+    img = Image.open(io.BytesIO(photo))
+    return img.resize((800, 480), Image.Resampling.LANCZOS).convert('L')
+
+
+def fast_resize(processor: ImageProcessor, photo: bytes) -> Image.Image:
+    """draft + reduce + 最終濾波器"""
+    return processor.resize_to_target(Image.open(io.BytesIO(photo)))
+
+
+def legacy_render(image: Image.Image, mode: str) -> bytes:
+    """原本的渲染流程：LANCZOS → L → '1' → uint8 陣列 → bool → packbits"""
+    gray = image.resize((800, 480), Image.Resampling.LANCZOS).convert('L')
+    pixels = np.array(ImageProcessor(800, 480).dither(gray, mode), dtype=np.uint8)
+    return np.packbits((pixels > 0).astype(np.uint8), axis=1).tobytes()
+
+
+def bench_resize(image: Image.Image, repeat: int, photo: bytes = None):
+    """比較原本的全解析度 LANCZOS 與 draft + reduce 快速縮放"""
+    if photo is None:
+        photo = synthetic_photo(image)
+    source = Image.open(io.BytesIO(photo))
+    print(f"\n【縮放】{source.size[0]}x{source.size[1]} JPEG ({len(photo) / 1024:.0f} KB) → 800x480 灰階")
+    print("-" * 60)
+    
+    variants = [('原始 (LANCZOS 全解析度)', partial(legacy_resize, photo))]
+    for resample in ('LANCZOS', 'BILINEAR', 'NEAREST'):
+        processor = ImageProcessor(800, 480, resample=resample, max_intermediate_size=2000)
+        variants.append((f"draft+reduce+{resample}", partial(fast_resize, processor, photo)))
+    
+    reference = np.asarray(legacy_resize(photo), dtype=np.float32)
+    for name, func in variants:
+        ms, result = measure(func, repeat)
+        peak = peak_memory_kb(func)
+        diff = np.abs(np.asarray(result, dtype=np.float32) - reference).mean()
+        print(f"  {name:26s} {ms:8.1f} ms  峰值 {peak / 1024:6.1f} MB  平均差異 {diff:5.2f}")
+
+
+def bench_render(image: Image.Image, repeat: int):
+    """比較 convert_to_1bit + image_to_bytes 舊流程與 render_packed"""
+    print("\n【渲染】圖片 → 48000 bytes 打包資料")
+    print("-" * 60)
+    
+    processor = ImageProcessor(800, 480)
+    
+    for mode in ('floyd-steinberg', 'bayer8', 'none'):
+        legacy = partial(legacy_render, image, mode)
+        fused = partial(processor.render_packed, image, RenderParams(dither_mode=mode))
+        legacy_ms, _ = measure(legacy, repeat)
+        fused_ms, _ = measure(fused, repeat)
+        print(f"  {mode:16s} 舊流程 {legacy_ms:6.1f} ms / {peak_memory_kb(legacy):5d} KB"
+              f"  render_packed {fused_ms:6.1f} ms / {peak_memory_kb(fused):5d} KB")
+
+
+def bench_strips(image: Image.Image, repeat: int):
+    """比較整張渲染與條帶渲染（STRIP_RENDERING）的峰值記憶體與耗時"""
+    print("\n【條帶串流】render_packed 整張 vs 30 列條帶")
+    print("-" * 60)
+    
+    # 非 JPEG 的大圖無法以 draft 縮小，最能看出條帶處理的差異
+    buffer = io.BytesIO()
+    image.convert('RGB').resize(PHOTO_SIZE, Image.Resampling.BILINEAR).save(buffer, format='PNG')
+    png = buffer.getvalue()
+    
+    full = ImageProcessor(800, 480, resample='BILINEAR', max_intermediate_size=2000)
+    strips = ImageProcessor(800, 480, resample='BILINEAR', max_intermediate_size=2000, strip_height=30)
+    
+    for mode in ('bayer8', 'none', 'floyd-steinberg', 'atkinson'):
+        params = RenderParams(dither_mode=mode)
+        row = [f"  {mode:16s}"]
+        for name, processor in (('整張', full), ('條帶', strips)):
+            render = partial(render_source, processor, png, params)
+            ms, _ = measure(render, repeat)
+            row.append(f"{name} {ms:7.1f} ms / {peak_memory_kb(render) / 1024:5.1f} MB")
+        print("  ".join(row))
+    print(f"  (來源: {PHOTO_SIZE[0]}x{PHOTO_SIZE[1]} PNG，解碼後 RGB 約 "
+          f"{PHOTO_SIZE[0] * PHOTO_SIZE[1] * 3 / 1024 / 1024:.0f} MB 兩者皆需)")
+
+
+def legacy_text_image(text: str, font_size: int = 48) -> Image.Image:
+    """原本的 create_text_image：每次先嘗試 Windows 字體、再從磁碟載入字體"""
+    img = Image.new('1', (400, 240), 1)
+    draw = ImageDraw.Draw(img)
+    try:
+        font = ImageFont.truetype("c:/windows/fonts/msjh.ttc", font_size)
+    except OSError:
+        try:
+            font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", font_size)
+        except OSError:
+            font = ImageFont.load_default()
+    bbox = draw.textbbox((0, 0), text, font=font)
+    draw.text(((400 - bbox[2] + bbox[0]) // 2, (240 - bbox[3] + bbox[1]) // 2), text, font=font, fill=0)
+    return img
+
+
+def bench_text(image: Image.Image, repeat: int):
+    """比較每次載入字體與字體 / 字形尺寸快取"""
+    print("\n【文字】create_text_image 100 幀（時鐘 / 跑馬燈情境）")
+    print("-" * 60)
+    
+    processor = ImageProcessor(400, 240)
+    frames = [f"12:{minute:02d}" for minute in range(100)]
+    
+    legacy_ms, _ = measure(lambda: [legacy_text_image(text) for text in frames], repeat)
+    cached_ms, _ = measure(lambda: [processor.create_text_image(text) for text in frames], repeat)
+    print(f"  每次載入字體   {legacy_ms / len(frames):6.3f} ms/幀")
+    print(f"  字體快取       {cached_ms / len(frames):6.3f} ms/幀  ({legacy_ms / cached_ms:.1f}x)")
+
+
+def bench_layout(image: Image.Image, repeat: int):
+    """比較無快取與有快取的自動排版（二分搜尋字體大小）"""
+    print("\n【自動排版】800x480 文字自動換行 + 最大字體")
+    print("-" * 60)
+    
+    texts = ["12:00", "溫度 23.5°C\n濕度 60%", "The quick brown fox jumps over the lazy dog. " * 4]
+    
+    def cold():
+        for text in texts:
+            fit_text.cache_clear()
+            text_width.cache_clear()
+            fit_text(text, 784, 464, None, 480, 12)
+    
+    def warm_words():
+        for text in texts:
+            fit_text.cache_clear()
+            fit_text(text, 784, 464, None, 480, 12)
+    
+    cold_ms, _ = measure(cold, repeat)
+    warm_ms, _ = measure(warm_words, repeat)
+    cached_ms, _ = measure(lambda: [fit_text(text, 784, 464, None, 480, 12) for text in texts], repeat)
+    print(f"  無快取         {cold_ms / len(texts):7.3f} ms/則")
+    print(f"  單字寬度快取   {warm_ms / len(texts):7.3f} ms/則  ({cold_ms / warm_ms:.1f}x)")
+    print(f"  排版結果快取   {cached_ms / len(texts):7.3f} ms/則  ({cold_ms / cached_ms:.0f}x)")
+
+
+def bench_static(image: Image.Image, repeat: int):
+    """比較每次重畫測試圖案與預先渲染的固定畫面"""
+    print("\n【固定畫面】測試圖案 → 封包")
+    print("-" * 60)
+    
+    selector = CodecSelector(CodecRegistry.default(), ['raw', 'rle'])
+    
+    def encode(data: bytes) -> bytes:
+        _, payload = selector.encode(data, None, 50)
+        return Protocol.pack_full_frame(0, payload)
+    
+    processor = ImageProcessor(400, 240)
+    static = default_static_frames(processor, ImageProcessor(800, 480))
+    
+    legacy_ms, _ = measure(lambda: encode(processor.image_to_bytes(processor.create_test_pattern())), repeat)
+    build_ms, _ = measure(lambda: static.prebuild(), 1)
+    static_ms, _ = measure(lambda: Protocol.with_seq_id(static.packet("test_400x240", lambda frame: encode(frame.data)), 1), repeat)
+    print(f"  每次重畫 + 編碼   {legacy_ms:8.3f} ms")
+    print(f"  預先渲染全部畫面  {build_ms:8.3f} ms（啟動時一次）")
+    print(f"  固定畫面封包      {static_ms:8.3f} ms  ({legacy_ms / static_ms:.0f}x)")
+
+
+def bench_bands(image: Image.Image, repeat: int):
+    """比較 PIL 裁切 + 逐條帶轉換與打包畫面的 memoryview 切割"""
+    print("\n【條帶切割】800x480 1-bit 畫面 → 3 個 800x160 條帶")
+    print("-" * 60)
+    
+    processor = ImageProcessor(800, 480)
+    processed = processor.convert_to_1bit(image)
+    frame = processor.image_to_bytes(processed)
+    
+    def legacy():
+        tiles = processor.split_image_to_tiles(processed)
+        return [processor.process_tile(tiles[index], dither=False) for index in range(3)]
+    
+    legacy_ms, _ = measure(legacy, repeat)
+    sliced_ms, _ = measure(lambda: list(processor.iter_bands(frame)), repeat)
+    print(f"  crop + process_tile  {legacy_ms:8.3f} ms")
+    print(f"  iter_bands           {sliced_ms:8.3f} ms  ({legacy_ms / sliced_ms:.0f}x)")
+
+
+def synthetic_screenshot() -> bytes:
+    """
+    合成 1920x1080 文字截圖（反鋸齒字形）
+    
+    Returns:
+        PNG 檔案內容
+    """
+    img = Image.new('RGB', (1920, 1080), 'white')
+    draw = ImageDraw.Draw(img)
+    font = load_font(None, 28)
+    for row in range(30):
+        draw.text((40, 20 + row * 35), f"{row:02d}  The quick brown fox jumps over the lazy dog. 0123456789",
+                  font=font, fill='black')
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def synthetic_qr() -> bytes:
+    """
+    合成 QR code 樣式的黑白方格（33x33 模組，每模組 20 像素）
+    
+    Returns:
+        PNG 檔案內容
+    """
+    modules = np.random.default_rng(0).random((33, 33)) < 0.5
+    img = Image.fromarray(np.where(modules, 0, 255).astype(np.uint8)).resize((660, 660), Image.Resampling.NEAREST)
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def bench_bilevel(image: Image.Image, repeat: int):
+    """比較黑白來源走縮放 + 抖動與偵測後的最近鄰 + 二值化快速路徑"""
+    print("\n【黑白來源】檔案 → 800x480 打包資料 (LANCZOS + floyd-steinberg vs 快速路徑)")
+    print("-" * 60)
+    
+    processor = ImageProcessor(800, 480, dither_mode='floyd-steinberg', resample='LANCZOS')
+    # 照片以放射漸層合成（連續色調），量測偵測本身的額外成本
+    sources = (('文字截圖', synthetic_screenshot()), ('QR code', synthetic_qr()),
+               ('漸層照片', synthetic_photo(Image.radial_gradient('L'))))
+    
+    for name, source in sources:
+        dithered_ms, _ = measure(partial(render_source_info, processor, source, RenderParams()), repeat)
+        detect_ms, (_, path) = measure(partial(render_source_info, processor, source,
+                                               RenderParams(detect_bilevel=True)), repeat)
+        print(f"  {name:8s} 抖動 {dithered_ms:7.1f} ms  偵測 {detect_ms:7.1f} ms → {path:16s}"
+              f"  節省 {dithered_ms - detect_ms:6.1f} ms")
+
+
+def bench_upload(image: Image.Image, repeat: int, photo: bytes = None):
+    """比較瀏覽器裁切並重新編碼 PNG 與伺服器端裁切（單次解碼）"""
+    print("\n【上傳裁切】12MP JPEG 裁切中央 → 800x480")
+    print("-" * 60)
+    
+    photo = photo or synthetic_photo(image)
+    processor = ImageProcessor(800, 480, resample='BILINEAR', max_intermediate_size=2000)
+    width, height = Image.open(io.BytesIO(photo)).size
+    crop = (width // 4, height // 4, width // 2, height // 2)
+    
+    def browser_flow():
+        # 舊流程：瀏覽器解碼 → canvas 裁切縮放 → 編碼 PNG；伺服器再解碼 PNG
+        img = Image.open(io.BytesIO(photo)).convert('RGB')
+        img = img.resize((800, 480), Image.Resampling.BILINEAR,
+                         box=(crop[0], crop[1], crop[0] + crop[2], crop[1] + crop[3]))
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG')
+        return render_source(processor, buffer.getvalue()), len(buffer.getvalue())
+    
+    server_flow = partial(render_source, processor, photo, RenderParams(crop=crop, fit='contain'))
+    browser_ms, (_, png_size) = measure(browser_flow, repeat)
+    server_ms, _ = measure(server_flow, repeat)
+    print(f"  瀏覽器裁切 + PNG   {browser_ms:7.1f} ms  (上傳 {png_size / 1024:.0f} KB PNG)")
+    print(f"  伺服器端裁切       {server_ms:7.1f} ms  (上傳 {len(photo) / 1024:.0f} KB 原始檔案, "
+          f"{browser_ms / server_ms:.1f}x)")
+
+
+BENCHMARKS = {
+    'dither': bench_dither,
+    'resize': bench_resize,
+    'render': bench_render,
+    'strips': bench_strips,
+    'text': bench_text,
+    'layout': bench_layout,
+    'static': bench_static,
+    'bands': bench_bands,
+    'bilevel': bench_bilevel,
+    'upload': bench_upload,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="影像管線效能測試")
+    parser.add_argument('tests', nargs='*',
+                        help=f"要執行的測試（{' / '.join(BENCHMARKS)}，預設全部）")
+    parser.add_argument('-i', '--image', default=DEFAULT_IMAGE, help="測試圖片")
+    parser.add_argument('-n', '--repeat', type=int, default=3, help="重複次數（取最短）")
+    parser.add_argument('--photo', help="縮放 / 上傳測試用的大型 JPEG（預設以測試圖片合成 12MP）")
+    args = parser.parse_args()
+    
+    unknown = [name for name in args.tests if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的測試: {', '.join(unknown)}")
+    
+    image = Image.open(args.image)
+    image.load()
+    print("=" * 60)
+    print(f"測試圖片: {args.image} {image.size} {image.mode}")
+    print("=" * 60)
+    
+    photo = None
+    if args.photo:
+        with open(args.photo, 'rb') as f:
+            photo = f.read()
+    
+    for name in args.tests or BENCHMARKS:
+        if name in ('resize', 'upload'):
+            BENCHMARKS[name](image, args.repeat, photo)
+        else:
+            BENCHMARKS[name](image, args.repeat)
+    
+    print("\n測試完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 """
 壓縮模組
 實作 RLE (Run-Length Encoding) 壓縮和 Delta 編碼
+以及編碼器註冊表與逐幀自動選擇
 """
 
-from typing import List, Tuple, Optional
+import time
+from typing import Iterator, List, Tuple, Optional
 import numpy as np
 
 
@@ -13,12 +15,175 @@ class RLECompressor:
     @staticmethod
     def compress(data: bytes) -> bytes:
         """
-        RLE 壓縮
+        RLE 壓縮（NumPy 向量化）
         
         格式: [count, value, count, value, ...]
         count: 重複次數 (1-255)
         value: byte 值 (0-255)
         
+        以 NumPy 一次找出所有 run 邊界，超過 255 的 run 切成多段，
+        輸出與逐 byte 版本 (_compress_python) 完全相同，rle_decoder.h 可直接解碼
+        
+        Args:
+            data: 原始資料
+            
+        Returns:
+            壓縮後的資料
+        """
+        if not data:
+            return b''
+        
+        counts, values = RLECompressor._run_pairs(np.frombuffer(data, dtype=np.uint8))
+        
+        compressed = np.empty(counts.size * 2, dtype=np.uint8)
+        compressed[0::2] = counts
+        compressed[1::2] = values
+        
+        return compressed.tobytes()
+    
+    @staticmethod
+    def _runs(arr: np.ndarray, align: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        找出所有 run 的起點與長度
+        
+        Args:
+            arr: uint8 陣列（不可為空）
+            align: > 0 時 run 在每 align bytes 處強制切開（例如每列開頭）
+            
+        Returns:
+            (starts, lengths) tuple
+        """
+        # run 起點：第 0 個 byte + 所有與前一個 byte 不同的位置
+        starts = np.flatnonzero(arr[1:] != arr[:-1]) + 1
+        if align > 0:
+            starts = np.union1d(starts, np.arange(align, arr.size, align))
+        starts = np.concatenate(([0], starts))
+        lengths = np.diff(np.append(starts, arr.size))
+        return starts, lengths
+    
+    @staticmethod
+    def estimate_size(data: bytes) -> int:
+        """
+        計算 RLE 壓縮後的精確大小（不建立輸出）
+        
+        Args:
+            data: 原始資料
+            
+        Returns:
+            compress(data) 的 byte 數
+        """
+        if not data:
+            return 0
+        return RLECompressor._estimate_array(np.frombuffer(data, dtype=np.uint8))
+    
+    @staticmethod
+    def _estimate_array(arr: np.ndarray) -> int:
+        """
+        計算 uint8 陣列 RLE 壓縮後的精確大小
+        
+        每個 run 切成 ceil(len / 255) 組，每組 2 bytes
+        
+        Args:
+            arr: uint8 陣列（不可為空）
+            
+        Returns:
+            byte 數
+        """
+        _, lengths = RLECompressor._runs(arr)
+        return int(((lengths + 254) // 255).sum()) * 2
+    
+    @staticmethod
+    def _run_pairs(arr: np.ndarray, max_count: int = 255,
+                   align: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        找出所有 run 並切成 [count, value] 組
+        
+        Args:
+            arr: uint8 陣列（不可為空）
+            max_count: 單組最大重複次數（1-255）
+            align: > 0 時 run 在每 align bytes 處強制切開
+            
+        Returns:
+            (counts, values) tuple，皆為 uint8 陣列
+        """
+        starts, lengths = RLECompressor._runs(arr, align)
+        values = arr[starts]
+        
+        # 每個 run 需要的組數（長度 > max_count 時切段）
+        pieces = (lengths + max_count - 1) // max_count
+        total = int(pieces.sum())
+        
+        # 前面的段都是 max_count，最後一段放餘數
+        counts = np.full(total, max_count, dtype=np.uint8)
+        last = np.cumsum(pieces) - 1
+        counts[last] = lengths - max_count * (pieces - 1)
+        
+        return counts, np.repeat(values, pieces)
+    
+    @staticmethod
+    def iter_chunks(data: bytes, max_chunk_size: int,
+                    max_decoded_size: Optional[int] = None,
+                    align: int = 1) -> Iterator[Tuple[int, bytes]]:
+        """
+        分塊 RLE 壓縮（generator）
+        
+        每個 chunk 都是獨立的 [count, value] 串列，可單獨解碼後寫到
+        offset 位置；壓縮後大小不超過 max_chunk_size，
+        解壓後大小不超過 max_decoded_size（例如 ESP8266 的固定緩衝區大小）
+        
+        Args:
+            data: 原始資料
+            max_chunk_size: 單一 chunk 壓縮後的最大 byte 數（至少 2）
+            max_decoded_size: 單一 chunk 解壓後的最大 byte 數（None 表示不限制）
+            align: chunk 邊界（offset）為 align 的倍數，例如每列 bytes，讓每個 chunk 對應整數列
+            
+        Yields:
+            (offset, chunk) tuple，offset 為此 chunk 在原始資料中的起始位置
+        """
+        if max_chunk_size < 2:
+            raise ValueError(f"max_chunk_size 至少為 2: {max_chunk_size}")
+        if max_decoded_size is not None and max_decoded_size < align:
+            raise ValueError(f"max_decoded_size 至少為 {align}: {max_decoded_size}")
+        if not data:
+            return
+        
+        max_count = 255 if max_decoded_size is None else min(255, max_decoded_size)
+        counts, values = RLECompressor._run_pairs(np.frombuffer(data, dtype=np.uint8), max_count,
+                                                  align if align > 1 else 0)
+        
+        pairs = np.empty(counts.size * 2, dtype=np.uint8)
+        pairs[0::2] = counts
+        pairs[1::2] = values
+        
+        # 每組解壓後的結束位置，用來二分搜尋 chunk 邊界
+        ends = np.cumsum(counts, dtype=np.int64)
+        max_pairs = max_chunk_size // 2
+        # 可作為 chunk 結尾的組數（解壓後結束位置對齊 align）
+        aligned = np.flatnonzero(ends % align == 0) + 1
+        
+        start = 0
+        offset = 0
+        while start < counts.size:
+            stop = min(start + max_pairs, counts.size)
+            if max_decoded_size is not None:
+                stop = min(stop, int(np.searchsorted(ends, offset + max_decoded_size, side='right')))
+            if align > 1:
+                # 沒有不超過 stop 的對齊邊界時 index 為 -1（不可當作負索引取最後一個）
+                index = int(np.searchsorted(aligned, stop, side='right')) - 1
+                if index < 0 or aligned[index] <= start:
+                    raise ValueError(f"max_chunk_size 放不下 {align} bytes 的對齊單位: {max_chunk_size}")
+                stop = int(aligned[index])
+            
+            yield offset, pairs[start * 2:stop * 2].tobytes()
+            
+            offset = int(ends[stop - 1])
+            start = stop
+    
+    @staticmethod
+    def _compress_python(data: bytes) -> bytes:
+        """
+        RLE 壓縮（逐 byte 參考實作，用於驗證向量化版本）
+        
         Args:
             data: 原始資料
             
@@ -70,10 +235,35 @@ class RLECompressor:
         else:
             return compressed, True  # 返回壓縮資料，標記為已壓縮
     
+    @staticmethod
+    def _split_pairs(data: bytes, expected_size: Optional[int] = None):
+        """
+        拆出 RLE 的 count / value 欄位並驗證長度
+        
+        Args:
+            data: 壓縮的資料
+            expected_size: 預期解壓後大小（用於驗證）
+            
+        Returns:
+            (counts, values, total) tuple
+        """
+        if len(data) % 2:
+            raise ValueError(f"RLE 資料長度必須為偶數: {len(data)}")
+        
+        pairs = np.frombuffer(data, dtype=np.uint8)
+        counts = pairs[0::2]
+        values = pairs[1::2]
+        total = int(counts.sum(dtype=np.int64))
+        
+        if expected_size is not None and total != expected_size:
+            raise ValueError(f"解壓後大小不符: 預期 {expected_size}, 實際 {total}")
+        
+        return counts, values, total
+    
     @staticmethod
     def decompress(data: bytes, expected_size: Optional[int] = None) -> bytes:
         """
-        RLE 解壓縮（用於測試）
+        RLE 解壓縮（NumPy 向量化，用於驗證與測試）
         
         Args:
             data: 壓縮的資料
@@ -81,26 +271,55 @@ class RLECompressor:
             
         Returns:
             解壓後的資料
+            
+        Raises:
+            ValueError: 資料長度為奇數或解壓後大小不符
         """
         if not data:
+            if expected_size:
+                raise ValueError(f"解壓後大小不符: 預期 {expected_size}, 實際 0")
             return b''
         
-        decompressed = []
-        i = 0
+        counts, values, _ = RLECompressor._split_pairs(data, expected_size)
+        return np.repeat(values, counts).tobytes()
+    
+    @staticmethod
+    def decompress_into(data: bytes, out, expected_size: Optional[int] = None) -> int:
+        """
+        RLE 解壓縮到呼叫端提供的緩衝區（不配置中間 list）
         
-        while i < len(data) - 1:
-            count = data[i]
-            value = data[i + 1]
-            
-            decompressed.extend([value] * count)
-            i += 2
+        先由 count 欄位算出總長度並驗證，再寫入 out，
+        大小不符時不會寫入任何資料
         
-        result = bytes(decompressed)
+        Args:
+            data: 壓縮的資料
+            out: 可寫緩衝區（bytearray / memoryview / np.ndarray）
+            expected_size: 預期解壓後大小（用於驗證）
+            
+        Returns:
+            寫入的 byte 數
+            
+        Raises:
+            ValueError: 資料長度為奇數、大小不符或緩衝區不足
+        """
+        counts, values, total = RLECompressor._split_pairs(data, expected_size)
         
-        if expected_size and len(result) != expected_size:
-            raise ValueError(f"解壓後大小不符: 預期 {expected_size}, 實際 {len(result)}")
+        target = np.frombuffer(out, dtype=np.uint8) if not isinstance(out, np.ndarray) else out
+        if total > target.size:
+            raise ValueError(f"輸出緩衝不足: 需要 {total}, 可用 {target.size}")
         
-        return result
+        # 就地展開：在每個 run 起點寫入與前一個 value 的 XOR 差值，
+        # 再以 XOR 累積還原，不需要額外的完整大小暫存陣列
+        keep = counts > 0
+        counts = counts[keep]
+        values = values[keep]
+        view = target[:total]
+        view[:] = 0
+        if values.size:
+            starts = np.cumsum(counts, dtype=np.int64) - counts
+            view[starts] = np.bitwise_xor(values, np.concatenate(([0], values[:-1])).astype(np.uint8))
+            np.bitwise_xor.accumulate(view, out=view)
+        return total
     
     @staticmethod
     def compress_ratio(original_size: int, compressed_size: int) -> float:
@@ -133,37 +352,408 @@ class RLECompressor:
             return {'status': 'empty'}
         
         # 統計連續相同 byte 的長度
-        runs = []
-        current_run = 1
-        
-        for i in range(1, len(data)):
-            if data[i] == data[i-1]:
-                current_run += 1
-            else:
-                runs.append(current_run)
-                current_run = 1
-        runs.append(current_run)
+        arr = np.frombuffer(data, dtype=np.uint8)
+        _, runs = RLECompressor._runs(arr)
+        estimated = RLECompressor._estimate_array(arr)
         
         return {
             'original_size': len(data),
-            'total_runs': len(runs),
-            'avg_run_length': np.mean(runs),
-            'max_run_length': max(runs),
-            'min_run_length': min(runs),
-            'unique_bytes': len(set(data)),
-            'estimated_compressed_size': len(runs) * 2,
-            'estimated_ratio': (1 - (len(runs) * 2) / len(data)) * 100
+            'total_runs': int(runs.size),
+            'avg_run_length': float(runs.mean()),
+            'max_run_length': int(runs.max()),
+            'min_run_length': int(runs.min()),
+            'unique_bytes': int(np.count_nonzero(np.bincount(arr, minlength=256))),
+            'estimated_compressed_size': estimated,
+            'estimated_ratio': (1 - estimated / len(data)) * 100
         }
 
 
+class PackBitsCompressor:
+    """PackBits (TIFF) 壓縮器：literal run + repeat run，適合抖動後的照片"""
+    
+    # 單一 run 最大長度
+    MAX_RUN = 128
+    # 重複次數 ≥ MIN_REPEAT 才編成 repeat run
+    MIN_REPEAT = 3
+    
+    @staticmethod
+    def _tokens(arr: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        將資料切成 PackBits token（依位置排序）
+        
+        Args:
+            arr: uint8 陣列（不可為空）
+            
+        Returns:
+            (starts, lengths, is_repeat) tuple
+        """
+        limit = PackBitsCompressor.MAX_RUN
+        run_starts, run_lengths = RLECompressor._runs(arr)
+        is_rep = run_lengths >= PackBitsCompressor.MIN_REPEAT
+        
+        # repeat run: 切成 ≤ 128 的段，餘數為 1 時改成 ... 127 + 2，保持每段 ≥ 2
+        rep_starts = run_starts[is_rep]
+        rep_lengths = run_lengths[is_rep]
+        pieces = (rep_lengths + limit - 1) // limit
+        first = np.cumsum(pieces) - pieces
+        step = np.arange(int(pieces.sum())) - np.repeat(first, pieces)
+        rep_piece_len = np.minimum(np.repeat(rep_lengths, pieces) - step * limit, limit)
+        rep_piece_start = np.repeat(rep_starts, pieces) + step * limit
+        
+        single = np.flatnonzero(rep_piece_len == 1)
+        rep_piece_len[single - 1] -= 1
+        rep_piece_len[single] += 1
+        rep_piece_start[single] -= 1
+        
+        # literal 區段：連續的短 run 合併，再切成 ≤ 128 的段
+        lit = ~is_rep
+        prev_lit = np.concatenate(([False], lit[:-1]))
+        next_lit = np.append(lit[1:], False)
+        seg_start = run_starts[lit & ~prev_lit]
+        last = np.flatnonzero(lit & ~next_lit)
+        seg_len = run_starts[last] + run_lengths[last] - seg_start
+        
+        pieces = (seg_len + limit - 1) // limit
+        first = np.cumsum(pieces) - pieces
+        step = np.arange(int(pieces.sum())) - np.repeat(first, pieces)
+        lit_piece_len = np.minimum(np.repeat(seg_len, pieces) - step * limit, limit)
+        lit_piece_start = np.repeat(seg_start, pieces) + step * limit
+        
+        starts = np.concatenate((rep_piece_start, lit_piece_start))
+        lengths = np.concatenate((rep_piece_len, lit_piece_len))
+        is_repeat = np.concatenate((np.ones(rep_piece_len.size, dtype=bool),
+                                    np.zeros(lit_piece_len.size, dtype=bool)))
+        order = np.argsort(starts, kind='stable')
+        
+        return starts[order], lengths[order], is_repeat[order]
+    
+    @staticmethod
+    def compress(data: bytes) -> bytes:
+        """
+        PackBits 壓縮（NumPy 向量化）
+        
+        格式: [header, ...]
+        header 0..127:    後面接 header + 1 個 literal bytes
+        header 129..255:  下一個 byte 重複 257 - header 次 (2-128)
+        最差情況每 128 bytes 多 1 byte（約 0.8%）
+        
+        Args:
+            data: 原始資料
+            
+        Returns:
+            壓縮後的資料
+        """
+        if not data:
+            return b''
+        
+        arr = np.frombuffer(data, dtype=np.uint8)
+        starts, lengths, is_repeat = PackBitsCompressor._tokens(arr)
+        
+        # 每個 token 的輸出大小與位置
+        cost = np.where(is_repeat, 2, lengths + 1)
+        out_pos = np.cumsum(cost) - cost
+        out = np.empty(int(cost.sum()), dtype=np.uint8)
+        
+        out[out_pos] = np.where(is_repeat, 257 - lengths, lengths - 1).astype(np.uint8)
+        out[out_pos[is_repeat] + 1] = arr[starts[is_repeat]]
+        
+        # literal 資料整段複製
+        lit_starts = starts[~is_repeat]
+        lit_lengths = lengths[~is_repeat]
+        lit_pos = out_pos[~is_repeat] + 1
+        offset = np.repeat(lit_pos - lit_starts, lit_lengths)
+        src = np.repeat(lit_starts - (np.cumsum(lit_lengths) - lit_lengths), lit_lengths) \
+            + np.arange(int(lit_lengths.sum()))
+        out[src + offset] = arr[src]
+        
+        return out.tobytes()
+    
+    @staticmethod
+    def estimate_size(data: bytes) -> int:
+        """
+        計算 PackBits 壓縮後的精確大小（不建立輸出）
+        
+        Args:
+            data: 原始資料
+            
+        Returns:
+            compress(data) 的 byte 數
+        """
+        if not data:
+            return 0
+        _, lengths, is_repeat = PackBitsCompressor._tokens(np.frombuffer(data, dtype=np.uint8))
+        return int(np.where(is_repeat, 2, lengths + 1).sum())
+    
+    @staticmethod
+    def decompress(data: bytes, expected_size: Optional[int] = None) -> bytes:
+        """
+        PackBits 解壓縮（參考實作，對應 client 端的逐 byte 解碼）
+        
+        Args:
+            data: 壓縮的資料
+            expected_size: 預期解壓後大小（用於驗證）
+            
+        Returns:
+            解壓後的資料
+            
+        Raises:
+            ValueError: 資料不完整或解壓後大小不符
+        """
+        result = bytearray()
+        i = 0
+        
+        while i < len(data):
+            header = data[i]
+            i += 1
+            
+            if header < 128:
+                count = header + 1
+                if i + count > len(data):
+                    raise ValueError(f"literal run 不完整: 位置 {i - 1}")
+                result += data[i:i + count]
+                i += count
+            elif header > 128:
+                if i >= len(data):
+                    raise ValueError(f"repeat run 不完整: 位置 {i - 1}")
+                result += bytes([data[i]]) * (257 - header)
+                i += 1
+            # header == 128: no-op
+        
+        if expected_size is not None and len(result) != expected_size:
+            raise ValueError(f"解壓後大小不符: 預期 {expected_size}, 實際 {len(result)}")
+        
+        return bytes(result)
+
+
+class RowFilter:
+    """列預測濾波器（PNG "Up" 濾波：每列與上一列 XOR），在 RLE 之前套用"""
+    
+    FILTER_NONE = 0
+    FILTER_UP = 2   # 與 PNG 濾波類型編號一致
+    
+    # payload 標頭: filter(1B) + row_bytes(2B, 小端序)
+    HEADER_SIZE = 3
+    
+    @staticmethod
+    def apply(data: bytes, row_bytes: int = 100) -> bytes:
+        """
+        套用 Up 濾波（第 0 列不變，其餘列與上一列 XOR）
+        
+        Args:
+            data: 原始 1-bit 打包資料
+            row_bytes: 每列 byte 數（800 px = 100 bytes）
+            
+        Returns:
+            濾波後的資料
+        """
+        rows = np.frombuffer(data, dtype=np.uint8).reshape(-1, row_bytes)
+        filtered = rows.copy()
+        np.bitwise_xor(rows[1:], rows[:-1], out=filtered[1:])
+        return filtered.tobytes()
+    
+    @staticmethod
+    def reverse(data: bytes, row_bytes: int = 100) -> bytes:
+        """
+        還原 Up 濾波（沿列方向 XOR 累積）
+        
+        client 端可逐列還原：解出一列後與上一列還原結果 XOR 即可
+        
+        Args:
+            data: 濾波後的資料
+            row_bytes: 每列 byte 數
+            
+        Returns:
+            原始資料
+        """
+        rows = np.frombuffer(data, dtype=np.uint8).reshape(-1, row_bytes)
+        return np.bitwise_xor.accumulate(rows, axis=0).tobytes()
+    
+    @staticmethod
+    def compress(data: bytes, row_bytes: int = 100, filter_type: Optional[int] = None) -> bytes:
+        """
+        濾波 + RLE 壓縮
+        
+        Format: [filter(1B)][row_bytes(2B)][RLE 資料]
+        
+        Args:
+            data: 原始 1-bit 打包資料（長度需為 row_bytes 的倍數）
+            row_bytes: 每列 byte 數
+            filter_type: FILTER_NONE / FILTER_UP，None 表示依估算大小自動選擇
+            
+        Returns:
+            壓縮後的資料
+        """
+        if len(data) % row_bytes:
+            raise ValueError(f"資料長度 {len(data)} 不是列寬 {row_bytes} 的倍數")
+        
+        filtered = RowFilter.apply(data, row_bytes) if data else data
+        if filter_type is None:
+            filter_type = RowFilter.FILTER_UP \
+                if RLECompressor.estimate_size(filtered) < RLECompressor.estimate_size(data) \
+                else RowFilter.FILTER_NONE
+        
+        body = filtered if filter_type == RowFilter.FILTER_UP else data
+        header = bytes([filter_type]) + row_bytes.to_bytes(2, 'little')
+        return header + RLECompressor.compress(body)
+    
+    @staticmethod
+    def decompress(data: bytes, expected_size: Optional[int] = None) -> bytes:
+        """
+        RLE 解壓縮 + 還原濾波（參考實作）
+        
+        Args:
+            data: compress() 的輸出
+            expected_size: 預期解壓後大小（用於驗證）
+            
+        Returns:
+            原始資料
+        """
+        if len(data) < RowFilter.HEADER_SIZE:
+            raise ValueError(f"資料太短: {len(data)} < {RowFilter.HEADER_SIZE}")
+        
+        filter_type = data[0]
+        row_bytes = int.from_bytes(data[1:3], 'little')
+        body = RLECompressor.decompress(data[RowFilter.HEADER_SIZE:], expected_size)
+        
+        if filter_type == RowFilter.FILTER_UP:
+            return RowFilter.reverse(body, row_bytes)
+        if filter_type == RowFilter.FILTER_NONE:
+            return body
+        raise ValueError(f"未知的濾波類型: {filter_type}")
+
+
 class DeltaCompressor:
-    """差分壓縮器"""
+    """差分壓縮器（NumPy XOR + 連續區段合併）"""
     
-    def __init__(self):
-        """初始化"""
+    # 每個區段的標頭: offset(4B) + length(2B)
+    SPAN_HEADER_SIZE = 6
+    # 單一區段最大長度（length 欄位為 2 bytes）
+    MAX_SPAN_LENGTH = 0xFFFF
+    
+    def __init__(self, max_gap: int = SPAN_HEADER_SIZE):
+        """
+        初始化
+        
+        Args:
+            max_gap: 兩個變化區段之間未變化 byte 數 ≤ max_gap 時合併為一段
+                     （預設為區段標頭大小，合併一定不會讓 payload 變大）
+        """
         self.last_frame = None
+        self.max_gap = max_gap
+    
+    @staticmethod
+    def find_spans(previous: np.ndarray, current: np.ndarray,
+                   max_gap: int = SPAN_HEADER_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        找出兩幀之間的變化區段
+        
+        Args:
+            previous: 上一幀 (uint8 陣列)
+            current: 當前幀 (uint8 陣列，長度需與 previous 相同)
+            max_gap: 可合併的最大未變化間隔
+            
+        Returns:
+            (starts, lengths) tuple，皆為 int64 陣列
+        """
+        changed = np.flatnonzero(np.bitwise_xor(previous, current))
+        if changed.size == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        
+        # 相鄰變化位置距離 > max_gap + 1 處切開
+        breaks = np.flatnonzero(np.diff(changed) > max_gap + 1)
+        starts = changed[np.concatenate(([0], breaks + 1))]
+        ends = changed[np.append(breaks, changed.size - 1)] + 1
+        lengths = ends - starts
+        
+        # 超過 length 欄位上限的區段切段
+        limit = DeltaCompressor.MAX_SPAN_LENGTH
+        if lengths.max() > limit:
+            pieces = (lengths + limit - 1) // limit
+            first = np.repeat(starts, pieces)
+            step = np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+            starts = first + step * limit
+            lengths = np.minimum(np.repeat(ends, pieces) - starts, limit)
+        
+        return starts.astype(np.int64), lengths.astype(np.int64)
+    
+    @staticmethod
+    def packed_size(lengths: np.ndarray) -> int:
+        """
+        計算打包後的差分大小（不實際打包）
+        
+        Args:
+            lengths: 區段長度陣列
+            
+        Returns:
+            byte 數
+        """
+        return 4 + lengths.size * DeltaCompressor.SPAN_HEADER_SIZE + int(lengths.sum())
+    
+    @staticmethod
+    def pack_spans(current: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> bytes:
+        """
+        打包變化區段（單次配置）
+        
+        Format: [count(4B)][offset(4B), length(2B), data(length B), ...]，小端序
+        
+        Args:
+            current: 當前幀 (uint8 陣列)
+            starts: 區段起點
+            lengths: 區段長度
+            
+        Returns:
+            打包後的資料
+        """
+        count = starts.size
+        out = np.empty(DeltaCompressor.packed_size(lengths), dtype=np.uint8)
+        out[:4] = np.frombuffer(np.uint32(count).astype('<u4').tobytes(), dtype=np.uint8)
+        if count == 0:
+            return out.tobytes()
+        
+        # 每個區段標頭在輸出中的位置
+        data_before = np.cumsum(lengths) - lengths
+        header_pos = 4 + np.arange(count) * DeltaCompressor.SPAN_HEADER_SIZE + data_before
+        
+        out[header_pos[:, None] + np.arange(4)] = starts.astype('<u4').view(np.uint8).reshape(-1, 4)
+        out[header_pos[:, None] + np.arange(4, 6)] = lengths.astype('<u2').view(np.uint8).reshape(-1, 2)
+        
+        # 區段資料：來源索引 + 各區段的位移量
+        src = np.repeat(starts - data_before, lengths) + np.arange(int(lengths.sum()))
+        shift = np.repeat(header_pos + DeltaCompressor.SPAN_HEADER_SIZE - starts, lengths)
+        out[src + shift] = current[src]
+        
+        return out.tobytes()
     
-    def compress(self, current_frame: bytes) -> Tuple[Optional[List[Tuple[int, int]]], Optional[bytes]]:
+    @staticmethod
+    def apply_packed(previous: bytes, packed: bytes) -> bytes:
+        """
+        套用打包後的差分（參考解碼器，用於測試）
+        
+        Args:
+            previous: 上一幀
+            packed: pack_spans 的輸出
+            
+        Returns:
+            還原後的當前幀
+        """
+        frame = bytearray(previous)
+        count = int.from_bytes(packed[:4], 'little')
+        pos = 4
+        
+        for _ in range(count):
+            offset = int.from_bytes(packed[pos:pos + 4], 'little')
+            length = int.from_bytes(packed[pos + 4:pos + 6], 'little')
+            pos += DeltaCompressor.SPAN_HEADER_SIZE
+            frame[offset:offset + length] = packed[pos:pos + length]
+            pos += length
+        
+        if pos != len(packed):
+            raise ValueError(f"差分資料長度不符: 解析 {pos}, 實際 {len(packed)}")
+        
+        return bytes(frame)
+    
+    def compress(self, current_frame: bytes) -> Tuple[Optional[List[Tuple[int, int, bytes]]], Optional[bytes]]:
         """
         差分壓縮
         
@@ -171,46 +761,186 @@ class DeltaCompressor:
             current_frame: 當前幀資料
             
         Returns:
-            (差異列表, 完整資料)
-            - 如果是第一幀：(None, 完整資料)
-            - 如果有差異：(差異列表, None)
+            (差異區段列表, 完整資料)
+            - 如果是第一幀（或幀大小改變）：(None, 完整資料)
+            - 如果有差異：([(offset, length, data), ...], None)
         """
-        if self.last_frame is None:
+        current = np.frombuffer(current_frame, dtype=np.uint8)
+        
+        if self.last_frame is None or self.last_frame.size != current.size:
             # 第一幀，回傳完整資料
-            self.last_frame = bytearray(current_frame)
+            self.last_frame = current.copy()
             return None, current_frame
         
-        # 找出差異
-        diff = []
-        for i in range(min(len(current_frame), len(self.last_frame))):
-            if current_frame[i] != self.last_frame[i]:
-                diff.append((i, current_frame[i]))
+        starts, lengths = self.find_spans(self.last_frame, current, self.max_gap)
+        diff = [(int(start), int(length), current_frame[start:start + length])
+                for start, length in zip(starts, lengths)]
         
         # 更新上一幀
-        self.last_frame = bytearray(current_frame)
+        self.last_frame = current.copy()
         
         return diff, None
     
-    def get_diff_ratio(self, diff: List[Tuple[int, int]], total_size: int) -> float:
+    def get_diff_ratio(self, diff: List[Tuple[int, int, bytes]], total_size: int) -> float:
         """
         計算差異比例
         
         Args:
-            diff: 差異列表
+            diff: 差異區段列表
             total_size: 總大小
             
         Returns:
-            差異百分比
+            差異百分比（以區段涵蓋的 byte 數計算）
         """
         if not diff or total_size == 0:
             return 0.0
-        return (len(diff) / total_size) * 100
+        return (sum(length for _, length, _ in diff) / total_size) * 100
     
     def reset(self):
         """重置狀態"""
         self.last_frame = None
 
 
+class DirtyRectDetector:
+    """變化區域偵測器（產生 Protocol.pack_delta 使用的 byte 對齊矩形）"""
+    
+    # 每個區域的標頭: X(2B) + Y(2B) + W(2B) + H(2B) + Length(4B)
+    REGION_HEADER_SIZE = 12
+    
+    def __init__(self, width: int, height: int,
+                 max_merge_overhead: int = 64, max_regions: int = 16):
+        """
+        初始化
+        
+        Args:
+            width: 畫面寬度（像素，需為 8 的倍數）
+            height: 畫面高度（像素）
+            max_merge_overhead: 合併兩個區域時，允許多傳送的未變化 byte 數上限
+            max_regions: 區域數上限，超過時改用單一外框矩形
+        """
+        self.width = width
+        self.height = height
+        self.row_bytes = width // 8
+        self.max_merge_overhead = max_merge_overhead
+        self.max_regions = max_regions
+    
+    @staticmethod
+    def _split_runs(indices: np.ndarray, max_gap: int) -> List[Tuple[int, int]]:
+        """
+        將排序後的索引依間隔切成 [start, end) 區段
+        
+        Args:
+            indices: 遞增索引陣列（不可為空）
+            max_gap: 間隔 ≤ max_gap 時視為同一區段
+            
+        Returns:
+            [(start, end), ...]
+        """
+        breaks = np.flatnonzero(np.diff(indices) > max_gap + 1)
+        starts = indices[np.concatenate(([0], breaks + 1))]
+        ends = indices[np.append(breaks, indices.size - 1)] + 1
+        return list(zip(starts.tolist(), ends.tolist()))
+    
+    def detect(self, previous: bytes, current: bytes) -> List[Tuple[int, int, int, int]]:
+        """
+        比較兩個 1-bit 打包畫面，找出變化矩形
+        
+        Args:
+            previous: 上一幀（width * height / 8 bytes）
+            current: 當前幀
+            
+        Returns:
+            [(x, y, w, h), ...]，x / w 為 8 的倍數（像素）
+        """
+        prev = np.frombuffer(previous, dtype=np.uint8).reshape(self.height, self.row_bytes)
+        cur = np.frombuffer(current, dtype=np.uint8).reshape(self.height, self.row_bytes)
+        diff = prev != cur
+        
+        changed_rows = np.flatnonzero(diff.any(axis=1))
+        if changed_rows.size == 0:
+            return []
+        
+        # 列合併：以所有變化欄的外框寬度估算多傳的 bytes
+        changed_cols = np.flatnonzero(diff.any(axis=0))
+        span_width = int(changed_cols[-1] - changed_cols[0] + 1)
+        row_gap = self.max_merge_overhead // span_width
+        
+        rects = []
+        for y0, y1 in self._split_runs(changed_rows, row_gap):
+            band = diff[y0:y1]
+            cols = np.flatnonzero(band.any(axis=0))
+            col_gap = self.max_merge_overhead // (y1 - y0)
+            
+            for c0, c1 in self._split_runs(cols, col_gap):
+                # 在欄範圍內收緊上下邊界
+                rows = np.flatnonzero(band[:, c0:c1].any(axis=1))
+                top = y0 + int(rows[0])
+                bottom = y0 + int(rows[-1]) + 1
+                rects.append((c0 * 8, top, (c1 - c0) * 8, bottom - top))
+        
+        if len(rects) > self.max_regions:
+            # 區域過多：改用單一外框
+            rects = [(int(changed_cols[0]) * 8, int(changed_rows[0]),
+                      span_width * 8, int(changed_rows[-1] - changed_rows[0] + 1))]
+        
+        return rects
+    
+    def extract_regions(self, current: bytes,
+                        rects: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int, bytes]]:
+        """
+        擷取矩形內的打包資料
+        
+        Args:
+            current: 當前幀
+            rects: detect() 的輸出
+            
+        Returns:
+            [(x, y, w, h, data), ...]，可直接傳給 Protocol.pack_delta
+        """
+        cur = np.frombuffer(current, dtype=np.uint8).reshape(self.height, self.row_bytes)
+        return [(x, y, w, h, cur[y:y + h, x // 8:(x + w) // 8].tobytes())
+                for x, y, w, h in rects]
+    
+    def regions(self, previous: bytes, current: bytes) -> List[Tuple[int, int, int, int, bytes]]:
+        """
+        偵測並擷取變化區域
+        
+        Args:
+            previous: 上一幀
+            current: 當前幀
+            
+        Returns:
+            [(x, y, w, h, data), ...]
+        """
+        return self.extract_regions(current, self.detect(previous, current))
+    
+    @staticmethod
+    def payload_size(regions: List[Tuple[int, int, int, int, bytes]]) -> int:
+        """
+        計算差分更新的 payload 大小
+        
+        Args:
+            regions: 區域列表
+            
+        Returns:
+            byte 數
+        """
+        return sum(DirtyRectDetector.REGION_HEADER_SIZE + len(data) for *_, data in regions)
+
+    @staticmethod
+    def packed_size(rects: List[Tuple[int, int, int, int]]) -> int:
+        """
+        由 detect() 的矩形計算差分更新的 payload 大小（不擷取資料）
+
+        Args:
+            rects: [(x, y, w, h), ...]
+
+        Returns:
+            byte 數（與 payload_size(extract_regions(...)) 相同）
+        """
+        return sum(DirtyRectDetector.REGION_HEADER_SIZE + (w // 8) * h for _, _, w, h in rects)
+
+
 class HybridCompressor:
     """混合壓縮器（RLE + Delta）"""
     
@@ -241,42 +971,58 @@ class HybridCompressor:
         Returns:
             (is_delta, compressed_data)
         """
-        diff, full = self.delta.compress(data)
+        current = np.frombuffer(data, dtype=np.uint8)
+        previous = self.delta.last_frame
         
-        if diff is None:
+        if previous is None or previous.size != current.size:
             # 首幀
-            return False, self.rle.compress(full)
+            self.delta.last_frame = current.copy()
+            return False, self.rle.compress(data)
         
-        # 計算差異大小
-        diff_size = len(diff) * 5  # 每個差異: 4 bytes (索引) + 1 byte (值)
-        full_compressed = self.rle.compress(data)
+        # 只估算大小，最後只建立勝出的編碼（差異區段只找一次）
+        starts, lengths = self.delta.find_spans(previous, current, self.delta.max_gap)
         
         # 如果差異太多，直接用完整 RLE
-        if diff_size >= len(full_compressed):
+        if DeltaCompressor.packed_size(lengths) >= RLECompressor._estimate_array(current):
             self.delta.reset()  # 重置 delta，下次重新開始
-            return False, full_compressed
+            return False, self.rle.compress(data)
         
-        # 使用 delta（打包差異列表）
-        packed_diff = self._pack_diff(diff)
-        return True, packed_diff
+        # 使用 delta（打包差異區段）
+        self.delta.last_frame = current.copy()
+        return True, self.delta.pack_spans(current, starts, lengths)
     
-    def _pack_diff(self, diff: List[Tuple[int, int]]) -> bytes:
+    @staticmethod
+    def estimate(previous: Optional[np.ndarray], current: np.ndarray,
+                 max_gap: int = DeltaCompressor.SPAN_HEADER_SIZE) -> dict:
         """
-        打包差異列表
-        
-        Format: [count(4B)][index(4B), value(1B), ...]
+        估算各編碼大小（向量化，不建立任何輸出）
         
         Args:
-            diff: 差異列表 [(index, value), ...]
+            previous: 上一幀 (uint8 陣列)，None 表示沒有上一幀
+            current: 當前幀 (uint8 陣列)
+            max_gap: Delta 區段合併間隔（與 DeltaCompressor 相同）
             
         Returns:
-            打包後的資料
+            {'raw_size', 'rle_size', 'delta_spans', 'delta_bytes', 'delta_size'}
+            沒有上一幀時 delta 欄位為 None
         """
-        result = len(diff).to_bytes(4, 'big')  # 差異數量
+        result = {
+            'raw_size': int(current.size),
+            'rle_size': 0,
+            'delta_spans': None,
+            'delta_bytes': None,
+            'delta_size': None,
+        }
+        if current.size == 0:
+            return result
+        
+        result['rle_size'] = RLECompressor._estimate_array(current)
         
-        for index, value in diff:
-            result += index.to_bytes(4, 'big')  # 索引
-            result += bytes([value])             # 值
+        if previous is not None and previous.size == current.size:
+            _, lengths = DeltaCompressor.find_spans(previous, current, max_gap)
+            result['delta_spans'] = int(lengths.size)
+            result['delta_bytes'] = int(lengths.sum())
+            result['delta_size'] = DeltaCompressor.packed_size(lengths)
         
         return result
     
@@ -285,6 +1031,273 @@ class HybridCompressor:
         self.delta.reset()
 
 
+class Codec:
+    """
+    編碼器介面
+    
+    每個編碼器有固定的 codec_id（寫在 ENCODED_UPDATE 封包中）與名稱，
+    estimate() 回傳精確或近似的輸出大小，不適用時回傳 None
+    """
+    
+    codec_id = None
+    name = None
+    
+    def encode(self, data: bytes, previous: Optional[bytes] = None, row_bytes: int = 100) -> bytes:
+        """
+        編碼
+        
+        Args:
+            data: 原始 1-bit 打包畫面
+            previous: 上一幀（差分類編碼器使用）
+            row_bytes: 每列 byte 數
+            
+        Returns:
+            編碼後的資料
+        """
+        raise NotImplementedError
+    
+    def decode(self, payload: bytes, expected_size: int, previous: Optional[bytes] = None) -> bytes:
+        """
+        解碼（參考實作，用於驗證）
+        
+        Args:
+            payload: 編碼後的資料
+            expected_size: 解碼後大小
+            previous: 上一幀（差分類編碼器使用）
+            
+        Returns:
+            原始資料
+        """
+        raise NotImplementedError
+    
+    def estimate(self, data: bytes, previous: Optional[bytes] = None, row_bytes: int = 100) -> Optional[int]:
+        """
+        估算編碼後大小
+        
+        Args:
+            data: 原始 1-bit 打包畫面
+            previous: 上一幀
+            row_bytes: 每列 byte 數
+            
+        Returns:
+            byte 數，不適用時為 None
+        """
+        raise NotImplementedError
+
+
+class RawCodec(Codec):
+    """不壓縮"""
+    
+    codec_id = 0x00
+    name = 'raw'
+    
+    def encode(self, data, previous=None, row_bytes=100):
+        return data
+    
+    def decode(self, payload, expected_size, previous=None):
+        if len(payload) != expected_size:
+            raise ValueError(f"大小不符: 預期 {expected_size}, 實際 {len(payload)}")
+        return payload
+    
+    def estimate(self, data, previous=None, row_bytes=100):
+        return len(data)
+
+
+class RLECodec(Codec):
+    """[count, value] RLE"""
+    
+    codec_id = 0x01
+    name = 'rle'
+    
+    def encode(self, data, previous=None, row_bytes=100):
+        return RLECompressor.compress(data)
+    
+    def decode(self, payload, expected_size, previous=None):
+        return RLECompressor.decompress(payload, expected_size)
+    
+    def estimate(self, data, previous=None, row_bytes=100):
+        return RLECompressor.estimate_size(data)
+
+
+class DeltaCodec(Codec):
+    """與上一幀的差異區段"""
+    
+    codec_id = 0x02
+    name = 'delta'
+    
+    def encode(self, data, previous=None, row_bytes=100):
+        current = np.frombuffer(data, dtype=np.uint8)
+        starts, lengths = DeltaCompressor.find_spans(np.frombuffer(previous, dtype=np.uint8), current)
+        return DeltaCompressor.pack_spans(current, starts, lengths)
+    
+    def decode(self, payload, expected_size, previous=None):
+        if previous is None or len(previous) != expected_size:
+            raise ValueError("差分解碼需要相同大小的上一幀")
+        return DeltaCompressor.apply_packed(previous, payload)
+    
+    def estimate(self, data, previous=None, row_bytes=100):
+        if previous is None or len(previous) != len(data):
+            return None
+        _, lengths = DeltaCompressor.find_spans(np.frombuffer(previous, dtype=np.uint8),
+                                                np.frombuffer(data, dtype=np.uint8))
+        return DeltaCompressor.packed_size(lengths)
+
+
+class PackBitsCodec(Codec):
+    """PackBits literal/repeat run"""
+    
+    codec_id = 0x03
+    name = 'packbits'
+    
+    def encode(self, data, previous=None, row_bytes=100):
+        return PackBitsCompressor.compress(data)
+    
+    def decode(self, payload, expected_size, previous=None):
+        return PackBitsCompressor.decompress(payload, expected_size)
+    
+    def estimate(self, data, previous=None, row_bytes=100):
+        return PackBitsCompressor.estimate_size(data)
+
+
+class RowFilterRLECodec(Codec):
+    """Up 濾波 + RLE"""
+    
+    codec_id = 0x04
+    name = 'rle_up'
+    
+    def encode(self, data, previous=None, row_bytes=100):
+        return RowFilter.compress(data, row_bytes, RowFilter.FILTER_UP)
+    
+    def decode(self, payload, expected_size, previous=None):
+        return RowFilter.decompress(payload, expected_size)
+    
+    def estimate(self, data, previous=None, row_bytes=100):
+        if len(data) % row_bytes:
+            return None
+        return RowFilter.HEADER_SIZE + RLECompressor.estimate_size(RowFilter.apply(data, row_bytes))
+
+
+class CodecRegistry:
+    """編碼器註冊表（依 codec_id / 名稱查詢）"""
+    
+    def __init__(self):
+        """初始化"""
+        self._codecs = {}
+    
+    @classmethod
+    def default(cls) -> 'CodecRegistry':
+        """
+        建立包含所有內建編碼器的註冊表
+        
+        Returns:
+            CodecRegistry
+        """
+        registry = cls()
+        for codec in (RawCodec(), RLECodec(), DeltaCodec(), PackBitsCodec(), RowFilterRLECodec()):
+            registry.register(codec)
+        return registry
+    
+    def register(self, codec: Codec):
+        """
+        註冊編碼器
+        
+        Args:
+            codec: 編碼器實例（codec_id 與名稱不可重複）
+        """
+        for existing in self._codecs.values():
+            if existing.codec_id == codec.codec_id or existing.name == codec.name:
+                raise ValueError(f"編碼器重複: {codec.name} (0x{codec.codec_id:02X})")
+        self._codecs[codec.name] = codec
+    
+    def get(self, key) -> Codec:
+        """
+        取得編碼器
+        
+        Args:
+            key: 名稱或 codec_id
+            
+        Returns:
+            編碼器實例
+        """
+        if isinstance(key, str):
+            if key.lower() in self._codecs:
+                return self._codecs[key.lower()]
+        else:
+            for codec in self._codecs.values():
+                if codec.codec_id == key:
+                    return codec
+        raise KeyError(f"未知的編碼器: {key}")
+    
+    def names(self) -> List[str]:
+        """已註冊的編碼器名稱（依註冊順序）"""
+        return list(self._codecs)
+    
+    def __iter__(self):
+        return iter(self._codecs.values())
+
+
+class CodecSelector:
+    """逐幀選擇輸出最小的編碼器（受 CPU 時間預算限制）"""
+    
+    def __init__(self, registry: Optional[CodecRegistry] = None,
+                 codec_names: Optional[List[str]] = None,
+                 time_budget_ms: float = 50.0):
+        """
+        初始化
+        
+        Args:
+            registry: 編碼器註冊表（None 則使用內建）
+            codec_names: 可選用的編碼器名稱（依估算順序，None 則全部）；raw 一定可用
+            time_budget_ms: 每幀估算的時間預算（毫秒），用完後不再估算其餘編碼器
+        """
+        self.registry = registry or CodecRegistry.default()
+        names = codec_names or self.registry.names()
+        self.codecs = [self.registry.get(name) for name in names if name != RawCodec.name]
+        self.raw = self.registry.get(RawCodec.name)
+        self.time_budget_ms = time_budget_ms
+    
+    def select(self, data: bytes, previous: Optional[bytes] = None,
+               row_bytes: int = 100) -> Tuple[Codec, int]:
+        """
+        選擇編碼器
+        
+        Args:
+            data: 原始 1-bit 打包畫面
+            previous: 上一幀（None 則跳過差分類編碼器）
+            row_bytes: 每列 byte 數
+            
+        Returns:
+            (編碼器, 估算大小) tuple
+        """
+        best, best_size = self.raw, len(data)
+        deadline = time.perf_counter() + self.time_budget_ms / 1000
+        
+        for codec in self.codecs:
+            size = codec.estimate(data, previous, row_bytes)
+            if size is not None and size < best_size:
+                best, best_size = codec, size
+            if time.perf_counter() >= deadline:
+                break
+        
+        return best, best_size
+    
+    def encode(self, data: bytes, previous: Optional[bytes] = None,
+               row_bytes: int = 100) -> Tuple[Codec, bytes]:
+        """
+        選擇並編碼（只建立勝出的編碼）
+        
+        Args:
+            data: 原始 1-bit 打包畫面
+            previous: 上一幀
+            row_bytes: 每列 byte 數
+            
+        Returns:
+            (編碼器, 編碼後資料) tuple
+        """
+        codec, _ = self.select(data, previous, row_bytes)
+        return codec, codec.encode(data, previous, row_bytes)
+
+
 if __name__ == "__main__":
     # 測試程式
     print("=== RLE 壓縮測試 ===")
@@ -330,7 +1343,7 @@ if __name__ == "__main__":
     frame2[10] = 0x00
     frame2[20] = 0x00
     diff2, full2 = delta.compress(bytes(frame2))
-    print(f"第二幀: {len(diff2)} 個差異")
+    print(f"第二幀: {len(diff2)} 個差異區段")
     print(f"差異比例: {delta.get_diff_ratio(diff2, len(frame2)):.2f}%")
     
     print("\n測試完成！")
@@ -34,18 +34,67 @@ IMAGE_MAX_SIZE = 5 * 1024 * 1024  # 5MB
 # 降低快取以節省記憶體
 IMAGE_CACHE_SIZE = 2
 
-# 預設關閉抖動演算法
-# Floyd-Steinberg 抖動會增加 CPU 與記憶體負擔
-USE_DITHER = False
+# 抖動演算法 (floyd-steinberg / atkinson / bayer4 / bayer8 / none)
+# Floyd-Steinberg 抖動會增加 CPU 與記憶體負擔；"none" 關閉抖動 (直接二值化)
+# bayer4 / bayer8 為向量化有序抖動，成本接近直接二值化，適合 RPi 1
+# 條帶渲染 (STRIP_RENDERING) 下誤差擴散 (floyd-steinberg / atkinson) 需以 NumPy 逐條帶接續誤差，
+# 比整張處理慢數倍；有序抖動沒有跨條帶狀態，不受影響 (STRIP_RENDERING 下可改用 bayer8)
+DITHER_MODE = "floyd-steinberg"
+
+# 黑白來源快速路徑：文字截圖、QR code、線稿等已接近黑白的圖片
+# 以縮小預覽圖的灰階直方圖偵測，改用最近鄰縮放 + 二值化（邊緣銳利，跳過濾波縮放與抖動）
+BILEVEL_FAST_PATH = True
+
+# 影像處理執行方式
+# "process": 獨立 worker 程序，處理大圖時不阻塞事件迴圈 (推薦)
+# "thread": 背景執行緒 (PIL 會釋放 GIL，但 Atkinson 等 Python 迴圈仍會佔用)
+# "inline": 直接在事件迴圈中處理 (舊行為)
+RENDER_POOL_MODE = "process"
+
+# worker 數量 (RPi 1 為單核心，1 個即可)
+RENDER_POOL_WORKERS = 1
+
+# 固定畫面 (測試圖案、全白 / 全黑、開機畫面)
+# 啟動時預先渲染並打包，發送時不再經過 ImageDraw / 抖動 / 編碼
+PREBUILD_STATIC_FRAMES = True
+
+# 開機畫面 (frame splash)：圖片路徑，None 則以自動排版顯示 SPLASH_TEXT
+SPLASH_IMAGE = None
+SPLASH_TEXT = "WiFi e-Paper"
 
 # 條帶顯示高度 (pixels)
 # 較小的條帶高度可減少單次記憶體分配
 TILE_HEIGHT = 30
 
+# 分區發送 (tile 指令) 的條帶高度 (pixels)
+# 直接以位元組偏移切割已打包的畫面，不再逐條帶轉換
+# 160: 舊版 TILE_UPDATE (3 個 800×160 條帶，相容現有 client)
+# 其他高度: BAND_UPDATE (payload 帶 Y 座標，需 client 支援)
+BAND_HEIGHT = 160
+
+# 以單一封包大小上限決定條帶高度 (bytes)
+# 可用 packet_size_test.py 測得的穩定大小，設定後優先於 BAND_HEIGHT；None 表示不使用
+BAND_MAX_PACKET_SIZE = None
+
+# 條帶 RLE 壓縮 (需 client 能把條帶解壓到分區緩衝區，預設關閉)
+# 每個 RLE chunk 壓縮後不超過 TILE_CHUNK_LIMIT bytes (可用 packet_size_test.py 測得的穩定大小)；
+# BAND_UPDATE 放不進單一 chunk 時分成多個整列的 chunk 各自送出，TILE_UPDATE 則改送未壓縮資料
+COMPRESS_TILES = False
+TILE_CHUNK_LIMIT = 12000
+
 # 低記憶體模式
 # 啟用後會使用更保守的記憶體策略
 LOW_MEMORY_MODE = True
 
+# 條帶渲染 (預設關閉)
+# 圖片以 TILE_HEIGHT 列為單位逐條帶縮放、抖動與打包，不同時持有整張中間圖；
+# 但來源仍需整張解碼 (JPEG 以 draft 縮小)，省下的只有中間圖，而誤差擴散改用 NumPy 實作。
+# 實測 4000x3000 來源渲染為 800x480 floyd-steinberg：
+#   PNG:  整張 438 ms / 60 MB，條帶 912 ms / 52 MB
+#   JPEG: 整張  43 ms /  4 MB，條帶 586 ms /  3 MB
+# 整張處理已先以 reduce() 縮小 (MAX_INTERMEDIATE_SIZE) 再用 PIL 的 Floyd-Steinberg，通常較適合
+STRIP_RENDERING = False
+
 # 中間圖像尺寸限制 (pixels)
 # 處理大圖時先縮小到此尺寸，避免記憶體爆炸
 MAX_INTERMEDIATE_SIZE = 2000
@@ -185,10 +234,41 @@ USE_PYPY = False
 ENABLE_IMAGE_CACHE = True
 
 # 壓縮演算法
-# "RLE": Run-Length Encoding (簡單快速)
-# "HYBRID": 混合壓縮 (較佳壓縮率但較慢)
+# "RLE": Run-Length Encoding (簡單快速，相容舊版 client 的 FULL_UPDATE)
+# "AUTO" / "HYBRID": 逐幀在 raw / RLE / Delta / PackBits / Up 濾波 RLE 中選擇最小者
+#                    (送出 ENCODED_UPDATE，需 client 支援)
 COMPRESSION_ALGORITHM = "RLE"
 
+# 差分更新 (DELTA_UPDATE)
+# 畫面只有小範圍變化 (時鐘、感測器數值) 時只送變化的矩形區域，需 client 支援
+# 估算的差分大小不小於完整畫面時仍送完整畫面
+ENABLE_DELTA_UPDATE = False
+
+# 畫面儲存檔 (append-only，以 mmap 讀取)
+# 發送過的有名稱 800×480 完整畫面 (圖片檔 / 上傳的檔名) 會存入 (相同內容只存一份)，
+# 重啟後可用 replay 指令重播；畫面由作業系統 page cache 管理，內容庫可比 RAM 大。None 表示停用
+FRAME_STORE_PATH = "frames/frames.dat"
+# 最多存放的不同畫面數 (每個 48000 bytes)，存滿後不再加入新畫面；None 表示不限制
+FRAME_STORE_MAX_FRAMES = 1000
+
+# 動畫 (多幀 GIF / APNG / WebP)
+# 每一幀只渲染一次 (分散到 RENDER_POOL_WORKERS 個 worker)，相鄰幀預先編碼為 DELTA_UPDATE
+# 每幀間隔 (ms)，None 表示使用檔案中的時間；電子紙刷新慢，實際間隔不低於 ANIMATION_MIN_INTERVAL_MS
+ANIMATION_INTERVAL_MS = None
+ANIMATION_MIN_INTERVAL_MS = 500
+# 最多渲染的幀數 (每幀 48000 bytes 保存在記憶體中)
+ANIMATION_MAX_FRAMES = 100
+# 預設播放輪數；0 表示持續循環直到發送其他畫面 (可在 anim 指令指定)
+ANIMATION_LOOPS = 3
+
+# 已編碼 payload 快取大小 (bytes)
+# 以畫面雜湊 + 編碼參數為 key，重複發送相同畫面時跳過編碼
+PAYLOAD_CACHE_MAX_BYTES = 1 * 1024 * 1024  # 1MB
+
+# 每幀編碼器估算的 CPU 時間預算 (毫秒)
+# 預算用完後不再估算其餘編碼器，直接使用目前最小者
+CODEC_TIME_BUDGET_MS = 50
+
 # =============================================================================
 # 除錯設定
 # =============================================================================
@@ -222,8 +302,9 @@ def get_config_summary():
         "image": {
             "max_size_mb": IMAGE_MAX_SIZE / 1024 / 1024,
             "cache_size": IMAGE_CACHE_SIZE,
-            "dither": USE_DITHER,
+            "dither_mode": DITHER_MODE,
             "low_memory_mode": LOW_MEMORY_MODE,
+            "strip_rendering": STRIP_RENDERING,
         },
         "network": {
             "max_clients": MAX_CLIENTS,
@@ -0,0 +1,591 @@
+"""
+顯示發送管線
+server.py 與 server_with_webui.py 共用的渲染、編碼與發送流程：
+畫面快取 → 背景渲染 → 編碼器選擇 / 差分 → 打包 → 發送並等待 READY，
+以及固定畫面、條帶發送、畫面儲存檔重播與動畫播放
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set, Tuple
+
+import websockets
+
+from image_processor import ImageProcessor, RenderParams
+from compressor import (RLECompressor, HybridCompressor, DirtyRectDetector,
+                        CodecRegistry, CodecSelector, RawCodec, RLECodec)
+from protocol import Protocol, PacketType
+from frame_cache import PayloadCache, FrameCache, frame_digest
+from render_pool import RenderPool, render_source_info
+from static_frames import StaticFrame, default_static_frames
+from frame_store import FrameStore
+from animation import Animation, encode_animation, frame_count, render_frame_range, split_ranges
+import config_rpi as config
+
+logger = logging.getLogger(__name__)
+
+
+class DisplayPipeline:
+    """
+    顯示伺服器的共用基底類別
+    
+    持有處理器、編碼器、各種快取與連線狀態；子類別負責 WebSocket / HTTP 介面
+    """
+    
+    def __init__(self):
+        """初始化共用的處理器、編碼器、快取與發送狀態"""
+        self.clients: Set[websockets.WebSocketServerProtocol] = set()
+        self.seq_id = 0
+        
+        # 初始化模組
+        # 條帶渲染：逐條帶處理 (config.TILE_HEIGHT 列)，預設關閉（見 config.STRIP_RENDERING）
+        strip_height = config.TILE_HEIGHT if config.STRIP_RENDERING else None
+        # processor: 400x240 用於中央區域顯示 (向後兼容)
+        self.processor = ImageProcessor(400, 240, dither_mode=config.DITHER_MODE,
+                                        resample=config.RESIZE_ALGORITHM,
+                                        max_intermediate_size=config.MAX_INTERMEDIATE_SIZE,
+                                        strip_height=strip_height)
+        # processor_800: 800x480 用於全螢幕顯示
+        self.processor_800 = ImageProcessor(800, 480, dither_mode=config.DITHER_MODE,
+                                            resample=config.RESIZE_ALGORITHM,
+                                            max_intermediate_size=config.MAX_INTERMEDIATE_SIZE,
+                                            strip_height=strip_height)
+        self.compressor = RLECompressor()
+        self.hybrid = HybridCompressor()
+        
+        # 條帶壓縮（見 config.COMPRESS_TILES / TILE_CHUNK_LIMIT）
+        self.compress_tiles = config.COMPRESS_TILES
+        self.tile_chunk_limit = config.TILE_CHUNK_LIMIT
+        
+        # 編碼器選擇（config.COMPRESSION_ALGORITHM）
+        # "RLE": 相容舊版 client 的 FULL_UPDATE；"AUTO" / "HYBRID": 逐幀自動選擇並送出 ENCODED_UPDATE
+        self.codec_registry = CodecRegistry.default()
+        self.encoded_updates = config.COMPRESSION_ALGORITHM.upper() != "RLE"
+        self.codec_selector = CodecSelector(self.codec_registry, time_budget_ms=config.CODEC_TIME_BUDGET_MS)
+        # 舊版 FULL_UPDATE：可用編碼器組合 → 選擇器（800×480 只用 raw，其他尺寸可用 RLE）
+        self.legacy_selectors: Dict[Tuple[str, ...], CodecSelector] = {
+            codecs: CodecSelector(self.codec_registry, list(codecs))
+            for codecs in ((RawCodec.name,), (RawCodec.name, RLECodec.name))
+        }
+        
+        # 已編碼 payload 快取（相同畫面重複發送時跳過編碼）
+        self.payload_cache = PayloadCache(config.PAYLOAD_CACHE_MAX_BYTES)
+        
+        # 已渲染畫面快取：同一張圖片再次發送時跳過解碼、縮放與抖動
+        self.frame_cache = None
+        if config.ENABLE_IMAGE_CACHE:
+            self.frame_cache = FrameCache(config.IMAGE_CACHE_SIZE * self.processor_800.total_bytes,
+                                          max_entries=config.IMAGE_CACHE_SIZE)
+        
+        # 分區發送的條帶高度（見 config.BAND_HEIGHT / BAND_MAX_PACKET_SIZE）
+        self.band_height = config.BAND_HEIGHT
+        if config.BAND_MAX_PACKET_SIZE:
+            self.band_height = Protocol.band_rows(config.BAND_MAX_PACKET_SIZE, self.processor_800.width // 8)
+        
+        # 影像處理 worker（啟動時預熱，處理圖片時不阻塞事件迴圈）
+        self.render_pool = RenderPool(config.RENDER_POOL_MODE, config.RENDER_POOL_WORKERS)
+        
+        # 渲染參數（黑白來源快速路徑見 config.BILEVEL_FAST_PATH）與各處理方式的次數 / 累計耗時
+        self.render_params = RenderParams(detect_bilevel=config.BILEVEL_FAST_PATH)
+        self.render_stats = {}
+        self.last_render_path = None
+        
+        # 畫面儲存檔：發送過的完整畫面存在磁碟上 (mmap)，重啟後仍可依名稱 / 雜湊重播
+        self.frame_store = None
+        if config.FRAME_STORE_PATH:
+            self.frame_store = FrameStore(config.FRAME_STORE_PATH, self.processor_800.total_bytes,
+                                          config.FRAME_STORE_MAX_FRAMES)
+        
+        # 固定畫面（測試圖案、全白 / 全黑、開機畫面）：只渲染與編碼一次，發送時只改寫序號
+        self.static_frames = default_static_frames(self.processor, self.processor_800,
+                                                   config.SPLASH_IMAGE, config.SPLASH_TEXT)
+        if config.PREBUILD_STATIC_FRAMES:
+            self.static_frames.prebuild()
+        
+        # 差分更新：畫面小幅變化時改送 DELTA_UPDATE（需 client 支援，預設關閉）
+        # last_frame: ((width, height), 上一次送出的原始畫面, 畫面雜湊)，client 狀態不明時清除
+        self.enable_delta_update = config.ENABLE_DELTA_UPDATE
+        self.delta_merge_overhead = 64
+        self.last_frame = None
+        
+        # 背景播放中的動畫（發送其他畫面時停止）
+        self.animation_task: Optional[asyncio.Task] = None
+        
+        # 條帶顯示完成事件（用於同步）
+        self.tile_ready_event = asyncio.Event()
+    
+    def _legacy_selector(self, legacy_codecs) -> CodecSelector:
+        """
+        取得舊版 FULL_UPDATE 的編碼器選擇器（不在 legacy_selectors 中的組合建立後保留）
+        
+        Args:
+            legacy_codecs: 可使用的編碼器名稱
+        
+        Returns:
+            CodecSelector
+        """
+        codecs = tuple(legacy_codecs)
+        selector = self.legacy_selectors.get(codecs)
+        if selector is None:
+            selector = self.legacy_selectors[codecs] = CodecSelector(self.codec_registry, list(codecs))
+        return selector
+    
+    def _pack_update(self, processor: ImageProcessor, raw_data: bytes,
+                     legacy_codecs=(RawCodec.name, RLECodec.name)) -> bytes:
+        """
+        編碼並打包畫面更新（所有整幀發送路徑的單一決策點）
+        
+        COMPRESSION_ALGORITHM = "RLE" 時維持舊版 FULL_UPDATE（client 以長度判斷是否壓縮），
+        只在 legacy_codecs 中選擇；其他設定由 CodecSelector 逐幀選擇並送出 ENCODED_UPDATE。
+        變化區域小且 enable_delta_update 開啟時改送 DELTA_UPDATE。
+        
+        Args:
+            processor: 產生此畫面的圖像處理器（決定畫面尺寸）
+            raw_data: 未壓縮的 1-bit 畫面
+            legacy_codecs: 舊版 FULL_UPDATE 可使用的編碼器名稱
+        
+        Returns:
+            完整封包（使用目前的 seq_id）
+        """
+        # 畫面儲存檔的 mmap memoryview 先複製，再放進 last_frame / payload 快取
+        # （否則 FrameStore.close() 關不掉仍被引用的 mmap）
+        raw_data = bytes(raw_data)
+        key = (processor.width, processor.height)
+        row_bytes = processor.width // 8
+        previous = previous_digest = None
+        if self.last_frame is not None and self.last_frame[0] == key:
+            _, previous, previous_digest = self.last_frame
+        
+        # 相同畫面 + 相同編碼參數直接取用快取；差分類編碼器與上一幀有關，上一幀雜湊也納入 key
+        digest = frame_digest(raw_data)
+        if self.encoded_updates:
+            cache_key = PayloadCache.make_key(digest, ('auto', row_bytes, previous_digest))
+        else:
+            cache_key = PayloadCache.make_key(digest, tuple(legacy_codecs))
+        
+        # 先估算大小（不建立任何輸出），只編碼勝出的一方
+        rects = None
+        if self.enable_delta_update and previous is not None:
+            detector = DirtyRectDetector(processor.width, processor.height, self.delta_merge_overhead)
+            rects = detector.detect(previous, raw_data)
+        
+        cached = self.payload_cache.get(cache_key)
+        if cached is not None:
+            codec, payload = cached
+            full_size = len(payload)
+        elif self.encoded_updates:
+            codec, full_size = self.codec_selector.select(raw_data, previous, row_bytes)
+        else:
+            codec, full_size = self._legacy_selector(legacy_codecs).select(raw_data, previous, row_bytes)
+        
+        self.last_frame = (key, raw_data, digest)
+        
+        if rects is not None and DirtyRectDetector.packed_size(rects) < full_size:
+            regions = detector.extract_regions(raw_data, rects)
+            logger.info(f"差分更新: {len(regions)} 個區域, {DirtyRectDetector.payload_size(regions)} bytes "
+                        f"(完整更新需 {full_size} bytes)")
+            return Protocol.pack_delta(self.seq_id, regions)
+        
+        if cached is not None:
+            logger.info(f"編碼快取命中: {codec.name}, {len(payload)} bytes")
+        else:
+            payload = codec.encode(raw_data, previous, row_bytes)
+            self.payload_cache.put_payload(cache_key, codec, payload)
+            
+            ratio = self.compressor.compress_ratio(len(raw_data), len(payload))
+            logger.info(f"編碼: {codec.name}, {len(raw_data)} → {len(payload)} bytes (壓縮率: {ratio:.1f}%)")
+        
+        if self.encoded_updates:
+            return Protocol.pack_encoded_frame(self.seq_id, codec.codec_id, len(raw_data), payload)
+        return Protocol.pack_full_frame(self.seq_id, payload)
+    
+    def _pack_static(self, name: str) -> bytes:
+        """
+        取得固定畫面的封包（第一次使用時編碼，之後只改寫序號）
+        
+        固定畫面一律送出完整畫面（不做差分），送出後作為下一次差分更新的上一幀
+        
+        Args:
+            name: 固定畫面名稱（見 static_frames.default_static_frames）
+        
+        Returns:
+            完整封包（使用目前的 seq_id）
+        """
+        frame = self.static_frames.get(name)
+        
+        # 舊版模式下 800×480 維持未壓縮（ESP32-C3 端以 48000 bytes 判斷完整畫面）
+        if len(frame.data) == self.processor_800.total_bytes:
+            legacy_codecs = (RawCodec.name,)
+        else:
+            legacy_codecs = (RawCodec.name, RLECodec.name)
+        
+        def encode(frame: StaticFrame) -> bytes:
+            row_bytes = frame.width // 8
+            if self.encoded_updates:
+                codec, payload = self.codec_selector.encode(frame.data, None, row_bytes)
+                return Protocol.pack_encoded_frame(0, codec.codec_id, len(frame.data), payload)
+            codec, payload = self._legacy_selector(legacy_codecs).encode(frame.data, None, row_bytes)
+            return Protocol.pack_full_frame(0, payload)
+        
+        variant = ('auto',) if self.encoded_updates else legacy_codecs
+        packet = self.static_frames.packet(name, encode, variant)
+        self.last_frame = ((frame.width, frame.height), frame.data, frame.digest)
+        return Protocol.with_seq_id(packet, self.seq_id)
+    
+    async def _render_source(self, processor: ImageProcessor, source: bytes,
+                             params: RenderParams = None) -> bytes:
+        """
+        將圖片檔案內容渲染為打包畫面
+        
+        啟用 ENABLE_IMAGE_CACHE 時先查畫面快取；未命中時在背景 worker 渲染，
+        事件迴圈在此期間仍可處理 ping 與其他請求
+        
+        Args:
+            processor: 目標尺寸的處理器
+            source: 圖片檔案內容
+            params: 渲染參數（None 則使用 self.render_params）
+        
+        Returns:
+            打包後的 1-bit 畫面
+        """
+        params = params or self.render_params
+        key = frame = None
+        if self.frame_cache is not None:
+            key, frame = self.frame_cache.lookup(processor, source, params)
+        if frame is not None:
+            logger.info("畫面快取命中，跳過解碼與抖動")
+            self._record_render('cache', 0.0)
+            return frame
+        
+        start = time.perf_counter()
+        frame, path = await self.render_pool.run(render_source_info, processor, source, params)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._record_render(path, elapsed_ms)
+        logger.info(f"渲染: {path} ({elapsed_ms:.0f} ms)")
+        
+        if self.frame_cache is not None:
+            self.frame_cache.put(key, frame, len(frame))
+        return frame
+    
+    def _record_render(self, path: str, elapsed_ms: float):
+        """
+        記錄渲染的處理方式與耗時
+        
+        Args:
+            path: 'cache'（畫面快取命中）、'bilevel'（黑白快速路徑）或抖動演算法名稱
+            elapsed_ms: 耗時（含 worker 往返）
+        """
+        self.last_render_path = path
+        stats = self.render_stats.setdefault(path, {'count': 0, 'total_ms': 0.0})
+        stats['count'] += 1
+        stats['total_ms'] = round(stats['total_ms'] + elapsed_ms, 1)
+    
+    def _encode_band(self, y: int, height: int, band: bytes, legacy: bool):
+        """
+        壓縮單一條帶
+        
+        以 RLECompressor.iter_chunks 限制每個 chunk 壓縮後大小 (tile_chunk_limit)，
+        chunk 邊界對齊整列，各自以 BAND_UPDATE 的 Y 座標送出；
+        舊版 TILE_UPDATE 沒有座標欄位，只有整條帶能放進單一 chunk 時才壓縮。
+        壓縮後沒有變小的 chunk 改送原始資料
+        
+        Args:
+            y: 條帶起始列
+            height: 條帶高度（列）
+            band: 條帶原始資料（bytes 或 memoryview）
+            legacy: 是否以 TILE_UPDATE 送出
+        
+        Returns:
+            [(起始列, 列數, 傳送資料, 是否使用了壓縮), ...]
+        """
+        whole = [(y, height, band, False)]
+        if not self.compress_tiles:
+            return whole
+        
+        row_bytes = len(band) // height
+        chunks = list(self.compressor.iter_chunks(band, self.tile_chunk_limit, len(band), row_bytes))
+        if (legacy and len(chunks) > 1) or sum(len(chunk) for _, chunk in chunks) >= len(band):
+            return whole
+        
+        pieces = []
+        for i, (offset, chunk) in enumerate(chunks):
+            end = chunks[i + 1][0] if i + 1 < len(chunks) else len(band)
+            top, rows = y + offset // row_bytes, (end - offset) // row_bytes
+            if len(chunk) < end - offset:
+                pieces.append((top, rows, chunk, True))
+            else:
+                pieces.append((top, rows, band[offset:end], False))
+        return pieces
+    
+    async def _send_bands(self, frame: bytes):
+        """
+        以水平條帶發送已打包的 800×480 畫面
+        
+        直接以 memoryview 切割打包後的畫面（每條帶不再轉換或打包）；
+        條帶高度為 160 時送出舊版 TILE_UPDATE（索引 0~2），其他高度送出帶 Y 座標的 BAND_UPDATE
+        
+        Args:
+            frame: 打包後的 800×480 畫面
+        """
+        self.stop_animation()
+        self.last_frame = None  # 條帶更新後不再以整幀做差分
+        legacy = self.band_height == ImageProcessor.LEGACY_TILE_HEIGHT
+        bands = list(self.processor_800.iter_bands(frame, self.band_height))
+        logger.info(f"切割為 {len(bands)} 個條帶 (800×{self.band_height}, "
+                    f"{'TILE_UPDATE' if legacy else 'BAND_UPDATE'})")
+        
+        total_raw = 0
+        total_compressed = 0
+        
+        # 依序發送條帶（從上到下），每個封包等待 READY 訊號
+        for y, height, band in bands:
+            total_raw += len(band)
+            for top, rows, data, is_compressed in self._encode_band(y, height, band, legacy):
+                total_compressed += len(data)
+                
+                self.seq_id += 1
+                if legacy:
+                    packet = Protocol.pack_tile(self.seq_id, y // height, data)
+                else:
+                    packet = Protocol.pack_band(self.seq_id, top, rows, data)
+                logger.info(f"條帶 Y={top}-{top + rows}: {len(data)} bytes"
+                            f"{' (RLE)' if is_compressed else ''}, 封包 {len(packet)} bytes")
+                
+                await asyncio.gather(
+                    *[client.send(packet) for client in self.clients],
+                    return_exceptions=True
+                )
+                
+                # 等待 ESP8266 完成顯示並發送 READY 訊號
+                self.tile_ready_event.clear()
+                try:
+                    await asyncio.wait_for(self.tile_ready_event.wait(), timeout=30.0)
+                    logger.info(f"✓ 條帶 Y={top} 顯示完成")
+                except asyncio.TimeoutError:
+                    logger.warning(f"⚠️ 等待條帶 Y={top} 完成超時，繼續發送下一個條帶")
+        
+        # 統計資訊
+        overall_ratio = self.compressor.compress_ratio(total_raw, total_compressed)
+        logger.info(f"=== 條帶傳輸完成: {total_raw} → {total_compressed} bytes (壓縮率: {overall_ratio:.1f}%) ===")
+    
+    def _store_frame(self, image_data: bytes, name: str = None):
+        """
+        將有名稱的完整畫面存入畫面儲存檔
+        
+        只存入有名稱的畫面（圖片檔 / 上傳的檔名），文字、測試圖案與重播的畫面不存
+        
+        Args:
+            image_data: 打包後的 800×480 畫面
+            name: 名稱（None 則不存）
+        """
+        if self.frame_store is None or name is None:
+            return
+        try:
+            if self.frame_store.append(image_data, name) is None:
+                logger.warning(f"畫面儲存檔已滿 ({len(self.frame_store)} 個畫面)，不存入: {name}")
+        except OSError as e:
+            logger.warning(f"寫入畫面儲存檔失敗: {e}")
+    
+    async def replay_frame(self, key) -> bool:
+        """
+        從畫面儲存檔重播歷史畫面（直接發送 mmap 的資料，不做任何影像處理）
+        
+        Args:
+            key: 位置 (int)、名稱或雜湊前綴（見 FrameStore.find）
+        
+        Returns:
+            是否找到畫面
+        """
+        if self.frame_store is None:
+            logger.warning("未啟用畫面儲存檔 (config.FRAME_STORE_PATH)")
+            return False
+        
+        frame = self.frame_store.lookup(key)
+        if frame is None:
+            logger.warning(f"找不到畫面: {key}")
+            return False
+        
+        if not self.clients:
+            logger.warning("沒有連接的客戶端")
+            return True
+        
+        logger.info(f"=== 重播畫面: {key} ===")
+        await self._send_full_frame(frame)
+        return True
+    
+    async def _send_full_frame(self, image_data: bytes, name: str = None):
+        """
+        發送已打包的 800×480 完整畫面並等待設備完成顯示
+        
+        Args:
+            image_data: 打包後的畫面
+            name: 存入畫面儲存檔時使用的名稱
+        """
+        try:
+            logger.info(f"圖像資料: {len(image_data)} bytes")
+            
+            if len(image_data) != 48000:
+                logger.error(f"圖像資料大小錯誤: 預期 48000 bytes, 實際 {len(image_data)} bytes")
+                return
+            
+            self._store_frame(image_data, name)
+            
+            # 創建完整畫面封包
+            # （舊版模式下維持未壓縮：ESP32-C3 端以 48000 bytes 判斷完整畫面）
+            self.seq_id += 1
+            packet = self._pack_update(self.processor_800, image_data, legacy_codecs=(RawCodec.name,))
+        except Exception as e:
+            logger.error(f"發送完整畫面失敗: {e}")
+            import traceback
+            traceback.print_exc()
+            return
+        
+        await self._broadcast_frame(packet)
+    
+    async def _broadcast_frame(self, packet: bytes, wait_ready: bool = True):
+        """
+        發送畫面封包到所有客戶端並等待設備完成顯示
+        
+        Args:
+            packet: 完整封包
+            wait_ready: 是否等待 READY 訊號
+        """
+        self.stop_animation()
+        try:
+            logger.info(f"封包大小: {len(packet)} bytes (含標頭)")
+            
+            # 發送到所有客戶端
+            logger.info(f"發送完整畫面到 {len(self.clients)} 個客戶端...")
+            start_time = asyncio.get_event_loop().time()
+            
+            await asyncio.gather(
+                *[client.send(packet) for client in self.clients],
+                return_exceptions=True
+            )
+            
+            elapsed = asyncio.get_event_loop().time() - start_time
+            logger.info(f"✓ 完整畫面發送完成 (耗時: {elapsed:.2f} 秒)")
+            
+            if wait_ready:
+                # 等待 ESP32-C3 完成顯示並發送 READY 訊號
+                logger.info(f"等待設備完成顯示...")
+                self.tile_ready_event.clear()
+                
+                try:
+                    await asyncio.wait_for(self.tile_ready_event.wait(), timeout=30.0)
+                    logger.info(f"✓ 設備顯示完成")
+                except asyncio.TimeoutError:
+                    logger.warning(f"⚠️ 等待設備完成超時")
+            
+            logger.info(f"=== 完整畫面傳輸完成 ===")
+        
+        except Exception as e:
+            logger.error(f"發送完整畫面失敗: {e}")
+            import traceback
+            traceback.print_exc()
+    
+    async def render_animation(self, processor: ImageProcessor, source: bytes,
+                               params: RenderParams = None) -> Animation:
+        """
+        渲染多幀圖片並預先編碼幀間差分
+        
+        GIF 只能依序解碼，幀被分成連續的範圍，各 worker 分別渲染一段
+        
+        Args:
+            processor: 目標尺寸的處理器
+            source: 圖片檔案內容
+            params: 渲染參數（None 則使用 self.render_params）
+        
+        Returns:
+            Animation（最多 config.ANIMATION_MAX_FRAMES 幀）
+        """
+        params = params or self.render_params
+        count = min(await self.render_pool.run(frame_count, source), config.ANIMATION_MAX_FRAMES)
+        chunks = await asyncio.gather(*[
+            self.render_pool.run(render_frame_range, processor, source, start, stop, params)
+            for start, stop in split_ranges(count, self.render_pool.workers)
+        ])
+        rendered = [item for chunk in chunks for item in chunk]
+        return await self.render_pool.run(encode_animation,
+                                          [frame for frame, _ in rendered],
+                                          [duration for _, duration in rendered],
+                                          processor.width, processor.height, self.delta_merge_overhead)
+    
+    async def play_animation(self, processor: ImageProcessor, animation: Animation,
+                             loops: int = 1, legacy_codecs=(RawCodec.name, RLECodec.name)):
+        """
+        播放已渲染的動畫（以幀間隔控制速度）
+        
+        設備正顯示前一幀且 enable_delta_update 開啟時直接送出預先編碼的差分封包，
+        否則經 _pack_update() 編碼（重複的輪次會命中已編碼 payload 快取）；
+        送出 800×480 完整畫面時與 _send_full_frame() 相同，等待設備回報 READY 後才繼續
+        
+        Args:
+            processor: 產生動畫的處理器
+            animation: render_animation() 的結果
+            loops: 播放輪數（0 表示持續循環）
+            legacy_codecs: 舊版 FULL_UPDATE 可使用的編碼器名稱
+        """
+        key = (processor.width, processor.height)
+        loop = 0
+        while self.clients and (not loops or loop < loops):
+            for index, frame in enumerate(animation.frames):
+                digest = animation.digests[index]
+                shown = self.last_frame[2] if self.last_frame is not None and self.last_frame[0] == key else None
+                
+                if digest != shown:
+                    self.seq_id += 1
+                    if self.enable_delta_update and shown == animation.digests[index - 1]:
+                        packet = Protocol.with_seq_id(animation.packets[index], self.seq_id)
+                        self.last_frame = (key, frame, digest)
+                    else:
+                        packet = self._pack_update(processor, frame, legacy_codecs)
+                    self.tile_ready_event.clear()
+                    await asyncio.gather(
+                        *[client.send(packet) for client in self.clients],
+                        return_exceptions=True
+                    )
+                    
+                    # 差分只更新局部；完整畫面需等設備刷新完成，否則下一幀會在刷新中途送達
+                    full_frame = Protocol.unpack_header(packet)[1] != PacketType.DELTA_UPDATE
+                    if full_frame and len(frame) == self.processor_800.total_bytes:
+                        try:
+                            await asyncio.wait_for(self.tile_ready_event.wait(), timeout=30.0)
+                        except asyncio.TimeoutError:
+                            logger.warning(f"⚠️ 等待動畫第 {index} 幀完成超時")
+                
+                interval = config.ANIMATION_INTERVAL_MS or animation.durations[index]
+                await asyncio.sleep(max(interval, config.ANIMATION_MIN_INTERVAL_MS) / 1000)
+            loop += 1
+    
+    def start_animation(self, processor: ImageProcessor, animation: Animation, loops: int = None,
+                        legacy_codecs=(RawCodec.name, RLECodec.name)):
+        """
+        在背景播放動畫（取代正在播放的動畫）
+        
+        Args:
+            processor: 產生動畫的處理器
+            animation: render_animation() 的結果
+            loops: 播放輪數（None 則使用 config.ANIMATION_LOOPS）
+            legacy_codecs: 舊版 FULL_UPDATE 可使用的編碼器名稱
+        """
+        self.stop_animation()
+        loops = config.ANIMATION_LOOPS if loops is None else loops
+        logger.info(f"=== 播放動畫: {len(animation.frames)} 幀, 每輪差分 {animation.payload_bytes()} bytes ===")
+        self.animation_task = asyncio.ensure_future(
+            self.play_animation(processor, animation, loops, legacy_codecs))
+        self.animation_task.add_done_callback(self._animation_done)
+    
+    @staticmethod
+    def _animation_done(task: asyncio.Task):
+        """動畫工作結束時記錄例外（背景工作的例外不會傳到呼叫端）"""
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"動畫播放失敗: {task.exception()}", exc_info=task.exception())
+    
+    def stop_animation(self):
+        """停止正在播放的動畫（發送其他畫面前呼叫）"""
+        if self.animation_task is not None and not self.animation_task.done():
+            self.animation_task.cancel()
+            logger.info("動畫已停止")
+        self.animation_task = None
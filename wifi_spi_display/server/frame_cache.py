@@ -0,0 +1,241 @@
+"""
+快取模組
+以內容雜湊為 key 的 LRU 快取，避免重複編碼相同畫面
+"""
+
+import hashlib
+import io
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from PIL import Image
+
+from image_processor import ImageProcessor, RenderParams
+
+
+def frame_digest(data: bytes) -> bytes:
+    """
+    計算畫面內容雜湊（BLAKE2b 128-bit，48000 bytes 約數十微秒）
+    
+    Args:
+        data: 畫面資料（bytes / bytearray / memoryview）
+    
+    Returns:
+        16 bytes 雜湊值
+    """
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class LRUCache:
+    """依資料大小淘汰的 LRU 快取（含命中統計）"""
+    
+    def __init__(self, max_bytes: int, max_entries: Optional[int] = None):
+        """
+        初始化
+        
+        Args:
+            max_bytes: 快取內容總大小上限 (bytes)
+            max_entries: 項目數上限（None 表示只以大小限制）
+        """
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._items = OrderedDict()  # key -> (value, size)
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key) -> Optional[Any]:
+        """
+        查詢快取（命中時移到最近使用）
+        
+        Args:
+            key: 快取 key
+        
+        Returns:
+            快取值，未命中時為 None
+        """
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[0]
+    
+    def put(self, key, value, size: int):
+        """
+        加入快取（超過上限時淘汰最久未使用的項目）
+        
+        Args:
+            key: 快取 key
+            value: 快取值
+            size: 此項目的大小 (bytes)
+        """
+        if size > self.max_bytes:
+            return  # 單一項目超過上限，不快取
+        
+        if key in self._items:
+            self.current_bytes -= self._items.pop(key)[1]
+        
+        self._items[key] = (value, size)
+        self.current_bytes += size
+        
+        while self.current_bytes > self.max_bytes or \
+              (self.max_entries is not None and len(self._items) > self.max_entries):
+            _, (_, evicted_size) = self._items.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+    
+    def clear(self):
+        """清空快取（保留統計）"""
+        self._items.clear()
+        self.current_bytes = 0
+    
+    def __len__(self):
+        return len(self._items)
+    
+    def __contains__(self, key):
+        return key in self._items
+    
+    def stats(self) -> dict:
+        """
+        取得快取統計
+        
+        Returns:
+            統計字典
+        """
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._items),
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits / lookups * 100) if lookups else 0.0,
+        }
+
+
+class PayloadCache(LRUCache):
+    """已編碼 payload 快取：key = 畫面雜湊 + 編碼參數"""
+    
+    @staticmethod
+    def make_key(digest: bytes, params: Tuple) -> Tuple:
+        """
+        組合快取 key
+        
+        Args:
+            digest: frame_digest() 的結果
+            params: 影響編碼結果的參數（編碼模式、可用編碼器、上一幀雜湊等）
+        
+        Returns:
+            快取 key
+        """
+        return (digest,) + tuple(params)
+    
+    def put_payload(self, key, codec, payload: bytes):
+        """
+        加入已編碼 payload
+        
+        Args:
+            key: make_key() 的結果
+            codec: 使用的編碼器
+            payload: 編碼後資料
+        """
+        self.put(key, (codec, payload), len(payload))
+
+
+class FrameCache(LRUCache):
+    """
+    已渲染 1-bit 畫面快取：key = 來源檔案雜湊 + 目標尺寸 + 渲染參數
+    
+    放在 ImageProcessor 前面，同一張圖片再次上傳或發送時直接取用打包好的畫面，
+    完全跳過解碼、縮放與抖動
+    """
+    
+    @staticmethod
+    def make_key(source_digest: bytes, processor: ImageProcessor, params: RenderParams) -> Tuple:
+        """
+        組合快取 key
+        
+        Args:
+            source_digest: 來源檔案內容的 frame_digest()
+            processor: ImageProcessor（提供目標尺寸、預設抖動、縮放演算法、中間圖上限與條帶高度）
+            params: RenderParams（抖動模式、裁切等）
+        
+        Returns:
+            快取 key
+        """
+        return (source_digest, processor.width, processor.height,
+                processor.dither_mode, processor.resample,
+                processor.max_intermediate_size, processor.strip_height, params)
+    
+    def render(self, processor: ImageProcessor, source: bytes,
+               params: RenderParams = RenderParams()) -> Tuple[bytes, bool]:
+        """
+        取得來源檔案渲染後的打包畫面（未命中時渲染並加入快取）
+        
+        Args:
+            processor: ImageProcessor
+            source: 圖片檔案內容
+            params: 渲染參數
+        
+        Returns:
+            (打包後的 1-bit 畫面, 是否命中快取)
+        """
+        key, frame = self.lookup(processor, source, params)
+        if frame is not None:
+            return frame, True
+        
+        frame = processor.render_packed(Image.open(io.BytesIO(source)), params)
+        self.put(key, frame, len(frame))
+        return frame, False
+    
+    def lookup(self, processor: ImageProcessor, source: bytes,
+               params: RenderParams = RenderParams()) -> Tuple[Tuple, Optional[bytes]]:
+        """
+        只查詢快取（渲染交給背景 worker 時使用，完成後以 put() 加入）
+        
+        Args:
+            processor: ImageProcessor
+            source: 圖片檔案內容
+            params: 渲染參數
+        
+        Returns:
+            (快取 key, 打包後的畫面；未命中時為 None)
+        """
+        key = self.make_key(frame_digest(source), processor, params)
+        return key, self.get(key)
+
+
+if __name__ == "__main__":
+    # 測試程式
+    print("=== Payload 快取測試 ===")
+    
+    cache = PayloadCache(max_bytes=100)
+    frame = bytes([0xFF] * 48000)
+    key = PayloadCache.make_key(frame_digest(frame), ('rle',))
+    
+    print(f"首次查詢: {cache.get(key)}")
+    cache.put_payload(key, 'rle', b'\xff\xff' * 10)
+    print(f"再次查詢命中: {cache.get(key) is not None}")
+    
+    # 超過大小上限時淘汰最舊的項目
+    for i in range(10):
+        cache.put(('filler', i), b'x' * 20, 20)
+    print(f"淘汰後: {cache.stats()}")
+    
+    print("\n=== 畫面快取測試 ===")
+    processor = ImageProcessor(800, 480)
+    frames = FrameCache(max_bytes=2 * processor.total_bytes, max_entries=2)
+    with open("CAT_800.png", 'rb') as f:
+        source = f.read()
+    
+    for attempt in range(2):
+        frame, hit = frames.render(processor, source)
+        print(f"第 {attempt + 1} 次: {len(frame)} bytes, 命中: {hit}")
+    print(f"統計: {frames.stats()}")
+    
+    print("\n測試完成！")
@@ -0,0 +1,286 @@
+"""
+畫面儲存模組
+以 mmap 讀取的 append-only 畫面檔：固定大小的打包畫面依序寫入資料檔，
+索引檔 (JSON lines) 記錄每個位置的內容雜湊與名稱
+
+- 任何歷史畫面都能以名稱 / 雜湊 / 位置 O(1) 取出，回傳 mmap 的 memoryview（不複製到 heap）
+- 內容相同的畫面只存一份
+- 畫面由作業系統的 page cache 管理，內容庫可以比 RAM 大，重啟後仍然存在
+
+使用方式:
+    python frame_store.py list frames/frames.dat
+    python frame_store.py import frames/frames.dat test_images_800x480_packed
+"""
+
+import argparse
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from frame_cache import frame_digest
+
+INDEX_SUFFIX = ".idx"
+
+
+class FrameStore:
+    """append-only 畫面檔（mmap 讀取）"""
+    
+    def __init__(self, path: str, frame_size: int = 48000, max_frames: Optional[int] = None):
+        """
+        開啟（或建立）畫面檔
+        
+        Args:
+            path: 資料檔路徑（索引檔為 path + INDEX_SUFFIX）
+            frame_size: 每個畫面的大小 (bytes)
+            max_frames: 最多存放的不同畫面數（None 表示不限制）
+        """
+        self.path = Path(path)
+        self.index_path = Path(str(path) + INDEX_SUFFIX)
+        self.frame_size = frame_size
+        self.max_frames = max_frames
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        
+        self._file = open(self.path, 'a+b')
+        self._map: Optional[mmap.mmap] = None
+        self._retired: List[mmap.mmap] = []  # 檔案變大後舊的 mmap，可能仍有 memoryview 在使用
+        self._hashes: Dict[bytes, int] = {}  # 內容雜湊 -> 位置
+        self._names: Dict[str, int] = {}     # 名稱 -> 位置
+        self._slot_names: Dict[int, str] = {}
+        
+        self._load_index()
+        self._index_file = open(self.index_path, 'a', encoding='utf-8')
+    
+    def _load_index(self):
+        """讀取索引（忽略寫到一半的最後一筆與資料檔中沒有的位置）"""
+        stored = os.path.getsize(self.path) // self.frame_size
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            lines = []
+        
+        # 最後一行寫到一半（沒有換行）時捨棄，避免之後附加的索引接在同一行
+        if lines and not lines[-1].endswith('\n'):
+            lines.pop()
+            with open(self.index_path, 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+        
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            slot = entry['slot']
+            if slot >= stored:
+                continue
+            self._hashes.setdefault(bytes.fromhex(entry['hash']), slot)
+            if entry.get('name'):
+                self._names[entry['name']] = slot
+                self._slot_names[slot] = entry['name']
+        
+        # 資料檔最後若有不完整的畫面（寫入中斷），截斷後再附加
+        self._count = max(self._hashes.values(), default=-1) + 1
+        if os.path.getsize(self.path) != self._count * self.frame_size:
+            self._file.truncate(self._count * self.frame_size)
+    
+    def __len__(self):
+        return self._count
+    
+    def __contains__(self, key):
+        return self.find(key) is not None
+    
+    def append(self, frame: bytes, name: Optional[str] = None) -> Optional[int]:
+        """
+        加入畫面（內容已存在時只更新名稱）
+        
+        Args:
+            frame: 打包後的畫面（frame_size bytes）
+            name: 名稱（同名會指向最新的畫面）
+        
+        Returns:
+            畫面位置；已存滿 max_frames 個畫面且內容是新的時為 None（不寫入）
+        """
+        if len(frame) != self.frame_size:
+            raise ValueError(f"畫面大小錯誤: 預期 {self.frame_size} bytes, 實際 {len(frame)} bytes")
+        
+        digest = frame_digest(frame)
+        slot = self._hashes.get(digest)
+        if slot is not None and (name is None or self._names.get(name) == slot):
+            return slot
+        
+        if slot is None:
+            if self.max_frames is not None and self._count >= self.max_frames:
+                return None
+            slot = self._count
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(frame)
+            self._file.flush()
+            self._hashes[digest] = slot
+            self._count += 1
+        
+        # 資料寫入後才寫索引：中斷時最多留下沒有索引的資料（下次開啟時截斷）
+        self._index_file.write(json.dumps({'slot': slot, 'hash': digest.hex(), 'name': name},
+                                          ensure_ascii=False) + '\n')
+        self._index_file.flush()
+        if name:
+            self._names[name] = slot
+            self._slot_names[slot] = name
+        return slot
+    
+    def _mapping(self) -> mmap.mmap:
+        """取得涵蓋所有畫面的 mmap（檔案變大時重新 mmap，舊的保留給仍在使用的 memoryview）"""
+        needed = self._count * self.frame_size
+        if self._map is None or len(self._map) < needed:
+            if self._map is not None:
+                # 已沒有 memoryview 在使用的舊 mmap 立即釋放，只保留關閉失敗 (BufferError) 的
+                self._retired = [mapping for mapping in self._retired + [self._map]
+                                 if not self._try_close(mapping)]
+            self._map = mmap.mmap(self._file.fileno(), needed, access=mmap.ACCESS_READ)
+        return self._map
+    
+    def get(self, slot: int) -> memoryview:
+        """
+        以位置取出畫面
+        
+        Args:
+            slot: 畫面位置（負數表示從最新往回數）
+        
+        Returns:
+            mmap 的 memoryview（唯讀，不複製）
+        """
+        if slot < 0:
+            slot += self._count
+        if not 0 <= slot < self._count:
+            raise IndexError(f"畫面位置超出範圍: {slot} (共 {self._count} 個)")
+        
+        offset = slot * self.frame_size
+        return memoryview(self._mapping())[offset:offset + self.frame_size]
+    
+    def find(self, key: Union[int, str, bytes]) -> Optional[int]:
+        """
+        查詢畫面位置
+        
+        Args:
+            key: 位置 (int)、名稱、雜湊 (bytes) 或雜湊的十六進位前綴（至少 8 字元）
+        
+        Returns:
+            畫面位置，找不到時為 None
+        """
+        if isinstance(key, int):
+            return key % self._count if -self._count <= key < self._count else None
+        if isinstance(key, bytes):
+            return self._hashes.get(key)
+        if key in self._names:
+            return self._names[key]
+        if len(key) >= 8:
+            matches = [slot for digest, slot in self._hashes.items() if digest.hex().startswith(key)]
+            if len(matches) == 1:
+                return matches[0]
+        return None
+    
+    def lookup(self, key: Union[int, str, bytes]) -> Optional[memoryview]:
+        """
+        以位置 / 名稱 / 雜湊取出畫面
+        
+        Args:
+            key: 見 find()
+        
+        Returns:
+            mmap 的 memoryview，找不到時為 None
+        """
+        slot = self.find(key)
+        return None if slot is None else self.get(slot)
+    
+    def entries(self) -> Iterator[Tuple[int, str, Optional[str]]]:
+        """
+        列出所有畫面
+        
+        Yields:
+            (位置, 雜湊十六進位, 名稱)
+        """
+        for digest, slot in sorted(self._hashes.items(), key=lambda item: item[1]):
+            yield slot, digest.hex(), self._slot_names.get(slot)
+    
+    def stats(self) -> dict:
+        """
+        取得統計
+        
+        Returns:
+            統計字典
+        """
+        return {
+            'frames': self._count,
+            'names': len(self._names),
+            'bytes': self._count * self.frame_size,
+            'path': str(self.path),
+        }
+    
+    @staticmethod
+    def _try_close(mapping: mmap.mmap) -> bool:
+        """
+        關閉 mmap
+        
+        Returns:
+            是否已關閉（仍有 memoryview 在使用時為 False）
+        """
+        try:
+            mapping.close()
+        except BufferError:
+            return False
+        return True
+    
+    def close(self):
+        """關閉檔案（仍在使用的 memoryview 會讓 mmap 留到被回收為止）"""
+        for mapping in self._retired + ([self._map] if self._map is not None else []):
+            self._try_close(mapping)
+        self._retired = []
+        self._map = None
+        self._index_file.close()
+        self._file.close()
+
+
+def import_packed(store: FrameStore, packed_dir: str) -> int:
+    """
+    匯入 batch_convert.py 的輸出（依 manifest 以來源路徑為名稱）
+    
+    Args:
+        store: 畫面檔
+        packed_dir: batch_convert.py 的輸出資料夾
+    
+    Returns:
+        匯入的畫面數
+    """
+    from batch_convert import PACKED_SUFFIX, load_manifest
+    
+    manifest = load_manifest(Path(packed_dir))
+    for name in manifest['frames']:
+        with open(Path(packed_dir) / (name + PACKED_SUFFIX), 'rb') as f:
+            store.append(f.read(), name)
+    return len(manifest['frames'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="畫面儲存檔工具")
+    parser.add_argument('action', choices=('list', 'import'), help="list: 列出畫面；import: 匯入 batch_convert 輸出")
+    parser.add_argument('store', help="畫面檔路徑")
+    parser.add_argument('packed_dir', nargs='?', help="batch_convert.py 的輸出資料夾（import 使用）")
+    parser.add_argument('--frame-size', type=int, default=48000, help="畫面大小 (bytes)")
+    args = parser.parse_args()
+    
+    store = FrameStore(args.store, args.frame_size)
+    if args.action == 'import':
+        if not args.packed_dir:
+            parser.error("import 需要指定 batch_convert.py 的輸出資料夾")
+        count = import_packed(store, args.packed_dir)
+        print(f"匯入 {count} 個畫面")
+    
+    for slot, digest, name in store.entries():
+        print(f"  {slot:5d}  {digest[:16]}  {name or ''}")
+    print(f"統計: {store.stats()}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,53 +3,780 @@
 負責將圖片轉換為 1-bit 黑白格式，適合電子紙顯示
 """
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import ExifTags, Image, ImageDraw, ImageFont, ImageOps
 import numpy as np
-from typing import Tuple
+import functools
+import math
+import os
+import re
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+
+# 系統字體候選（依序嘗試，只在第一次使用時檢查一次）
+SYSTEM_FONT_CANDIDATES = (
+    "c:/windows/fonts/msjh.ttc",                          # Windows
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",    # Linux
+)
+
+# 量測文字用的暫存畫布（'1' 模式，與實際繪製的字形模式相同）
+_MEASURE_DRAW = ImageDraw.Draw(Image.new('1', (1, 1)))
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_system_font() -> Optional[str]:
+    """
+    找出可用的系統字體（結果快取，之後不再存取磁碟）
+    
+    Returns:
+        字體檔案路徑，找不到時為 None（使用 PIL 預設字體）
+    """
+    for path in SYSTEM_FONT_CANDIDATES:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+@functools.lru_cache(maxsize=16)
+def load_font(font_path: Optional[str], font_size: int):
+    """
+    載入字體（以路徑與大小快取）
+    
+    Args:
+        font_path: 字體檔案路徑（None 則使用系統字體）
+        font_size: 字體大小
+        
+    Returns:
+        PIL 字體物件
+    """
+    path = font_path or resolve_system_font()
+    if path is None:
+        return ImageFont.load_default()
+    
+    try:
+        return ImageFont.truetype(path, font_size)
+    except OSError as e:
+        print(f"載入字體失敗，使用預設字體: {e}")
+        return ImageFont.load_default()
+
+
+@functools.lru_cache(maxsize=4096)
+def text_bbox(text: str, font_path: Optional[str], font_size: int) -> Tuple[int, int, int, int]:
+    """
+    量測文字邊界（以 文字、字體、大小 快取，支援多行）
+    
+    Args:
+        text: 文字
+        font_path: 字體檔案路徑（None 則使用系統字體）
+        font_size: 字體大小
+        
+    Returns:
+        (left, top, right, bottom)
+    """
+    return _MEASURE_DRAW.textbbox((0, 0), text, font=load_font(font_path, font_size))
+
+
+# 中日韓文字不以空白分詞，每個字都可以斷行
+_CJK = '\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef'
+_TOKEN_PATTERN = re.compile(f'(\\s*)([{_CJK}]|[^\\s{_CJK}]+)')
+
+
+class TextLayout(NamedTuple):
+    """自動排版結果"""
+    font_size: int
+    lines: Tuple[str, ...]
+    line_widths: Tuple[float, ...]
+    line_height: int    # 含行距
+    spacing: int        # 行距
+
+
+@functools.lru_cache(maxsize=8192)
+def text_width(text: str, font_path: Optional[str], font_size: int) -> float:
+    """
+    量測單字（或單一中文字）的前進寬度（以 字體、大小、單字 快取）
+    
+    Args:
+        text: 單字
+        font_path: 字體檔案路徑（None 則使用系統字體）
+        font_size: 字體大小
+        
+    Returns:
+        寬度（像素）
+    """
+    return load_font(font_path, font_size).getlength(text)
+
+
+@functools.lru_cache(maxsize=64)
+def line_height(font_path: Optional[str], font_size: int) -> int:
+    """
+    單行高度（ascent + descent）
+    
+    Args:
+        font_path: 字體檔案路徑（None 則使用系統字體）
+        font_size: 字體大小
+        
+    Returns:
+        高度（像素）
+    """
+    font = load_font(font_path, font_size)
+    if hasattr(font, 'getmetrics'):
+        ascent, descent = font.getmetrics()
+        return ascent + descent
+    return text_bbox("Ag", font_path, font_size)[3]
+
+
+def wrap_text(text: str, max_width: float, font_path: Optional[str] = None,
+              font_size: int = 48) -> List[Tuple[str, float]]:
+    """
+    依寬度自動換行（英文以單字、中文以字為單位，保留原有的換行）
+    
+    Args:
+        text: 文字
+        max_width: 最大行寬（像素）
+        font_path: 字體檔案路徑（None 則使用系統字體）
+        font_size: 字體大小
+        
+    Returns:
+        [(行文字, 行寬), ...]
+    """
+    space = text_width(' ', font_path, font_size)
+    lines = []
+    
+    for paragraph in text.split('\n'):
+        line, width = '', 0.0
+        for match in _TOKEN_PATTERN.finditer(paragraph):
+            gap = space if (match.group(1) and line) else 0.0
+            token = match.group(2)
+            token_width = text_width(token, font_path, font_size)
+            
+            if line and width + gap + token_width > max_width:
+                lines.append((line, width))
+                line, width, gap = '', 0.0, 0.0
+            
+            if token_width > max_width:
+                # 單字本身超過行寬：逐字斷開
+                for char in token:
+                    char_width = text_width(char, font_path, font_size)
+                    if line and width + gap + char_width > max_width:
+                        lines.append((line, width))
+                        line, width, gap = '', 0.0, 0.0
+                    line += ' ' * bool(gap) + char
+                    width += gap + char_width
+                    gap = 0.0
+                continue
+            
+            line += ' ' * bool(gap) + token
+            width += gap + token_width
+        lines.append((line, width))
+    
+    return lines
+
+
+@functools.lru_cache(maxsize=256)
+def fit_text(text: str, width: int, height: int, font_path: Optional[str] = None,
+             max_font_size: int = 96, min_font_size: int = 10,
+             line_spacing: float = 0.2) -> TextLayout:
+    """
+    二分搜尋能放入 width x height 的最大字體並排版（結果快取）
+    
+    Args:
+        text: 文字（可含換行）
+        width: 可用寬度（像素）
+        height: 可用高度（像素）
+        font_path: 字體檔案路徑（None 則使用系統字體）
+        max_font_size: 最大字體大小
+        min_font_size: 最小字體大小（仍放不下時以此大小輸出，超出部分會被裁切）
+        line_spacing: 行距（字體大小的倍數）
+        
+    Returns:
+        TextLayout
+    """
+    def layout(size: int) -> TextLayout:
+        lines = wrap_text(text, width, font_path, size)
+        spacing = round(size * line_spacing)
+        return TextLayout(size, tuple(line for line, _ in lines), tuple(w for _, w in lines),
+                          line_height(font_path, size) + spacing, spacing)
+    
+    def fits(result: TextLayout) -> bool:
+        block_height = len(result.lines) * result.line_height - result.spacing
+        return block_height <= height and max(result.line_widths) <= width
+    
+    best = layout(min_font_size)
+    low, high = min_font_size + 1, max_font_size
+    while low <= high:
+        size = (low + high) // 2
+        result = layout(size)
+        if fits(result):
+            best, low = result, size + 1
+        else:
+            high = size - 1
+    return best
+
+
+class RenderParams(NamedTuple):
+    """影響 render_packed() 輸出的參數"""
+    dither_mode: Optional[str] = None   # None 使用處理器預設值，'none' 直接二值化
+    detect_bilevel: bool = False        # 來源已是黑白（文字截圖、QR code、線稿）時改用最近鄰縮放 + 二值化
+    crop: Optional[Tuple[int, int, int, int]] = None  # 來源裁切範圍 (x, y, 寬, 高)，為套用 EXIF 方向後的座標
+    fit: str = 'stretch'                # 裁切範圍放入畫面的方式（見 ImageProcessor.FIT_MODES）
+    rotate: int = 0                     # 順時針旋轉角度；90 / 270 時先放入直向畫面再旋轉
 
 
 class ImageProcessor:
     """圖像處理器，用於電子紙顯示"""
     
-    def __init__(self, width: int = 400, height: int = 240):
+    # 抖動演算法
+    # floyd-steinberg: PIL 內建誤差擴散（品質最佳）
+    # atkinson: 誤差只擴散 3/4，對比較高（NumPy 波前向量化）
+    # bayer4 / bayer8: 有序抖動，完全向量化，成本接近直接二值化
+    # none: 直接二值化
+    DITHER_MODES = ('floyd-steinberg', 'atkinson', 'bayer4', 'bayer8', 'none')
+    
+    # 誤差擴散核心: (dx, dy, 權重)
+    FLOYD_STEINBERG_KERNEL = ((1, 0, 7 / 16), (-1, 1, 3 / 16), (0, 1, 5 / 16), (1, 1, 1 / 16))
+    ATKINSON_KERNEL = ((1, 0, 1 / 8), (2, 0, 1 / 8), (-1, 1, 1 / 8),
+                       (0, 1, 1 / 8), (1, 1, 1 / 8), (0, 2, 1 / 8))
+    
+    # 最終縮放濾波器
+    RESAMPLE_FILTERS = {
+        'LANCZOS': Image.Resampling.LANCZOS,
+        'BICUBIC': Image.Resampling.BICUBIC,
+        'BILINEAR': Image.Resampling.BILINEAR,
+        'NEAREST': Image.Resampling.NEAREST,
+    }
+    
+    # reduce() 預縮後保留的倍數，讓最終濾波器仍有足夠取樣做抗鋸齒
+    REDUCING_GAP = 2
+    
+    # 各濾波器的取樣半徑（來源像素，縮小時再乘上縮放倍率），條帶模式據此多取邊緣列
+    FILTER_SUPPORT = {
+        Image.Resampling.LANCZOS: 3.0,
+        Image.Resampling.BICUBIC: 2.0,
+        Image.Resampling.BILINEAR: 1.0,
+        Image.Resampling.NEAREST: 0.5,
+    }
+    
+    # 舊版分區高度：3 個 800×160 條帶（TILE_UPDATE 以索引 0~2 表示位置）
+    LEGACY_TILE_HEIGHT = 160
+    
+    # 裁切範圍放入畫面的方式
+    # stretch: 拉伸填滿（不保持比例）
+    # contain: 保持比例完整放入，空白處為白色
+    # cover: 保持比例填滿，超出的部分從中央裁掉
+    FIT_MODES = ('stretch', 'contain', 'cover')
+    
+    # 順時針旋轉角度 → transpose（PIL 的 ROTATE_* 為逆時針）
+    ROTATIONS = {
+        0: None,
+        90: Image.Transpose.ROTATE_270,
+        180: Image.Transpose.ROTATE_180,
+        270: Image.Transpose.ROTATE_90,
+    }
+    
+    # 黑白來源偵測：預覽圖最長邊、兩端各視為黑 / 白的灰階數、兩端需占的像素比例
+    # （容許反鋸齒邊緣與 JPEG 雜訊）
+    BILEVEL_PREVIEW_SIZE = 256
+    BILEVEL_MARGIN = 64
+    BILEVEL_RATIO = 0.92
+    
+    def __init__(self, width: int = 400, height: int = 240, dither_mode: str = 'floyd-steinberg',
+                 resample: str = 'LANCZOS', max_intermediate_size: int = None,
+                 strip_height: int = None):
         """
         初始化圖像處理器
         
         Args:
             width: 顯示器寬度（像素）- 預設 400x240 以適應 ESP8266 記憶體限制
             height: 顯示器高度（像素）
+            dither_mode: 預設抖動演算法（見 DITHER_MODES）
+            resample: 最終縮放濾波器（見 RESAMPLE_FILTERS）
+            max_intermediate_size: 中間圖像的最大邊長（None 表示不限制）
+            strip_height: 設定時 render_packed() 以此高度的水平條帶處理（見 iter_packed_strips()）
         """
+        if dither_mode not in self.DITHER_MODES:
+            raise ValueError(f"未知的抖動演算法: {dither_mode}")
+        if resample.upper() not in self.RESAMPLE_FILTERS:
+            raise ValueError(f"未知的縮放演算法: {resample}")
+        
         self.width = width
         self.height = height
         self.total_pixels = width * height
         self.total_bytes = self.total_pixels // 8  # 1-bit，8 pixels per byte
+        self.dither_mode = dither_mode
+        self.resample = self.RESAMPLE_FILTERS[resample.upper()]
+        self.max_intermediate_size = max_intermediate_size
+        self.strip_height = strip_height
+    
+    def reduce_factors(self, size: Tuple[int, int], target: Tuple[int, int] = None) -> Tuple[int, int]:
+        """
+        計算 reduce() 的整數縮小倍數
+        
+        預設保留 REDUCING_GAP 倍的目標解析度給最終濾波器；
+        若中間圖像仍超過 max_intermediate_size，則加大倍數（但不小於目標尺寸）
         
-    def convert_to_1bit(self, image: Image.Image, dither: bool = True) -> Image.Image:
+        Args:
+            size: 來源尺寸 (寬, 高)
+            target: 縮放後尺寸（None 則為畫面尺寸）
+            
+        Returns:
+            (x 倍數, y 倍數)，1 表示不縮小
+        """
+        factors = []
+        for source, target in zip(size, target or (self.width, self.height)):
+            factor = max(1, source // (target * self.REDUCING_GAP))
+            if self.max_intermediate_size:
+                factor = max(factor, -(-source // self.max_intermediate_size))
+            factors.append(max(1, min(factor, source // target)))
+        return tuple(factors)
+    
+    def fit_layout(self, size: Tuple[int, int], params: RenderParams = RenderParams()):
+        """
+        計算裁切、縮放與旋轉的幾何
+        
+        Args:
+            size: 來源尺寸 (寬, 高)，為套用 EXIF 方向後的尺寸
+            params: 渲染參數（crop / fit / rotate）
+            
+        Returns:
+            (來源範圍 (left, top, right, bottom), 縮放後尺寸, 旋轉前的畫面尺寸)
+        """
+        if params.fit not in self.FIT_MODES:
+            raise ValueError(f"未知的放入方式: {params.fit}")
+        if params.rotate not in self.ROTATIONS:
+            raise ValueError(f"不支援的旋轉角度: {params.rotate}")
+        
+        frame = (self.height, self.width) if params.rotate in (90, 270) else (self.width, self.height)
+        
+        left, top, width, height = params.crop or (0, 0) + tuple(size)
+        left, top = min(max(0, left), size[0] - 1), min(max(0, top), size[1] - 1)
+        width, height = max(1, min(width, size[0] - left)), max(1, min(height, size[1] - top))
+        
+        content = frame
+        if params.fit == 'contain':
+            scale = min(frame[0] / width, frame[1] / height)
+            content = (max(1, min(frame[0], round(width * scale))), max(1, min(frame[1], round(height * scale))))
+        elif params.fit == 'cover':
+            scale = max(frame[0] / width, frame[1] / height)
+            left += (width - frame[0] / scale) / 2
+            top += (height - frame[1] / scale) / 2
+            width, height = frame[0] / scale, frame[1] / scale
+        
+        return (left, top, left + width, top + height), content, frame
+    
+    def prepare(self, image: Image.Image, params: RenderParams = RenderParams()):
+        """
+        以 draft() 縮小解碼並套用 EXIF 方向，計算解碼後座標的幾何
+        
+        JPEG 只解碼到裁切範圍仍不小於縮放後尺寸的 DCT 倍率（1/2、1/4、1/8）；
+        指定 crop 時套用 EXIF 方向（瀏覽器顯示與裁切時已套用）
+        
+        Args:
+            image: 輸入圖片（尚未 load() 的 JPEG 可以使用 draft）
+            params: 渲染參數
+            
+        Returns:
+            (圖片, 來源範圍, 縮放後尺寸, 旋轉前的畫面尺寸)，見 fit_layout()
+        """
+        orientation = image.getexif().get(ExifTags.Base.Orientation, 1) if params.crop else 1
+        transposed = orientation in (5, 6, 7, 8)
+        size = image.size[::-1] if transposed else image.size
+        (left, top, right, bottom), content, frame = self.fit_layout(size, params)
+        
+        # draft 只對尚未解碼的 JPEG 有效，其他格式會直接忽略
+        needed = (math.ceil(round(size[0] * content[0] / (right - left), 6)),
+                  math.ceil(round(size[1] * content[1] / (bottom - top), 6)))
+        image.draft('L', needed[::-1] if transposed else needed)
+        if orientation != 1:
+            image = ImageOps.exif_transpose(image)
+        
+        scale_x, scale_y = image.width / size[0], image.height / size[1]
+        box = (left * scale_x, top * scale_y, right * scale_x, bottom * scale_y)
+        return image, box, content, frame
+    
+    def place(self, image: Image.Image, params: RenderParams, frame: Tuple[int, int]) -> Image.Image:
+        """
+        將縮放後的圖片置中放入畫面（空白處為白色）並旋轉
+        
+        Args:
+            image: 縮放後的 'L' 圖片
+            params: 渲染參數
+            frame: 旋轉前的畫面尺寸
+            
+        Returns:
+            目標尺寸的圖片
+        """
+        if image.size != frame:
+            canvas = Image.new('L', frame, 255)
+            canvas.paste(image, ((frame[0] - image.width) // 2, (frame[1] - image.height) // 2))
+            image = canvas
+        if self.ROTATIONS[params.rotate] is not None:
+            image = image.transpose(self.ROTATIONS[params.rotate])
+        return image
+    
+    def resize_to_target(self, image: Image.Image, params: RenderParams = RenderParams()) -> Image.Image:
+        """
+        將圖片縮放為目標尺寸的灰階圖
+        
+        1. JPEG 以 draft() 在解碼時直接做 DCT 縮小（1/2、1/4、1/8）
+        2. 只保留裁切範圍，再轉灰階，之後的縮放只需處理單一通道
+        3. reduce() 以整數倍數做區塊平均
+        4. 最終濾波器縮放到目標尺寸，依 fit / rotate 放入畫面
+        
+        Args:
+            image: 輸入圖片（尚未 load() 的 JPEG 可以使用 draft）
+            params: 渲染參數（crop / fit / rotate）
+            
+        Returns:
+            'L' 模式、目標尺寸的圖片
+        """
+        return self._resize_prepared(*self.prepare(image, params), params)
+    
+    def _resize_prepared(self, image: Image.Image, box: Tuple[float, float, float, float],
+                         content: Tuple[int, int], frame: Tuple[int, int], params: RenderParams) -> Image.Image:
+        """resize_to_target() 在 prepare() 之後的步驟"""
+        # 先以整數範圍裁切，小數部分交給最終縮放的 box
+        left, top, right, bottom = box
+        crop = (int(left), int(top), min(image.width, math.ceil(right)), min(image.height, math.ceil(bottom)))
+        cropped = crop != (0, 0) + image.size
+        if cropped:
+            image = image.crop(crop)
+            box = (left - crop[0], top - crop[1], right - crop[0], bottom - crop[1])
+        
+        if image.mode != 'L':
+            image = image.convert('L')
+        
+        if image.size != content or cropped:
+            factors = self.reduce_factors(image.size, content)
+            if factors != (1, 1):
+                image = image.reduce(factors)
+                box = (box[0] / factors[0], box[1] / factors[1], box[2] / factors[0], box[3] / factors[1])
+            image = image.resize(content, self.resample, box=box if cropped else None)
+        
+        return self.place(image, params, frame)
+        
+    def convert_to_1bit(self, image: Image.Image, dither: bool = True,
+                        dither_mode: str = None) -> Image.Image:
         """
         將圖片轉換為 1-bit 黑白格式
         
         Args:
             image: 輸入圖片
             dither: 是否使用抖動演算法（提升顯示品質）
+            dither_mode: 抖動演算法（None 則使用 self.dither_mode）
             
         Returns:
             1-bit 黑白圖片
         """
-        # 縮放到目標尺寸
-        image = image.resize((self.width, self.height), Image.Resampling.LANCZOS)
-        
-        # 轉換為灰階
-        image = image.convert('L')
+        # 縮放到目標尺寸並轉換為灰階
+        image = self.resize_to_target(image)
         
         # 轉換為 1-bit（黑白）
-        if dither:
-            # 使用 Floyd-Steinberg 抖動演算法
-            image = image.convert('1', dither=Image.Dither.FLOYDSTEINBERG)
+        return self.dither(image, (dither_mode or self.dither_mode) if dither else 'none')
+    
+    def is_bilevel(self, image: Image.Image, box: Tuple[float, float, float, float] = None) -> bool:
+        """
+        判斷圖片是否已接近黑白（文字截圖、QR code、線稿）
+        
+        以最近鄰縮小的預覽圖做灰階直方圖，黑白兩端的像素占 BILEVEL_RATIO 以上即視為黑白
+        
+        Args:
+            image: 輸入圖片（JPEG 應先經 prepare() 縮小解碼）
+            box: 只分析此範圍 (left, top, right, bottom)，None 則為整張
+            
+        Returns:
+            是否為黑白圖片
+        """
+        box = box or (0, 0) + image.size
+        width, height = box[2] - box[0], box[3] - box[1]
+        scale = min(1, self.BILEVEL_PREVIEW_SIZE / max(width, height))
+        preview = image.resize((max(1, round(width * scale)), max(1, round(height * scale))),
+                               Image.Resampling.NEAREST, box=box)
+        if preview.mode != 'L':
+            preview = preview.convert('L')
+        
+        histogram = np.bincount(np.asarray(preview, dtype=np.uint8).ravel(), minlength=256)
+        extremes = histogram[:self.BILEVEL_MARGIN].sum() + histogram[-self.BILEVEL_MARGIN:].sum()
+        return extremes >= self.BILEVEL_RATIO * histogram.sum()
+    
+    def render_path(self, image: Image.Image, params: RenderParams = RenderParams(),
+                    box: Tuple[float, float, float, float] = None) -> str:
+        """
+        選擇 render_packed() 的處理方式
+        
+        Args:
+            image: 輸入圖片
+            params: 渲染參數
+            box: 實際使用的來源範圍（見 prepare()）
+            
+        Returns:
+            'bilevel'（最近鄰縮放 + 二值化）或抖動演算法名稱
+        """
+        if params.detect_bilevel and self.is_bilevel(image, box):
+            return 'bilevel'
+        return params.dither_mode or self.dither_mode
+    
+    def render_packed(self, image: Image.Image, params: RenderParams = RenderParams()) -> bytes:
+        """
+        一次完成 解碼 → 縮放 → 灰階 → 抖動 → 打包，直接產生傳輸用資料
+        
+        與 convert_to_1bit() + image_to_bytes() 結果相同，但省去中間的
+        1-bit 圖片與 uint8 暫存陣列：灰階圖直接以 bool 陣列抖動或二值化，
+        再一次 packbits（MSB first、白色 = 1）
+        
+        Args:
+            image: 輸入圖片
+            params: 渲染參數
+            
+        Returns:
+            打包後的 1-bit 資料（800x480 為 48000 bytes）
+        """
+        return self.render_packed_info(image, params)[0]
+    
+    def render_packed_info(self, image: Image.Image,
+                           params: RenderParams = RenderParams()) -> Tuple[bytes, str]:
+        """
+        同 render_packed()，並回傳實際使用的處理方式（見 render_path()）
+        
+        params.detect_bilevel 開啟且來源已是黑白時，以最近鄰縮放後直接二值化，
+        保留銳利邊緣並跳過濾波縮放與抖動
+        
+        Args:
+            image: 輸入圖片
+            params: 渲染參數
+            
+        Returns:
+            (打包後的 1-bit 資料, 處理方式)
+        """
+        image, box, content, frame = self.prepare(image, params)
+        mode = self.render_path(image, params, box)
+        
+        if mode == 'bilevel':
+            # 最近鄰縮放只取樣目標像素：先縮放再轉灰階，不產生來源尺寸的中間圖（低記憶體模式也適用）
+            gray = image.resize(content, Image.Resampling.NEAREST, box=box)
+            if gray.mode != 'L':
+                gray = gray.convert('L')
+            gray = self.place(gray, params, frame)
+            return np.packbits(np.asarray(gray, dtype=np.uint8) >= 128, axis=1).tobytes(), mode
+        
+        if self.strip_height and content == frame and not params.rotate:
+            # 條帶渲染：逐條帶產生，最後一次組合成完整畫面（裁切範圍先以整數座標取出）
+            if box != (0, 0) + image.size:
+                image = image.crop(tuple(round(value) for value in box))
+            strips = self.iter_packed_strips(image, params._replace(dither_mode=mode), self.strip_height)
+            return b''.join(data for _, data in strips), mode
+        
+        gray = self._resize_prepared(image, box, content, frame, params)
+        
+        if mode == 'floyd-steinberg':
+            # PIL 的 C 實作最快，輸出的 '1' 圖片可零複製轉為 bool 陣列
+            return self.image_to_bytes(self.dither(gray, mode)), mode
+        
+        pixels = np.asarray(gray, dtype=np.uint8)
+        if mode == 'none':
+            # 與 PIL convert('1', dither=NONE) 相同的門檻
+            white = pixels >= 128
         else:
+            white = self.dither_array(pixels, mode)
+        return np.packbits(white, axis=1).tobytes(), mode
+    
+    def iter_packed_strips(self, image: Image.Image, params: RenderParams = RenderParams(),
+                           strip_height: int = 30) -> Iterator[Tuple[int, bytes]]:
+        """
+        以水平條帶渲染
+        
+        每個條帶只處理其所需的來源列（含濾波器取樣邊緣）：裁切 → 灰階 → reduce →
+        縮放 → 抖動 → 打包，不會同時持有整張灰階、縮小、縮放與 1-bit 中間圖。
+        來源圖仍需整張解碼（JPEG 會先以 draft 縮小），峰值記憶體仍隨來源尺寸增加，
+        省下的只有中間圖。
+        
+        誤差擴散（floyd-steinberg / atkinson）以 NumPy 波前實作，並把溢出到下一條帶的
+        誤差列 (carry) 帶到下一條帶，結果與整張圖一次擴散相同；
+        PIL 的 Floyd-Steinberg 無法接續誤差，因此此模式下不使用（約慢 10 倍以上）
+        
+        Args:
+            image: 輸入圖片
+            params: 渲染參數
+            strip_height: 條帶高度（列）
+            
+        Yields:
+            (起始列, 打包後的條帶資料)
+        """
+        mode = params.dither_mode or self.dither_mode
+        kernel = {
+            'floyd-steinberg': self.FLOYD_STEINBERG_KERNEL,
+            'atkinson': self.ATKINSON_KERNEL,
+        }.get(mode)
+        if kernel is None and mode not in self.DITHER_MODES:
+            raise ValueError(f"未知的抖動演算法: {mode}")
+        
+        image.draft('L', (self.width, self.height))
+        source_width, source_height = image.size
+        factor_x, factor_y = self.reduce_factors(image.size)
+        reduced_width = -(-source_width // factor_x)
+        reduced_height = -(-source_height // factor_y)
+        scale = reduced_height / self.height
+        margin = math.ceil(self.FILTER_SUPPORT[self.resample] * max(scale, 1.0)) + 1
+        
+        carry = None
+        if kernel is not None:
+            carry = np.zeros((max(dy for _, dy, _ in kernel), self.width), dtype=np.float32)
+        
+        for y0 in range(0, self.height, strip_height):
+            y1 = min(self.height, y0 + strip_height)
+            
+            # 此條帶需要的 reduce 後列範圍（含濾波器邊緣），對應回來源列時對齊 reduce 倍數
+            top, bottom = y0 * scale, y1 * scale
+            r0 = max(0, math.floor(top) - margin)
+            r1 = min(reduced_height, math.ceil(bottom) + margin)
+            piece = image.crop((0, r0 * factor_y, source_width, min(source_height, r1 * factor_y)))
+            
+            if piece.mode != 'L':
+                piece = piece.convert('L')
+            if (factor_x, factor_y) != (1, 1):
+                piece = piece.reduce((factor_x, factor_y))
+            
+            if (reduced_width, reduced_height) == (self.width, self.height):
+                gray = piece.crop((0, y0 - r0, self.width, y1 - r0))
+            else:
+                gray = piece.resize((self.width, y1 - y0), self.resample,
+                                    box=(0, top - r0, reduced_width, bottom - r0))
+            
+            pixels = np.asarray(gray, dtype=np.uint8)
+            if kernel is not None:
+                white = self.error_diffusion(pixels, kernel, carry)
+            elif mode == 'none':
+                white = pixels >= 128
+            else:
+                white = self.ordered_dither(pixels, 4 if mode == 'bayer4' else 8, y_offset=y0)
+            
+            yield y0, np.packbits(white, axis=1).tobytes()
+    
+    def dither(self, gray: Image.Image, mode: str) -> Image.Image:
+        """
+        將灰階圖片以指定演算法轉為 1-bit
+        
+        Args:
+            gray: 'L' 模式圖片
+            mode: 抖動演算法（見 DITHER_MODES）
+            
+        Returns:
+            1-bit 黑白圖片
+        """
+        if mode == 'floyd-steinberg':
+            # 使用 Floyd-Steinberg 抖動演算法
+            return gray.convert('1', dither=Image.Dither.FLOYDSTEINBERG)
+        if mode == 'none':
             # 直接二值化
-            image = image.convert('1', dither=Image.Dither.NONE)
+            return gray.convert('1', dither=Image.Dither.NONE)
         
-        return image
+        return Image.fromarray(self.dither_array(np.asarray(gray, dtype=np.uint8), mode))
+    
+    def dither_array(self, pixels: np.ndarray, mode: str) -> np.ndarray:
+        """
+        以 NumPy 實作的抖動演算法
+        
+        Args:
+            pixels: uint8 灰階陣列 (H, W)
+            mode: 'bayer4' / 'bayer8' / 'atkinson'
+            
+        Returns:
+            bool 陣列，True = 白色
+        """
+        if mode == 'bayer4':
+            return self.ordered_dither(pixels, 4)
+        if mode == 'bayer8':
+            return self.ordered_dither(pixels, 8)
+        if mode == 'atkinson':
+            return self.error_diffusion(pixels, self.ATKINSON_KERNEL)
+        raise ValueError(f"未知的抖動演算法: {mode}")
+    
+    @staticmethod
+    def bayer_matrix(n: int) -> np.ndarray:
+        """
+        產生 n×n Bayer 門檻矩陣（n 為 2 的次方）
+        
+        Args:
+            n: 矩陣大小
+            
+        Returns:
+            0 ~ n*n-1 的整數矩陣
+        """
+        matrix = np.zeros((1, 1), dtype=np.int32)
+        while matrix.shape[0] < n:
+            matrix = np.block([[4 * matrix, 4 * matrix + 2],
+                               [4 * matrix + 3, 4 * matrix + 1]])
+        return matrix
+    
+    @staticmethod
+    def ordered_dither(pixels: np.ndarray, n: int = 8, y_offset: int = 0) -> np.ndarray:
+        """
+        有序抖動（Bayer 門檻矩陣，完全向量化）
+        
+        Args:
+            pixels: uint8 灰階陣列 (H, W)
+            n: Bayer 矩陣大小（4 或 8）
+            y_offset: pixels 第一列在整張圖中的列號（條帶處理時保持矩陣相位）
+            
+        Returns:
+            bool 陣列，True = 白色
+        """
+        # 門檻值落在 (0, 255) 之間，避免純黑 / 純白被抖動
+        threshold = ((ImageProcessor.bayer_matrix(n) + 0.5) * (255 / (n * n))).astype(np.float32)
+        height, width = pixels.shape
+        phase = y_offset % n
+        tiled = np.tile(threshold, ((phase + height + n - 1) // n, (width + n - 1) // n))
+        return pixels > tiled[phase:phase + height, :width]
+    
+    @staticmethod
+    def error_diffusion(pixels: np.ndarray, kernel, carry: np.ndarray = None) -> np.ndarray:
+        """
+        誤差擴散抖動（以 t = x + 2y 的波前平行處理）
+        
+        同一條波前上的像素彼此獨立（核心只往右、往下擴散，且 dx ≥ -1 時
+        2*dy + dx > 0），因此每條波前可以一次用 NumPy 處理，
+        總步數為 W + 2H 而不是 W * H
+        
+        Args:
+            pixels: uint8 灰階陣列 (H, W)
+            kernel: ((dx, dy, 權重), ...)
+            carry: 由上一段累積、要加到前幾列的誤差 (k, W)，k 為核心最大 dy（可選，會就地更新為本段溢出的誤差）
+            
+        Returns:
+            bool 陣列，True = 白色
+        """
+        height, width = pixels.shape
+        max_dy = max(dy for _, dy, _ in kernel)
+        pad_left = max(0, -min(dx for dx, _, _ in kernel))
+        pad_right = max(0, max(dx for dx, _, _ in kernel))
+        stride = width + pad_left + pad_right
+        
+        buf = np.zeros((height + max_dy, stride), dtype=np.float32)
+        buf[:height, pad_left:pad_left + width] = pixels
+        if carry is not None:
+            buf[:max_dy, pad_left:pad_left + width] += carry
+        flat = buf.ravel()
+        white = np.zeros(height * width, dtype=bool)
+        
+        offsets = [(dy * stride + dx, weight) for dx, dy, weight in kernel]
+        rows = np.arange(height)
+        
+        for t in range(width + 2 * (height - 1)):
+            # 此波前上的列: 0 ≤ x = t - 2y < width
+            ys = rows[max(0, (t - width) // 2 + 1):min(height - 1, t // 2) + 1]
+            xs = t - 2 * ys
+            index = ys * stride + xs + pad_left
+            
+            value = flat[index]
+            is_white = value >= 128
+            error = value - np.where(is_white, 255.0, 0.0)
+            white[ys * width + xs] = is_white
+            
+            for offset, weight in offsets:
+                flat[index + offset] += error * weight
+        
+        if carry is not None:
+            carry[:] = buf[height:, pad_left:pad_left + width]
+        
+        return white.reshape(height, width)
     
     def image_to_bytes(self, image: Image.Image) -> bytes:
         """
@@ -66,17 +793,12 @@ class ImageProcessor:
             image = image.convert('1')
         
         # 取得像素資料
-        pixels = np.array(image, dtype=np.uint8)
-        
-        # 打包為 1-bit（8 pixels per byte）
-        # PIL 的 '1' 模式：0=黑，255=白
-        # 不反轉，直接使用：白色(255)變成1，黑色(0)變成0
-        pixels = (pixels > 0).astype(np.uint8)  # 白色像素 = 1, 黑色像素 = 0
+        # PIL 的 '1' 模式轉為 NumPy 時即為 bool 陣列：白色 = True, 黑色 = False
+        # 不需再轉 uint8 / 比較（PIL 原生的 tobytes() 打包反而較慢）
+        pixels = np.asarray(image)
         
-        # 打包為 bytes
-        packed = np.packbits(pixels, axis=1)
-        
-        return packed.tobytes()
+        # 打包為 1-bit（8 pixels per byte），白色像素 = 1, 黑色像素 = 0
+        return np.packbits(pixels, axis=1).tobytes()
     
     def create_text_image(self, text: str, font_size: int = 48, 
                          font_path: str = None) -> Image.Image:
@@ -95,28 +817,11 @@ class ImageProcessor:
         img = Image.new('1', (self.width, self.height), 1)
         draw = ImageDraw.Draw(img)
         
-        # 載入字體
-        try:
-            if font_path:
-                font = ImageFont.truetype(font_path, font_size)
-            else:
-                # 嘗試使用系統字體
-                try:
-                    # Windows
-                    font = ImageFont.truetype("c:/windows/fonts/msjh.ttc", font_size)
-                except:
-                    try:
-                        # Linux
-                        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", font_size)
-                    except:
-                        # 使用預設字體
-                        font = ImageFont.load_default()
-        except Exception as e:
-            print(f"載入字體失敗，使用預設字體: {e}")
-            font = ImageFont.load_default()
-        
-        # 計算文字邊界
-        bbox = draw.textbbox((0, 0), text, font=font)
+        # 載入字體（快取，系統字體只解析一次）
+        font = load_font(font_path, font_size)
+        
+        # 計算文字邊界（快取）
+        bbox = text_bbox(text, font_path, font_size)
         text_width = bbox[2] - bbox[0]
         text_height = bbox[3] - bbox[1]
         
@@ -129,6 +834,38 @@ class ImageProcessor:
         
         return img
     
+    def create_fitted_text_image(self, text: str, font_path: str = None,
+                                 max_font_size: int = None, min_font_size: int = 12,
+                                 margin: int = 8) -> Image.Image:
+        """
+        自動排版文字：依畫面寬度換行，並選擇放得下的最大字體
+        
+        Args:
+            text: 要顯示的文字（可含換行）
+            font_path: 字體檔案路徑（None 則使用系統字體）
+            max_font_size: 最大字體大小（None 則為畫面高度）
+            min_font_size: 最小字體大小
+            margin: 四周留白（像素）
+            
+        Returns:
+            1-bit 黑白圖片
+        """
+        layout = fit_text(text, self.width - 2 * margin, self.height - 2 * margin, font_path,
+                          max_font_size or self.height, min_font_size)
+        
+        img = Image.new('1', (self.width, self.height), 1)
+        draw = ImageDraw.Draw(img)
+        font = load_font(font_path, layout.font_size)
+        
+        # 整段文字垂直置中，每行水平置中
+        block_height = len(layout.lines) * layout.line_height - layout.spacing
+        y = (self.height - block_height) // 2
+        for line, line_width in zip(layout.lines, layout.line_widths):
+            draw.text(((self.width - line_width) // 2, y), line, font=font, fill=0)
+            y += layout.line_height
+        
+        return img
+    
     def create_test_pattern(self) -> Image.Image:
         """
         建立測試圖案
@@ -175,6 +912,31 @@ class ImageProcessor:
             'height': image.height,
         }
     
+    def iter_bands(self, frame: bytes, band_height: int = LEGACY_TILE_HEIGHT
+                   ) -> Iterator[Tuple[int, int, memoryview]]:
+        """
+        以位元組偏移切割已打包的畫面（memoryview，不複製、不重新轉換）
+        
+        每列 width / 8 bytes，條帶 y 的資料即為 [y * 每列 bytes, (y + 高度) * 每列 bytes)
+        
+        Args:
+            frame: 打包後的 1-bit 畫面（total_bytes）
+            band_height: 條帶高度（列），最後一條可能較矮
+            
+        Yields:
+            (y, 條帶高度, 條帶資料)
+        """
+        if len(frame) != self.total_bytes:
+            raise ValueError(f"畫面大小錯誤: 預期 {self.total_bytes} bytes, 實際 {len(frame)} bytes")
+        if band_height < 1:
+            raise ValueError(f"條帶高度至少為 1: {band_height}")
+        
+        view = memoryview(frame)
+        row_bytes = self.width // 8
+        for y in range(0, self.height, band_height):
+            height = min(band_height, self.height - y)
+            yield y, height, view[y * row_bytes:(y + height) * row_bytes]
+    
     def split_image_to_tiles(self, image: Image.Image) -> dict:
         """
         將 800x480 圖片分割成 3 個 800x160 水平條帶（垂直分割）
@@ -14,6 +14,8 @@ class PacketType(IntEnum):
     TILE_UPDATE = 0x02    # 分區更新（新增）
     DELTA_UPDATE = 0x03   # 差分更新
     COMMAND = 0x04        # 控制指令
+    ENCODED_UPDATE = 0x05 # 完整畫面更新（payload 標明編碼器）
+    BAND_UPDATE = 0x06    # 任意高度的水平條帶更新（payload 帶 Y 座標）
     ACK = 0x10           # 確認
     NAK = 0x11           # 否認（錯誤）
 
@@ -32,6 +34,8 @@ class Protocol:
     
     HEADER_MAGIC = 0xA5
     HEADER_SIZE = 8  # 1 + 1 + 2 + 4 bytes
+    ENCODED_HEADER_SIZE = 5  # CodecID(1B) + RawSize(4B)
+    BAND_HEADER_SIZE = 4     # Y(2B) + Height(2B)
     
     @staticmethod
     def pack_header(packet_type: int, seq_id: int, length: int) -> bytes:
@@ -54,6 +58,20 @@ class Protocol:
                           seq_id,
                           length)
     
+    @staticmethod
+    def with_seq_id(packet: bytes, seq_id: int) -> bytes:
+        """
+        改寫封包序號（預先編碼的封包重複發送時使用）
+        
+        Args:
+            packet: 完整封包
+            seq_id: 新序號
+            
+        Returns:
+            序號已改寫的封包
+        """
+        return packet[:2] + struct.pack('<H', seq_id & 0xFFFF) + packet[4:]
+    
     @staticmethod
     def unpack_header(data: bytes) -> Tuple[int, int, int, int]:
         """
@@ -85,6 +103,42 @@ class Protocol:
         header = Protocol.pack_header(PacketType.FULL_UPDATE, seq_id, len(data))
         return header + data
     
+    @staticmethod
+    def pack_encoded_frame(seq_id: int, codec_id: int, raw_size: int, data: bytes) -> bytes:
+        """
+        打包帶編碼器標記的完整畫面更新
+        
+        Payload: [CodecID(1B)][RawSize(4B)][Data]
+        
+        Args:
+            seq_id: 序號
+            codec_id: 編碼器代碼（見 compressor.CodecRegistry）
+            raw_size: 解碼後的畫面大小
+            data: 編碼後的圖像資料
+            
+        Returns:
+            完整封包
+        """
+        payload = struct.pack('<BI', codec_id, raw_size) + data
+        header = Protocol.pack_header(PacketType.ENCODED_UPDATE, seq_id, len(payload))
+        return header + payload
+    
+    @staticmethod
+    def unpack_encoded_frame(payload: bytes) -> Tuple[int, int, bytes]:
+        """
+        解析帶編碼器標記的 payload
+        
+        Args:
+            payload: ENCODED_UPDATE 封包的 payload
+            
+        Returns:
+            (codec_id, raw_size, data)
+        """
+        if len(payload) < Protocol.ENCODED_HEADER_SIZE:
+            raise ValueError(f"資料太短: {len(payload)} < {Protocol.ENCODED_HEADER_SIZE}")
+        codec_id, raw_size = struct.unpack('<BI', payload[:Protocol.ENCODED_HEADER_SIZE])
+        return codec_id, raw_size, payload[Protocol.ENCODED_HEADER_SIZE:]
+    
     @staticmethod
     def pack_tile(seq_id: int, tile_index: int, data: bytes) -> bytes:
         """
@@ -103,6 +157,59 @@ class Protocol:
         header = Protocol.pack_header(PacketType.TILE_UPDATE, seq_id, len(payload))
         return header + payload
     
+    @staticmethod
+    def pack_band(seq_id: int, y: int, height: int, data: bytes) -> bytes:
+        """
+        打包水平條帶更新（條帶高度不限於 160 列）
+        
+        Payload: [Y(2B)][Height(2B)][Data]
+        
+        Args:
+            seq_id: 序號
+            y: 條帶起始列
+            height: 條帶高度（列）
+            data: 條帶圖像資料（未壓縮時為 height * 每列 bytes）
+            
+        Returns:
+            完整封包
+        """
+        payload = struct.pack('<HH', y, height) + data
+        header = Protocol.pack_header(PacketType.BAND_UPDATE, seq_id, len(payload))
+        return header + payload
+    
+    @staticmethod
+    def unpack_band(payload: bytes) -> Tuple[int, int, bytes]:
+        """
+        解析水平條帶更新的 payload
+        
+        Args:
+            payload: 封包 payload（不含封包頭）
+            
+        Returns:
+            (y, height, data)
+        """
+        if len(payload) < Protocol.BAND_HEADER_SIZE:
+            raise ValueError(f"資料太短: {len(payload)} < {Protocol.BAND_HEADER_SIZE}")
+        y, height = struct.unpack('<HH', payload[:Protocol.BAND_HEADER_SIZE])
+        return y, height, payload[Protocol.BAND_HEADER_SIZE:]
+    
+    @staticmethod
+    def band_rows(max_packet_size: int, row_bytes: int) -> int:
+        """
+        單一 BAND_UPDATE 封包（未壓縮）可容納的列數
+        
+        Args:
+            max_packet_size: 封包大小上限（可用 packet_size_test.py 測得的穩定大小）
+            row_bytes: 每列 bytes
+            
+        Returns:
+            條帶高度（列）
+        """
+        rows = (max_packet_size - Protocol.HEADER_SIZE - Protocol.BAND_HEADER_SIZE) // row_bytes
+        if rows < 1:
+            raise ValueError(f"封包大小上限過小: {max_packet_size}")
+        return rows
+    
     @staticmethod
     def pack_delta(seq_id: int, regions: List[Tuple[int, int, int, int, bytes]]) -> bytes:
         """
@@ -196,7 +303,10 @@ class Protocol:
         
         type_names = {
             PacketType.FULL_UPDATE: 'FULL_UPDATE',
+            PacketType.TILE_UPDATE: 'TILE_UPDATE',
             PacketType.DELTA_UPDATE: 'DELTA_UPDATE',
+            PacketType.ENCODED_UPDATE: 'ENCODED_UPDATE',
+            PacketType.BAND_UPDATE: 'BAND_UPDATE',
             PacketType.COMMAND: 'COMMAND',
             PacketType.ACK: 'ACK',
             PacketType.NAK: 'NAK',
@@ -0,0 +1,234 @@
+"""
+背景渲染模組
+將 PIL / NumPy 影像處理移出 asyncio 事件迴圈，避免處理大圖時阻塞
+WebSocket ping、/status 輪詢與其他顯示器的 READY 訊息
+"""
+
+import asyncio
+import io
+import logging
+import os
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, Tuple
+
+from PIL import Image
+
+from image_processor import ImageProcessor, RenderParams, load_font
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up() -> int:
+    """
+    預熱 worker：載入 PIL / NumPy、執行一次轉換並解析系統字體
+    
+    Returns:
+        worker 的 PID
+    """
+    Image.new('L', (8, 8)).convert('1').tobytes()
+    ImageProcessor(8, 8).render_packed(Image.new('L', (8, 8)))
+    load_font(None, 48)
+    return os.getpid()
+
+
+def render_source(processor: ImageProcessor, source: bytes,
+                  params: RenderParams = RenderParams()) -> bytes:
+    """
+    將圖片檔案內容解碼並渲染為打包畫面（模組層級函式，可傳給 worker 程序）
+    
+    Args:
+        processor: 目標尺寸的處理器
+        source: 圖片檔案內容
+        params: 渲染參數
+    
+    Returns:
+        打包後的 1-bit 畫面
+    """
+    return processor.render_packed(Image.open(io.BytesIO(source)), params)
+
+
+def render_source_info(processor: ImageProcessor, source: bytes,
+                       params: RenderParams = RenderParams()) -> Tuple[bytes, str]:
+    """
+    同 render_source()，並回傳實際使用的處理方式（見 ImageProcessor.render_path()）
+    
+    Args:
+        processor: 目標尺寸的處理器
+        source: 圖片檔案內容
+        params: 渲染參數
+    
+    Returns:
+        (打包後的 1-bit 畫面, 處理方式)
+    """
+    return processor.render_packed_info(Image.open(io.BytesIO(source)), params)
+
+
+class RenderPool:
+    """
+    影像處理執行器
+    
+    - process: 獨立 worker 程序，完全不佔用事件迴圈（推薦）
+    - thread: 背景執行緒，PIL 縮放/轉換會釋放 GIL，但 Atkinson 等 Python 迴圈不會
+    - inline: 直接在事件迴圈中執行（舊行為）
+    
+    傳給 worker 的參數與回傳值都必須可 pickle：傳入圖片檔案內容或已解碼的小型 PIL Image
+    （尚未解碼的檔案 Image 在 pickle 時會於事件迴圈中解碼，應改傳檔案內容），
+    回傳打包後的 bytes（48000 bytes）或 1-bit 圖片，不傳遞大型中間陣列
+    """
+    
+    MODES = ('process', 'thread', 'inline')
+    
+    def __init__(self, mode: str = 'process', workers: int = 1):
+        """
+        初始化並預熱 worker（啟動時一次性成本，之後每次請求不需再 spawn）
+        
+        Args:
+            mode: 'process' / 'thread' / 'inline'
+            workers: worker 數量
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"未知的執行方式: {mode}")
+        
+        self.mode = mode
+        self.workers = workers
+        self.executor: Optional[Executor] = None
+        
+        if mode == 'inline':
+            self.worker_pids = [os.getpid()]
+        else:
+            self.worker_pids = sorted({future.result() for future in self._start()})
+    
+    def _start(self) -> List[Future]:
+        """
+        建立 executor 並讓每個 worker 先執行一次 warm_up()
+        （程序啟動與模組載入發生在啟動 / 重建時，而不是第一個請求）
+        
+        Returns:
+            warm_up() 的 Future（結果為 worker 的 PID）
+        """
+        if self.mode == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='render')
+        return [self.executor.submit(warm_up) for _ in range(self.workers)]
+    
+    async def _restart(self, broken: Executor):
+        """
+        重建損壞的 worker 程序池（例如 worker 被 OOM killer 終止）
+        
+        Args:
+            broken: 發生 BrokenProcessPool 的 executor（已被其他請求重建時不再重建）
+        """
+        if self.executor is not broken:
+            return
+        broken.shutdown(wait=False)
+        futures = self._start()
+        self.worker_pids = sorted(set(await asyncio.gather(*map(asyncio.wrap_future, futures))))
+        logger.warning(f"worker 程序池已重建: PID {self.worker_pids}")
+    
+    async def run(self, func: Callable, *args):
+        """
+        在 worker 中執行 func(*args)
+        
+        worker 程序意外結束 (BrokenProcessPool) 時重建程序池並重試一次；
+        重試仍失敗則把例外交給呼叫端，之後的請求使用重建後的程序池
+        
+        Args:
+            func: 可 pickle 的函式或方法（process 模式）
+            *args: 參數
+        
+        Returns:
+            func 的回傳值
+        """
+        if self.executor is None:
+            return func(*args)
+        
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self.executor
+            try:
+                return await loop.run_in_executor(executor, func, *args)
+            except BrokenProcessPool:
+                logger.warning(f"worker 程序意外結束，重建程序池 (第 {attempt + 1} 次)")
+                await self._restart(executor)
+                if attempt:
+                    raise
+    
+    async def render_source(self, processor: ImageProcessor, source: bytes,
+                            params: RenderParams = RenderParams()) -> bytes:
+        """
+        在 worker 中解碼並渲染圖片檔案內容
+        
+        Args:
+            processor: 目標尺寸的處理器
+            source: 圖片檔案內容
+            params: 渲染參數
+        
+        Returns:
+            打包後的 1-bit 畫面
+        """
+        return await self.run(render_source, processor, source, params)
+    
+    def shutdown(self):
+        """停止 worker"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+
+async def measure_loop_lag(coro, interval: float = 0.005) -> float:
+    """
+    執行 coro 期間量測事件迴圈最大延遲
+    
+    以固定間隔 sleep 的計時器檢查實際喚醒時間與預期的差距，
+    若事件迴圈被同步運算阻塞，延遲會等於該運算的耗時
+    
+    Args:
+        coro: 要執行的 coroutine
+        interval: 計時器間隔（秒）
+    
+    Returns:
+        最大延遲（毫秒）
+    """
+    max_lag = 0.0
+    done = False
+    
+    async def ticker():
+        nonlocal max_lag
+        while not done:
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            max_lag = max(max_lag, time.perf_counter() - expected)
+    
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)  # 讓計時器先開始
+    try:
+        await coro
+    finally:
+        done = True
+        await task
+    return max_lag * 1000
+
+
+if __name__ == "__main__":
+    # 測試程式：比較 inline 與 worker 程序處理時的事件迴圈延遲
+    print("=== 背景渲染測試 ===")
+    
+    with open("CAT_800.png", 'rb') as f:
+        source = f.read()
+    processor = ImageProcessor(800, 480)
+    params = RenderParams(dither_mode='atkinson')
+    
+    async def main():
+        for mode in RenderPool.MODES:
+            start = time.perf_counter()
+            pool = RenderPool(mode)
+            startup = (time.perf_counter() - start) * 1000
+            lag = await measure_loop_lag(pool.render_source(processor, source, params))
+            print(f"{mode:8s} 啟動 {startup:7.1f} ms, 事件迴圈最大延遲 {lag:7.1f} ms")
+            pool.shutdown()
+    
+    asyncio.run(main())
+    print("\n測試完成！")
@@ -8,12 +8,10 @@ import websockets
 from websockets.server import serve
 from pathlib import Path
 import logging
-from typing import Set, Optional
-from PIL import Image
 
-from image_processor import ImageProcessor
-from compressor import RLECompressor, HybridCompressor
 from protocol import Protocol, PacketType, Command
+from batch_convert import PACKED_SUFFIX
+from display_pipeline import DisplayPipeline
 
 # 設定日誌
 logging.basicConfig(
@@ -23,7 +21,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-class DisplayServer:
+class DisplayServer(DisplayPipeline):
     """電子紙顯示伺服器"""
     
     def __init__(self, host: str = "0.0.0.0", port: int = 8266):
@@ -36,19 +34,9 @@ class DisplayServer:
         """
         self.host = host
         self.port = port
-        self.clients: Set[websockets.WebSocketServerProtocol] = set()
-        self.seq_id = 0
         
-        # 初始化模組
-        # processor: 400x240 用於中央區域顯示 (向後兼容)
-        self.processor = ImageProcessor(400, 240)
-        # processor_800: 800x480 用於全螢幕分區顯示 (新增)
-        self.processor_800 = ImageProcessor(800, 480)
-        self.compressor = RLECompressor()
-        self.hybrid = HybridCompressor()
-        
-        # 條帶顯示完成事件（用於同步）
-        self.tile_ready_event = asyncio.Event()
+        # 處理器、編碼器、快取與發送狀態（見 display_pipeline.DisplayPipeline）
+        super().__init__()
         
         logger.info(f"伺服器初始化完成")
         logger.info(f"顯示器: 400x240 (中央區域) / 800x480 (全螢幕分區)")
@@ -56,6 +44,7 @@ class DisplayServer:
     async def register(self, websocket):
         """註冊客戶端"""
         self.clients.add(websocket)
+        self.last_frame = None  # 新設備尚未收過任何畫面
         logger.info(f"客戶端連接: {websocket.remote_address}")
         logger.info(f"目前連接數: {len(self.clients)}")
     
@@ -93,6 +82,7 @@ class DisplayServer:
                         logger.info(f"✓ ESP8266 確認收到 SeqID={info['seq_id']}")
                     elif info['type_code'] == PacketType.NAK:
                         logger.warning(f"✗ ESP8266 回報錯誤 SeqID={info['seq_id']}")
+                        self.last_frame = None  # 畫面狀態不明，下次送完整畫面
         else:
             # 文字訊息
             message_str = message.strip()
@@ -117,31 +107,21 @@ class DisplayServer:
         logger.info(f"處理圖片: {image_path}")
         
         try:
-            # 載入並處理圖像
-            img = Image.open(image_path)
-            logger.info(f"原始圖片: {img.size}, 模式: {img.mode}")
-            
-            processed = self.processor.convert_to_1bit(img, dither=True)
-            logger.info(f"轉換為 1-bit: {processed.size}")
+            # 載入並處理圖像（相同內容會命中畫面快取）
+            with open(image_path, 'rb') as f:
+                source = f.read()
+            logger.info(f"原始檔案: {len(source)} bytes")
             
-            raw_data = self.processor.image_to_bytes(processed)
+            raw_data = await self._render_source(self.processor, source)
             logger.info(f"原始資料: {len(raw_data)} bytes")
             
-            # 智能壓縮：比較 RLE 和無壓縮，選擇較小的
-            compressed, is_compressed = self.compressor.compress_smart(raw_data)
-            ratio = self.compressor.compress_ratio(len(raw_data), len(compressed))
-            
-            if is_compressed:
-                logger.info(f"壓縮後: {len(compressed)} bytes (壓縮率: {ratio:.1f}%, 使用 RLE)")
-            else:
-                logger.info(f"未壓縮: {len(compressed)} bytes (RLE 無效，使用原始資料)")
-            
-            # 打包協議
+            # 編碼並打包協議
             self.seq_id += 1
-            packet = Protocol.pack_full_frame(self.seq_id, compressed)
+            packet = self._pack_update(self.processor, raw_data)
             logger.info(f"封包大小: {len(packet)} bytes (含標頭)")
             
             # 發送到所有客戶端
+            self.stop_animation()
             logger.info(f"發送到 {len(self.clients)} 個客戶端...")
             await asyncio.gather(
                 *[client.send(packet) for client in self.clients],
@@ -152,13 +132,13 @@ class DisplayServer:
         except Exception as e:
             logger.error(f"發送圖片失敗: {e}")
     
-    async def send_text(self, text: str, font_size: int = 48):
+    async def send_text(self, text: str, max_font_size: int = None):
         """
-        發送文字到所有客戶端
+        發送文字到所有客戶端（自動換行並選擇放得下的最大字體）
         
         Args:
-            text: 要顯示的文字
-            font_size: 字體大小
+            text: 要顯示的文字（可含換行）
+            max_font_size: 最大字體大小（None 則不限制）
         """
         if not self.clients:
             logger.warning("沒有連接的客戶端")
@@ -168,24 +148,16 @@ class DisplayServer:
         
         try:
             # 建立文字圖像
-            img = self.processor.create_text_image(text, font_size)
+            img = await self.render_pool.run(self.processor.create_fitted_text_image, text, None, max_font_size)
             raw_data = self.processor.image_to_bytes(img)
             logger.info(f"原始資料: {len(raw_data)} bytes")
             
-            # 智能壓縮
-            compressed, is_compressed = self.compressor.compress_smart(raw_data)
-            ratio = self.compressor.compress_ratio(len(raw_data), len(compressed))
-            
-            if is_compressed:
-                logger.info(f"壓縮後: {len(compressed)} bytes (壓縮率: {ratio:.1f}%, 使用 RLE)")
-            else:
-                logger.info(f"未壓縮: {len(compressed)} bytes (RLE 無效，使用原始資料)")
-            
-            # 打包協議
+            # 編碼並打包協議
             self.seq_id += 1
-            packet = Protocol.pack_full_frame(self.seq_id, compressed)
+            packet = self._pack_update(self.processor, raw_data)
             
             # 發送
+            self.stop_animation()
             logger.info(f"發送到 {len(self.clients)} 個客戶端...")
             await asyncio.gather(
                 *[client.send(packet) for client in self.clients],
@@ -197,46 +169,39 @@ class DisplayServer:
             logger.error(f"發送文字失敗: {e}")
     
     async def send_test_pattern(self):
-        """發送測試圖案"""
+        """發送測試圖案（預先渲染的固定畫面）"""
+        await self.send_static_frame('test_400x240')
+    
+    async def send_static_frame(self, name: str):
+        """
+        發送固定畫面（預先渲染與編碼，不做任何影像處理）
+        
+        Args:
+            name: 固定畫面名稱（test_400x240 / white_800x480 / splash 等）
+        """
         if not self.clients:
             logger.warning("沒有連接的客戶端")
             return
         
-        logger.info("發送測試圖案")
-        
         try:
-            # 建立測試圖案
-            img = self.processor.create_test_pattern()
-            raw_data = self.processor.image_to_bytes(img)
-            
-            # 智能壓縮
-            compressed, is_compressed = self.compressor.compress_smart(raw_data)
-            ratio = self.compressor.compress_ratio(len(raw_data), len(compressed))
-            
-            if is_compressed:
-                logger.info(f"壓縮率: {ratio:.1f}% (使用 RLE)")
-            else:
-                logger.info(f"未壓縮 (RLE 無效，使用原始資料)")
-            
-            # 打包並發送
             self.seq_id += 1
-            packet = Protocol.pack_full_frame(self.seq_id, compressed)
+            packet = self._pack_static(name)
             
+            self.stop_animation()
             await asyncio.gather(
                 *[client.send(packet) for client in self.clients],
                 return_exceptions=True
             )
-            logger.info("✓ 測試圖案已發送")
+            logger.info(f"✓ 固定畫面已發送: {name} ({len(packet)} bytes)")
             
         except Exception as e:
-            logger.error(f"發送測試圖案失敗: {e}")
+            logger.error(f"發送固定畫面失敗: {e}")
     
     async def send_tiled_image(self, image_path: str):
         """
-        發送 800×480 圖片（垂直分割：3 個 800×160 水平條帶）
+        發送 800×480 圖片（垂直分割：水平條帶，預設 3 個 800×160）
         
-        分區順序（從上到下）：
-            0 (條帶0) → 1 (條帶1) → 2 (條帶2)
+        整張畫面只渲染一次（相同圖片會命中畫面快取），再以位元組偏移切割為條帶
         
         Args:
             image_path: 圖片檔案路徑
@@ -249,80 +214,13 @@ class DisplayServer:
         
         try:
             # 載入圖片
-            img = Image.open(image_path)
-            logger.info(f"原始圖片: {img.size}, 模式: {img.mode}")
-            
-            # 轉換為 1-bit (使用 800x480 處理器)
-            processed = self.processor_800.convert_to_1bit(img, dither=True)
-            logger.info(f"轉換為 1-bit: {processed.size}")
-            
-            # 分割成 3 個水平條帶（垂直分割：上、中、下）
-            tiles = self.processor_800.split_image_to_tiles(processed)
-            logger.info(f"分割成 {len(tiles)} 個條帶 (800x160 each, 垂直分割)")
-            
-            tile_names = ["條帶0 (上)", "條帶1 (中)", "條帶2 (下)"]
-            total_compressed = 0
-            total_raw = 0
-            
-            # 依序發送 3 個條帶（從上到下）
-            for tile_index in range(3):
-                logger.info(f"\n--- 處理條帶 {tile_index} ({tile_names[tile_index]}) ---")
-                
-                tile_image = tiles[tile_index]
-                
-                # 處理條帶（轉換為 bytes）
-                tile_data = self.processor_800.process_tile(tile_image, dither=True)
-                logger.info(f"條帶資料: {len(tile_data)} bytes (800x160)")
-                total_raw += len(tile_data)
-                
-                # **不使用壓縮**，直接發送未壓縮資料以避免 ESP8266 記憶體碎片化問題
-                compressed_data = tile_data
-                is_compressed = False
-                logger.info(f"發送未壓縮資料: {len(compressed_data)} bytes（避免記憶體碎片化）")
-                
-                total_compressed += len(compressed_data)
-                
-                # 創建分區封包
-                self.seq_id += 1
-                packet = Protocol.pack_tile(self.seq_id, tile_index, compressed_data)
-                logger.info(f"封包大小: {len(packet)} bytes (含標頭)")
-                
-                # 發送到所有客戶端
-                logger.info(f"發送條帶 {tile_index} 到 {len(self.clients)} 個客戶端...")
-                await asyncio.gather(
-                    *[client.send(packet) for client in self.clients],
-                    return_exceptions=True
-                )
-                logger.info(f"✓ 條帶 {tile_index} ({tile_names[tile_index]}) 發送完成")
-                
-                # 等待 ESP8266 完成顯示並發送 READY 訊號
-                if tile_index < 2:  # 最後一個條帶不需要等待
-                    logger.info(f"等待條帶 {tile_index} 顯示完成...")
-                    self.tile_ready_event.clear()  # 清除事件標誌
-                    
-                    try:
-                        # 等待 READY 訊號，最長 30 秒超時
-                        await asyncio.wait_for(self.tile_ready_event.wait(), timeout=30.0)
-                        logger.info(f"✓ 條帶 {tile_index} 顯示完成，準備發送下一個條帶")
-                    except asyncio.TimeoutError:
-                        logger.warning(f"⚠️ 等待條帶 {tile_index} 完成超時，繼續發送下一個條帶")
-                else:
-                    # 最後一個條帶，等待 READY 訊號確保完成
-                    logger.info(f"等待最後一個條帶完成...")
-                    self.tile_ready_event.clear()
-                    try:
-                        await asyncio.wait_for(self.tile_ready_event.wait(), timeout=30.0)
-                        logger.info(f"✓ 最後一個條帶顯示完成")
-                    except asyncio.TimeoutError:
-                        logger.warning(f"⚠️ 等待最後一個條帶超時")
+            with open(image_path, 'rb') as f:
+                source = f.read()
+            logger.info(f"原始檔案: {len(source)} bytes")
             
-            # 統計資訊
-            overall_ratio = self.compressor.compress_ratio(total_raw, total_compressed)
-            logger.info(f"\n=== 條帶傳輸完成 ===")
-            logger.info(f"總原始資料: {total_raw} bytes")
-            logger.info(f"總壓縮資料: {total_compressed} bytes")
-            logger.info(f"整體壓縮率: {overall_ratio:.1f}%")
-            logger.info(f"3 個條帶全部發送完成 (800x160 垂直分割，完整覆蓋 800x480)")
+            # 縮放、抖動並打包為 1-bit（於背景 worker 執行）
+            frame = await self._render_source(self.processor_800, source)
+            await self._send_bands(frame)
             
         except Exception as e:
             logger.error(f"發送條帶圖片失敗: {e}")
@@ -347,59 +245,22 @@ class DisplayServer:
         logger.info(f"=== 開始完整畫面傳輸 (800x480): {image_path} ===")
         
         try:
-            # 載入圖片
-            img = Image.open(image_path)
-            logger.info(f"原始圖片: {img.size}, 模式: {img.mode}")
-            
-            # 轉換為 1-bit (使用 800x480 處理器)
-            processed = self.processor_800.convert_to_1bit(img, dither=True)
-            logger.info(f"轉換為 1-bit: {processed.size}")
-            
-            # 轉換為 bytes（48000 bytes = 800 * 480 / 8）
-            image_data = self.processor_800.image_to_bytes(processed)
-            logger.info(f"圖像資料: {len(image_data)} bytes")
-            
-            if len(image_data) != 48000:
-                logger.error(f"圖像資料大小錯誤: 預期 48000 bytes, 實際 {len(image_data)} bytes")
-                return
-            
-            # 不使用壓縮，直接發送未壓縮資料
-            # （ESP32-C3 有足夠記憶體，避免壓縮/解壓縮的複雜度）
-            logger.info(f"發送未壓縮資料: {len(image_data)} bytes（完整畫面模式）")
-            
-            # 創建完整畫面封包
-            self.seq_id += 1
-            packet = Protocol.pack_full_frame(self.seq_id, image_data)
-            logger.info(f"封包大小: {len(packet)} bytes (含標頭)")
-            
-            # 發送到所有客戶端
-            logger.info(f"發送完整畫面到 {len(self.clients)} 個客戶端...")
-            start_time = asyncio.get_event_loop().time()
-            
-            await asyncio.gather(
-                *[client.send(packet) for client in self.clients],
-                return_exceptions=True
-            )
-            
-            elapsed = asyncio.get_event_loop().time() - start_time
-            logger.info(f"✓ 完整畫面發送完成 (耗時: {elapsed:.2f} 秒)")
-            
-            # 等待 ESP32-C3 完成顯示並發送 READY 訊號
-            logger.info(f"等待設備完成顯示...")
-            self.tile_ready_event.clear()
-            
-            try:
-                await asyncio.wait_for(self.tile_ready_event.wait(), timeout=30.0)
-                logger.info(f"✓ 設備顯示完成")
-            except asyncio.TimeoutError:
-                logger.warning(f"⚠️ 等待設備完成超時")
-            
-            logger.info(f"=== 完整畫面傳輸完成 ===")
-            
+            # 載入圖片（相同內容會命中畫面快取）
+            with open(image_path, 'rb') as f:
+                source = f.read()
+            logger.info(f"原始檔案: {len(source)} bytes")
+            
+            # 縮放、抖動並打包為 1-bit（48000 bytes = 800 * 480 / 8）
+            # batch_convert.py 預先轉換的 .bin 已是打包畫面，直接發送
+            if image_path.endswith(PACKED_SUFFIX):
+                image_data = source
+            else:
+                image_data = await self._render_source(self.processor_800, source)
         except Exception as e:
-            logger.error(f"發送完整畫面失敗: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.error(f"圖片處理失敗: {e}")
+            return
+        
+        await self._send_full_frame(image_data, Path(image_path).name)
     
     async def send_command(self, command: Command, param: int = 0):
         """
@@ -414,6 +275,8 @@ class DisplayServer:
             return
         
         logger.info(f"發送指令: {command.name}")
+        self.stop_animation()
+        self.last_frame = None
         
         try:
             self.seq_id += 1
@@ -445,11 +308,16 @@ async def interactive_mode(server: DisplayServer):
     print("WiFi SPI Display Server - 互動模式")
     print("="*50)
     print("\n指令:")
-    print("  text <文字>       - 發送文字 (400×240 中央顯示)")
+    print("  text <文字>       - 發送文字 (400×240 自動換行，\\n 換行)")
     print("  image <檔案>      - 發送圖片 (400×240 中央顯示)")
     print("  tile <檔案>       - 發送圖片 (800×480 分區顯示)")
+    print("  anim <檔案> [輪數] - 播放動畫 GIF (400×240，0 表示持續循環)")
+    print("  stop              - 停止動畫")
     print("  test              - 發送測試圖案")
+    print("  frame <名稱>      - 發送固定畫面 (white_400x240 / black_800x480 / splash ...)")
     print("  clear             - 清空螢幕")
+    print("  frames            - 列出畫面儲存檔中最近的畫面")
+    print("  replay <名稱|位置> - 重播儲存的畫面 (800×480，不需重新處理)")
     print("  clients           - 顯示連接的客戶端")
     print("  quit              - 結束程式")
     print()
@@ -478,12 +346,34 @@ async def interactive_mode(server: DisplayServer):
                 await server.send_test_pattern()
             elif action == "clear":
                 await server.send_command(Command.CLEAR_SCREEN)
+            elif action == "frames":
+                if server.frame_store is None:
+                    print("未啟用畫面儲存檔")
+                else:
+                    for slot, digest, name in list(server.frame_store.entries())[-20:]:
+                        print(f"  {slot:5d}  {digest[:16]}  {name or ''}")
+                    print(f"共 {len(server.frame_store)} 個畫面")
+            elif action == "replay" and len(parts) > 1:
+                key = int(parts[1]) if parts[1].lstrip('-').isdigit() else parts[1]
+                await server.replay_frame(key)
+            elif action == "frame" and len(parts) > 1:
+                if parts[1] in server.static_frames:
+                    await server.send_static_frame(parts[1])
+                else:
+                    print(f"可用的固定畫面: {', '.join(server.static_frames.names())}")
             elif action == "text" and len(parts) > 1:
-                await server.send_text(parts[1])
+                await server.send_text(parts[1].replace('\\n', '\n'))
             elif action == "image" and len(parts) > 1:
                 await server.send_image(parts[1])
             elif action == "tile" and len(parts) > 1:
                 await server.send_tiled_image(parts[1])
+            elif action == "anim" and len(parts) > 1:
+                path, _, loops = parts[1].partition(' ')
+                with open(path, 'rb') as f:
+                    animation = await server.render_animation(server.processor, f.read())
+                server.start_animation(server.processor, animation, int(loops) if loops else None)
+            elif action == "stop":
+                server.stop_animation()
             else:
                 print("未知指令或缺少參數")
         
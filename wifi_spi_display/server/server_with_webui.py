@@ -15,6 +15,7 @@ import logging
 from typing import Set, Optional
 from PIL import Image
 import socket
+import math
 import os
 import tempfile
 import threading
@@ -24,9 +25,12 @@ import time
 from aiohttp import web
 import aiohttp
 
-from image_processor import ImageProcessor
-from compressor import RLECompressor, HybridCompressor
+from image_processor import ImageProcessor, RenderParams
+from compressor import RawCodec
 from protocol import Protocol, PacketType, Command
+from batch_convert import PACKED_SUFFIX
+from animation import frame_count
+from display_pipeline import DisplayPipeline
 
 # 設定日誌
 logging.basicConfig(
@@ -49,7 +53,7 @@ def get_local_ip():
         return "127.0.0.1"
 
 
-class DisplayServer:
+class DisplayServer(DisplayPipeline):
     """電子紙顯示伺服器（含 Web UI）"""
     
     def __init__(self, host: str = "0.0.0.0", port: int = 8266, http_port: int = 8080):
@@ -64,17 +68,9 @@ class DisplayServer:
         self.host = host
         self.port = port
         self.http_port = http_port
-        self.clients: Set[websockets.WebSocketServerProtocol] = set()
-        self.seq_id = 0
         
-        # 初始化模組
-        self.processor = ImageProcessor(400, 240)
-        self.processor_800 = ImageProcessor(800, 480)
-        self.compressor = RLECompressor()
-        self.hybrid = HybridCompressor()
-        
-        # 條帶顯示完成事件（用於同步）
-        self.tile_ready_event = asyncio.Event()
+        # 處理器、編碼器、快取與發送狀態（見 display_pipeline.DisplayPipeline）
+        super().__init__()
         
         # 狀態追蹤
         self.last_image_path = None
@@ -99,7 +95,10 @@ class DisplayServer:
         self.http_app.router.add_post('/upload', self.handle_upload)
         self.http_app.router.add_get('/status', self.handle_status)
         self.http_app.router.add_post('/send_test', self.handle_send_test)
+        self.http_app.router.add_post('/send_text', self.handle_send_text)
         self.http_app.router.add_post('/clear', self.handle_clear)
+        self.http_app.router.add_get('/frames', self.handle_frames)
+        self.http_app.router.add_post('/replay', self.handle_replay)
     
     async def handle_index(self, request):
         """提供網頁界面"""
@@ -354,6 +353,18 @@ class DisplayServer:
             border: 1px solid #f5c6cb;
         }
         
+        .text-input {
+            width: 100%;
+            min-height: 80px;
+            padding: 12px;
+            margin-bottom: 15px;
+            border: 2px solid #e9ecef;
+            border-radius: 10px;
+            font-size: 16px;
+            font-family: inherit;
+            resize: vertical;
+        }
+        
         .progress-bar {
             height: 8px;
             background: #e9ecef;
@@ -479,6 +490,17 @@ class DisplayServer:
                 </div>
             </div>
             
+            <!-- 文字 -->
+            <div class="section">
+                <h2>📝 文字</h2>
+                <textarea class="text-input" id="textInput" placeholder="輸入要顯示的文字（自動換行並選擇最大字體）"></textarea>
+                <div class="button-group">
+                    <button class="btn btn-primary" onclick="sendText()">
+                        📝 傳送文字
+                    </button>
+                </div>
+            </div>
+            
             <!-- 進度條 -->
             <div class="progress-bar" id="progressBar">
                 <div class="progress-fill" id="progressFill"></div>
@@ -814,114 +836,27 @@ class DisplayServer:
         
         // 傳送圖片
         async function sendImage() {
-            if (!sourceImage || !cropRect) {
+            if (!sourceImage || !cropRect || !selectedFile) {
                 showAlert('請先選擇圖片', 'error');
                 return;
             }
             
             showProgress(true);
-            showAlert('⏳ 裁切並處理圖片...', 'info');
             document.getElementById('sendBtn').disabled = true;
             
             try {
-                // 創建裁切後的 canvas
+                // 上傳原始檔案與裁切範圍，由伺服器在解碼時一併裁切、縮放與旋轉
+                // （瀏覽器不需重新編碼 PNG，伺服器也只解碼一次；GIF 動畫保留所有幀）
+                // 直向: 裁切範圍放入 480×800 → 順時針旋轉 90 度 → 800×480
                 const size = getDisplaySize();
-                const cropCanvas = document.createElement('canvas');
-                
-                // 如果是直向模式，需要旋轉 90 度
-                // 直向: 480×800 → 旋轉 90 度 → 800×480
-                if (!isLandscape) {
-                    // 旋轉後的尺寸
-                    cropCanvas.width = DISPLAY_WIDTH;   // 800
-                    cropCanvas.height = DISPLAY_HEIGHT; // 480
-                    
-                    const cropCtx = cropCanvas.getContext('2d');
-                    
-                    // 填充白色背景
-                    cropCtx.fillStyle = 'white';
-                    cropCtx.fillRect(0, 0, DISPLAY_WIDTH, DISPLAY_HEIGHT);
-                    
-                    // 計算裁切區域的比例（注意：旋轉後 width 和 height 對調）
-                    const cropRatio = cropRect.height / cropRect.width;  // 旋轉後的比例
-                    const displayRatio = DISPLAY_WIDTH / DISPLAY_HEIGHT;  // 800/480
-                    
-                    let drawWidth, drawHeight;
-                    
-                    if (Math.abs(cropRatio - displayRatio) < 0.01) {
-                        // 比例相同，直接繪製填滿
-                        drawWidth = DISPLAY_HEIGHT;  // 旋轉前的寬
-                        drawHeight = DISPLAY_WIDTH;  // 旋轉前的高
-                    } else if (cropRatio > displayRatio) {
-                        // 旋轉後更寬，以寬度為準
-                        drawWidth = DISPLAY_HEIGHT;
-                        drawHeight = DISPLAY_HEIGHT / cropRatio;
-                    } else {
-                        // 旋轉後更高，以高度為準
-                        drawHeight = DISPLAY_WIDTH;
-                        drawWidth = DISPLAY_WIDTH * cropRatio;
-                    }
-                    
-                    // 移動到中心點並旋轉 90 度（順時針）
-                    cropCtx.translate(DISPLAY_WIDTH / 2, DISPLAY_HEIGHT / 2);
-                    cropCtx.rotate(90 * Math.PI / 180);
-                    
-                    // 繪製裁切區域（居中，旋轉後）
-                    cropCtx.drawImage(
-                        sourceImage,
-                        cropRect.x, cropRect.y, cropRect.width, cropRect.height,
-                        -drawWidth / 2, -drawHeight / 2, drawWidth, drawHeight
-                    );
-                } else {
-                    // 橫向模式：保持比例繪製，空白處填充白色
-                    cropCanvas.width = size.width;
-                    cropCanvas.height = size.height;
-                    const cropCtx = cropCanvas.getContext('2d');
-                    
-                    // 填充白色背景
-                    cropCtx.fillStyle = 'white';
-                    cropCtx.fillRect(0, 0, size.width, size.height);
-                    
-                    // 計算裁切區域的比例
-                    const cropRatio = cropRect.width / cropRect.height;
-                    const displayRatio = size.width / size.height;
-                    
-                    let drawWidth, drawHeight, drawX, drawY;
-                    
-                    if (Math.abs(cropRatio - displayRatio) < 0.01) {
-                        // 比例相同，直接繪製填滿
-                        drawWidth = size.width;
-                        drawHeight = size.height;
-                        drawX = 0;
-                        drawY = 0;
-                    } else if (cropRatio > displayRatio) {
-                        // 裁切區域更寬，以寬度為準，上下留白
-                        drawWidth = size.width;
-                        drawHeight = size.width / cropRatio;
-                        drawX = 0;
-                        drawY = (size.height - drawHeight) / 2;
-                    } else {
-                        // 裁切區域更高，以高度為準，左右留白
-                        drawHeight = size.height;
-                        drawWidth = size.height * cropRatio;
-                        drawX = (size.width - drawWidth) / 2;
-                        drawY = 0;
-                    }
-                    
-                    cropCtx.drawImage(
-                        sourceImage,
-                        cropRect.x, cropRect.y, cropRect.width, cropRect.height,
-                        drawX, drawY, drawWidth, drawHeight
-                    );
-                }
-                
-                // 轉換為 Blob
-                const blob = await new Promise(resolve => {
-                    cropCanvas.toBlob(resolve, 'image/png');
-                });
-                
-                // 上傳裁切後的圖片
                 const formData = new FormData();
-                formData.append('image', blob, 'cropped.png');
+                formData.append('image', selectedFile, selectedFile.name || 'clipboard.png');
+                formData.append('crop_x', Math.round(cropRect.x));
+                formData.append('crop_y', Math.round(cropRect.y));
+                formData.append('crop_w', Math.round(cropRect.width));
+                formData.append('crop_h', Math.round(cropRect.height));
+                formData.append('fit', 'contain');
+                formData.append('rotate', isLandscape ? 0 : 90);
                 
                 const displayInfo = isLandscape ? 
                     `${size.width}×${size.height}` : 
@@ -971,6 +906,38 @@ class DisplayServer:
             }
         }
         
+        // 傳送文字
+        async function sendText() {
+            const text = document.getElementById('textInput').value;
+            if (!text.trim()) {
+                showAlert('❌ 請輸入文字', 'error');
+                return;
+            }
+            
+            showProgress(true);
+            showAlert('⏳ 排版文字中...', 'info');
+            
+            try {
+                const response = await fetch('/send_text', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ text: text })
+                });
+                
+                const result = await response.json();
+                
+                if (result.success) {
+                    showAlert('✅ ' + result.message, 'success');
+                } else {
+                    showAlert('❌ ' + result.error, 'error');
+                }
+            } catch (error) {
+                showAlert('❌ 發生錯誤: ' + error, 'error');
+            } finally {
+                showProgress(false);
+            }
+        }
+        
         // 清除螢幕
         async function clearScreen() {
             if (!confirm('確定要清除螢幕嗎？')) return;
@@ -1071,26 +1038,55 @@ class DisplayServer:
             data = await request.post()
             image_field = data['image']
             
+            # 裁切 / 放入 / 旋轉由伺服器在解碼時處理（網頁上傳原始檔案，不在瀏覽器重新編碼）
+            try:
+                params = self._upload_params(data)
+            except ValueError as e:
+                self.last_status = f"錯誤: {str(e)}"
+                self.is_sending = False
+                return web.json_response({
+                    'success': False,
+                    'error': str(e)
+                }, status=400)
+            
             # 儲存到臨時檔案
             temp_dir = tempfile.gettempdir()
             temp_path = os.path.join(temp_dir, 'esp8266_uploaded_image.png')
             
+            source = image_field.file.read()
             with open(temp_path, 'wb') as f:
-                f.write(image_field.file.read())
+                f.write(source)
             
             logger.info(f"收到上傳圖片，儲存至: {temp_path}")
             self.last_image_path = temp_path
             
-            # 處理並傳送（使用 800×480 完整畫面模式，無殘影）
+            # 多幀圖片 (GIF / APNG / WebP)：每幀只渲染一次，在背景以差分更新播放
+            if await self.render_pool.run(frame_count, source) > 1:
+                self.stop_animation()
+                animation = await self.render_animation(self.processor_800, source, params)
+                self.start_animation(self.processor_800, animation, legacy_codecs=(RawCodec.name,))
+                
+                self.last_status = f"動畫播放中 ({len(animation.frames)} 幀)"
+                self.is_sending = False
+                return web.json_response({
+                    'success': True,
+                    'message': f'動畫已開始播放 ({len(animation.frames)} 幀)'
+                })
+            
+            # 處理並傳送（使用 800×480 完整畫面模式，無殘影；重複上傳會命中畫面快取）
             self.last_status = "傳送中..."
-            await self.send_full_screen_800x480(temp_path)
+            await self.send_full_screen_800x480_from_bytes(source, image_field.filename, params)
             
             self.last_status = "傳送完成"
             self.is_sending = False
             
+            message = '圖片已成功傳送到顯示器'
+            if self.last_render_path == 'bilevel':
+                message += '（黑白圖片，略過抖動）'
             return web.json_response({
                 'success': True,
-                'message': '圖片已成功傳送到顯示器'
+                'message': message,
+                'render_path': self.last_render_path
             })
         
         except Exception as e:
@@ -1102,13 +1098,64 @@ class DisplayServer:
                 'error': str(e)
             })
     
+    def _upload_params(self, data) -> RenderParams:
+        """
+        由上傳表單取得渲染參數
+        
+        可選欄位: crop_x / crop_y / crop_w / crop_h（原始圖片座標）、fit（見 ImageProcessor.FIT_MODES）、
+        rotate（順時針 0 / 90 / 180 / 270）；未提供時整張拉伸填滿（與舊版相同）
+        
+        Args:
+            data: request.post() 的表單
+            
+        Returns:
+            RenderParams
+            
+        Raises:
+            ValueError: 欄位不完整或數值錯誤（訊息可直接回傳給網頁）
+        """
+        crop_fields = ('crop_x', 'crop_y', 'crop_w', 'crop_h')
+        crop = None
+        if any(field in data for field in crop_fields):
+            missing = [field for field in crop_fields if field not in data]
+            if missing:
+                raise ValueError(f"裁切欄位不完整，缺少: {', '.join(missing)}")
+            try:
+                values = [float(data[field]) for field in crop_fields]
+            except ValueError:
+                raise ValueError("裁切欄位必須是數字: " +
+                                 ", ".join(f"{field}={data[field]}" for field in crop_fields)) from None
+            if not all(math.isfinite(value) for value in values):
+                raise ValueError(f"裁切欄位必須是有限的數字: {values}")
+            crop = tuple(int(value) for value in values)
+            if crop[2] <= 0 or crop[3] <= 0:
+                raise ValueError(f"裁切寬度與高度必須大於 0: 寬 {crop[2]}, 高 {crop[3]}")
+        
+        fit = data.get('fit', 'stretch')
+        if fit not in ImageProcessor.FIT_MODES:
+            raise ValueError(f"未知的放入方式: {fit}（可用: {', '.join(ImageProcessor.FIT_MODES)}）")
+        try:
+            rotate = int(data.get('rotate', 0))
+        except ValueError:
+            raise ValueError(f"旋轉角度必須是整數: {data.get('rotate')}") from None
+        if rotate not in ImageProcessor.ROTATIONS:
+            raise ValueError(f"不支援的旋轉角度: {rotate}（可用: 0 / 90 / 180 / 270）")
+        
+        return self.render_params._replace(crop=crop, fit=fit, rotate=rotate)
+    
     async def handle_status(self, request):
         """返回伺服器狀態"""
         return web.json_response({
             'clients': len(self.clients),
             'last_status': self.last_status,
             'is_sending': self.is_sending,
-            'local_ip': get_local_ip()
+            'local_ip': get_local_ip(),
+            'payload_cache': self.payload_cache.stats(),
+            'frame_cache': self.frame_cache.stats() if self.frame_cache else None,
+            'static_frames': self.static_frames.stats(),
+            'frame_store': self.frame_store.stats() if self.frame_store else None,
+            'render': self.render_stats,
+            'animation': self.animation_task is not None and not self.animation_task.done()
         })
     
     async def handle_send_test(self, request):
@@ -1136,6 +1183,95 @@ class DisplayServer:
                 'error': str(e)
             })
     
+    async def handle_send_text(self, request):
+        """發送文字（JSON: {"text": ..., "max_font_size": ...}）"""
+        if not self.clients:
+            return web.json_response({
+                'success': False,
+                'error': '沒有連接的 ESP8266 設備'
+            })
+        
+        try:
+            data = await request.json()
+            text = str(data.get('text', ''))
+            if not text.strip():
+                return web.json_response({
+                    'success': False,
+                    'error': '沒有文字'
+                })
+            
+            self.last_status = "傳送文字..."
+            await self.send_text_800(text, data.get('max_font_size'))
+            self.last_status = "文字已傳送"
+            
+            return web.json_response({
+                'success': True,
+                'message': '文字已傳送'
+            })
+        except Exception as e:
+            self.last_status = f"錯誤: {str(e)}"
+            logger.error(f"發送文字時發生錯誤: {e}")
+            return web.json_response({
+                'success': False,
+                'error': str(e)
+            })
+    
+    async def handle_frames(self, request):
+        """列出畫面儲存檔中的畫面（最新的在前）"""
+        if self.frame_store is None:
+            return web.json_response({
+                'success': False,
+                'error': '未啟用畫面儲存檔'
+            })
+        
+        try:
+            limit = int(request.query.get('limit', 50))
+            if limit < 0:
+                raise ValueError
+        except ValueError:
+            return web.json_response({
+                'success': False,
+                'error': f"limit 需為非負整數: {request.query.get('limit')}"
+            }, status=400)
+        
+        entries = list(self.frame_store.entries())[::-1][:limit]
+        return web.json_response({
+            'success': True,
+            'frames': [{'slot': slot, 'hash': digest, 'name': name} for slot, digest, name in entries],
+            'total': len(self.frame_store)
+        })
+    
+    async def handle_replay(self, request):
+        """重播儲存的畫面（JSON: {"key": 名稱 / 雜湊前綴 / 位置}）"""
+        if not self.clients:
+            return web.json_response({
+                'success': False,
+                'error': '沒有連接的 ESP8266 設備'
+            })
+        
+        try:
+            data = await request.json()
+            self.last_status = "重播畫面..."
+            if not await self.replay_frame(data.get('key')):
+                self.last_status = "找不到畫面"
+                return web.json_response({
+                    'success': False,
+                    'error': f"找不到畫面: {data.get('key')}"
+                })
+            self.last_status = "畫面已重播"
+            
+            return web.json_response({
+                'success': True,
+                'message': '畫面已重播'
+            })
+        except Exception as e:
+            self.last_status = f"錯誤: {str(e)}"
+            logger.error(f"重播畫面時發生錯誤: {e}")
+            return web.json_response({
+                'success': False,
+                'error': str(e)
+            })
+    
     async def handle_clear(self, request):
         """清除螢幕"""
         if not self.clients:
@@ -1164,6 +1300,7 @@ class DisplayServer:
     async def register(self, websocket):
         """註冊客戶端"""
         self.clients.add(websocket)
+        self.last_frame = None  # 新設備尚未收過任何畫面
         logger.info(f"客戶端連接: {websocket.remote_address}")
         logger.info(f"目前連接數: {len(self.clients)}")
         self.last_status = f"設備已連接 ({len(self.clients)})"
@@ -1202,6 +1339,7 @@ class DisplayServer:
                         logger.info(f"✓ ESP8266 確認收到 SeqID={info['seq_id']}")
                     elif info['type_code'] == PacketType.NAK:
                         logger.warning(f"✗ ESP8266 回報錯誤 SeqID={info['seq_id']}")
+                        self.last_frame = None  # 畫面狀態不明，下次送完整畫面
         else:
             # 文字訊息
             message_str = message.strip()
@@ -1218,7 +1356,9 @@ class DisplayServer:
             logger.warning("沒有連接的客戶端")
             return
         
+        self.stop_animation()
         self.seq_id += 1
+        self.last_frame = None
         packet = Protocol.pack_command(self.seq_id, cmd)
         logger.info(f"發送指令: {cmd}")
         
@@ -1228,16 +1368,57 @@ class DisplayServer:
         )
     
     async def send_test_pattern_800(self):
-        """發送測試圖案 (800×480 完整畫面模式)"""
-        logger.info("生成測試圖案 (800×480)")
-        test_img = self.processor_800.create_test_pattern()
-        await self.send_full_screen_800x480_from_image(test_img)
+        """發送測試圖案 (800×480 完整畫面模式，預先渲染的固定畫面)"""
+        await self.send_static_frame('test_800x480')
+    
+    async def send_static_frame(self, name: str):
+        """
+        發送固定畫面（預先渲染與編碼，不做任何影像處理）
+        
+        Args:
+            name: 固定畫面名稱（test_800x480 / white_800x480 / splash 等）
+        """
+        if not self.clients:
+            logger.warning("沒有連接的客戶端")
+            return
+        
+        logger.info(f"=== 發送固定畫面: {name} ===")
+        try:
+            self.seq_id += 1
+            packet = self._pack_static(name)
+        except Exception as e:
+            logger.error(f"發送固定畫面失敗: {e}")
+            return
+        
+        # 只有 800×480 完整畫面需等待 ESP32-C3 回報 READY
+        frame = self.static_frames.get(name)
+        await self._broadcast_frame(packet, wait_ready=len(frame.data) == self.processor_800.total_bytes)
+    
+    async def send_text_800(self, text: str, max_font_size: int = None):
+        """
+        發送文字 (800×480 完整畫面模式，自動換行並選擇放得下的最大字體)
+        
+        Args:
+            text: 要顯示的文字（可含換行）
+            max_font_size: 最大字體大小（None 則不限制）
+        """
+        logger.info(f"排版文字 (800×480): {text!r}")
+        text_img = await self.render_pool.run(self.processor_800.create_fitted_text_image, text, None, max_font_size)
+        await self.send_full_screen_800x480_from_image(text_img)
     
     async def send_tiled_image_800(self, image_path: str):
-        """發送分區圖片 (800×480, 3個條帶)"""
+        """發送分區圖片 (800×480, 水平條帶)"""
+        if not self.clients:
+            logger.warning("沒有連接的客戶端")
+            return
+        
         logger.info(f"處理圖片: {image_path}")
-        img = Image.open(image_path)
-        await self.send_tiled_image_800_from_image(img)
+        with open(image_path, 'rb') as f:
+            source = f.read()
+        
+        # 解碼與渲染在背景 worker 執行（相同圖片會命中畫面快取）
+        frame = await self._render_source(self.processor_800, source)
+        await self._send_bands(frame)
     
     async def send_tiled_image_800_from_image(self, img: Image.Image):
         """從 PIL Image 發送分區圖片"""
@@ -1247,75 +1428,12 @@ class DisplayServer:
         
         logger.info(f"原始圖片: {img.size}, 模式: {img.mode}")
         
-        # 轉換為 1-bit (使用 800x480 處理器)
-        processed = self.processor_800.convert_to_1bit(img, dither=True)
-        logger.info(f"轉換為 1-bit: {processed.size}")
-        
-        # 分割成 3 個水平條帶（垂直分割：上、中、下）
-        tiles = self.processor_800.split_image_to_tiles(processed)
-        logger.info(f"分割為 {len(tiles)} 個條帶 (800×160, 垂直分割)")
-        
-        tile_names = ["條帶0 (上)", "條帶1 (中)", "條帶2 (下)"]
-        total_raw = 0
-        total_compressed = 0
-        
-        # 依序發送 3 個條帶
-        for tile_index in range(3):
-            logger.info(f"\n--- 處理條帶 {tile_index} ({tile_names[tile_index]}) ---")
-            
-            tile_image = tiles[tile_index]
-            
-            # 處理條帶（轉換為 bytes）- tile 已經是 1-bit
-            tile_data = self.processor_800.process_tile(tile_image, dither=False)
-            logger.info(f"條帶資料: {len(tile_data)} bytes (800x160)")
-            total_raw += len(tile_data)
-            
-            # 不使用壓縮
-            compressed_data = tile_data
-            is_compressed = False
-            logger.info(f"發送未壓縮資料: {len(compressed_data)} bytes（避免記憶體碎片化）")
-            
-            total_compressed += len(compressed_data)
-            
-            # 創建分區封包
-            self.seq_id += 1
-            packet = Protocol.pack_tile(self.seq_id, tile_index, compressed_data)
-            logger.info(f"封包大小: {len(packet)} bytes (含標頭)")
-            
-            # 發送
-            logger.info(f"發送條帶 {tile_index} 到 {len(self.clients)} 個客戶端...")
-            await asyncio.gather(
-                *[client.send(packet) for client in self.clients],
-                return_exceptions=True
-            )
-            logger.info(f"✓ 條帶 {tile_index} ({tile_names[tile_index]}) 發送完成")
-            
-            # 等待 ESP8266 完成顯示並發送 READY 訊號
-            if tile_index < 2:
-                logger.info(f"等待條帶 {tile_index} 顯示完成...")
-                self.tile_ready_event.clear()
-                
-                try:
-                    await asyncio.wait_for(self.tile_ready_event.wait(), timeout=30.0)
-                    logger.info(f"✓ 條帶 {tile_index} 顯示完成，準備發送下一個條帶")
-                except asyncio.TimeoutError:
-                    logger.warning(f"⚠️ 等待條帶 {tile_index} 完成超時，繼續發送下一個條帶")
-            else:
-                # 最後一個條帶，等待 READY 訊號確保完成
-                logger.info(f"等待最後一個條帶完成...")
-                self.tile_ready_event.clear()
-                try:
-                    await asyncio.wait_for(self.tile_ready_event.wait(), timeout=30.0)
-                    logger.info(f"✓ 最後一個條帶顯示完成")
-                except asyncio.TimeoutError:
-                    logger.warning(f"⚠️ 等待最後一個條帶超時")
-        
-        # 統計
-        overall_ratio = self.compressor.compress_ratio(total_raw, total_compressed)
-        logger.info(f"\n=== 完成 ===")
-        logger.info(f"總原始資料: {total_raw} bytes")
-        logger.info(f"總傳輸資料: {total_compressed} bytes")
-        logger.info(f"整體壓縮率: {overall_ratio:.1f}%")
+        # 整張渲染並打包一次 (使用 800x480 處理器，於背景 worker 執行)
+        if img.mode == '1' and img.size == (800, 480):
+            frame = self.processor_800.image_to_bytes(img)
+        else:
+            frame = await self.render_pool.run(self.processor_800.render_packed, img)
+        await self._send_bands(frame)
     
     async def send_full_screen_800x480(self, image_path: str):
         """
@@ -1331,8 +1449,42 @@ class DisplayServer:
             image_path: 圖片檔案路徑
         """
         logger.info(f"處理圖片: {image_path}")
-        img = Image.open(image_path)
-        await self.send_full_screen_800x480_from_image(img)
+        with open(image_path, 'rb') as f:
+            source = f.read()
+        
+        # batch_convert.py 預先轉換的 .bin 已是打包畫面，直接發送
+        if image_path.endswith(PACKED_SUFFIX):
+            if self.clients:
+                await self._send_full_frame(source, Path(image_path).name)
+            return
+        
+        await self.send_full_screen_800x480_from_bytes(source, Path(image_path).name)
+    
+    async def send_full_screen_800x480_from_bytes(self, source: bytes, name: str = None,
+                                                  params: RenderParams = None):
+        """
+        從圖片檔案內容發送完整畫面 (800×480)，相同內容與參數會命中畫面快取
+        
+        Args:
+            source: 圖片檔案內容
+            name: 存入畫面儲存檔時使用的名稱
+            params: 渲染參數（裁切 / 放入 / 旋轉，None 則使用 self.render_params）
+        """
+        if not self.clients:
+            logger.warning("沒有連接的客戶端")
+            return
+        
+        logger.info(f"=== 開始完整畫面傳輸 (800x480) ===")
+        logger.info(f"原始檔案: {len(source)} bytes")
+        
+        try:
+            # 縮放、抖動並打包為 1-bit（48000 bytes = 800 * 480 / 8）
+            image_data = await self._render_source(self.processor_800, source, params)
+        except Exception as e:
+            logger.error(f"圖片處理失敗: {e}")
+            return
+        
+        await self._send_full_frame(image_data, name)
     
     async def send_full_screen_800x480_from_image(self, img: Image.Image):
         """從 PIL Image 發送完整畫面 (800×480)"""
@@ -1344,55 +1496,13 @@ class DisplayServer:
         logger.info(f"原始圖片: {img.size}, 模式: {img.mode}")
         
         try:
-            # 轉換為 1-bit (使用 800x480 處理器)
-            processed = self.processor_800.convert_to_1bit(img, dither=True)
-            logger.info(f"轉換為 1-bit: {processed.size}")
-            
-            # 轉換為 bytes（48000 bytes = 800 * 480 / 8）
-            image_data = self.processor_800.image_to_bytes(processed)
-            logger.info(f"圖像資料: {len(image_data)} bytes")
-            
-            if len(image_data) != 48000:
-                logger.error(f"圖像資料大小錯誤: 預期 48000 bytes, 實際 {len(image_data)} bytes")
-                return
-            
-            # 不使用壓縮，直接發送未壓縮資料
-            # （ESP32-C3 有足夠記憶體，避免壓縮/解壓縮的複雜度）
-            logger.info(f"發送未壓縮資料: {len(image_data)} bytes（完整畫面模式）")
-            
-            # 創建完整畫面封包
-            self.seq_id += 1
-            packet = Protocol.pack_full_frame(self.seq_id, image_data)
-            logger.info(f"封包大小: {len(packet)} bytes (含標頭)")
-            
-            # 發送到所有客戶端
-            logger.info(f"發送完整畫面到 {len(self.clients)} 個客戶端...")
-            start_time = asyncio.get_event_loop().time()
-            
-            await asyncio.gather(
-                *[client.send(packet) for client in self.clients],
-                return_exceptions=True
-            )
-            
-            elapsed = asyncio.get_event_loop().time() - start_time
-            logger.info(f"✓ 完整畫面發送完成 (耗時: {elapsed:.2f} 秒)")
-            
-            # 等待 ESP32-C3 完成顯示並發送 READY 訊號
-            logger.info(f"等待設備完成顯示...")
-            self.tile_ready_event.clear()
-            
-            try:
-                await asyncio.wait_for(self.tile_ready_event.wait(), timeout=30.0)
-                logger.info(f"✓ 設備顯示完成")
-            except asyncio.TimeoutError:
-                logger.warning(f"⚠️ 等待設備完成超時")
-            
-            logger.info(f"=== 完整畫面傳輸完成 ===")
-            
+            # 縮放、抖動並打包為 1-bit（48000 bytes = 800 * 480 / 8），於背景 worker 執行
+            image_data = await self.render_pool.run(self.processor_800.render_packed, img)
         except Exception as e:
-            logger.error(f"發送完整畫面失敗: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.error(f"圖片處理失敗: {e}")
+            return
+        
+        await self._send_full_frame(image_data)
     
     def _udp_broadcast_thread(self):
         """UDP 廣播執行緒（背景執行）"""
@@ -1478,9 +1588,14 @@ async def interactive_mode(server: DisplayServer):
     print("可用指令:")
     print("  clients           - 顯示連接的客戶端")
     print("  test              - 發送測試圖案 (800×480)")
+    print("  frame <名稱>      - 發送固定畫面 (white_800x480 / black_800x480 / splash ...)")
     print("  clear             - 清空螢幕")
+    print("  frames            - 列出畫面儲存檔中最近的畫面")
+    print("  replay <名稱|位置> - 重播儲存的畫面 (800×480，不需重新處理)")
     print("  full <圖片路徑>   - 發送完整畫面 (800×480, 推薦, 無殘影)")
     print("  tile <圖片路徑>   - 發送分區圖片 (800×480, 舊版)")
+    print("  anim <圖片路徑> [輪數] - 播放動畫 GIF (800×480, 0 表示持續循環)")
+    print("  stop              - 停止動畫")
     print("  web               - 顯示網頁界面連結")
     print("  quit              - 結束程式")
     print()
@@ -1509,10 +1624,33 @@ async def interactive_mode(server: DisplayServer):
                 await server.send_test_pattern_800()
             elif action == "clear":
                 await server.send_command(Command.CLEAR_SCREEN)
+            elif action == "frames":
+                if server.frame_store is None:
+                    print("未啟用畫面儲存檔")
+                else:
+                    for slot, digest, name in list(server.frame_store.entries())[-20:]:
+                        print(f"  {slot:5d}  {digest[:16]}  {name or ''}")
+                    print(f"共 {len(server.frame_store)} 個畫面")
+            elif action == "replay" and len(parts) > 1:
+                key = int(parts[1]) if parts[1].lstrip('-').isdigit() else parts[1]
+                await server.replay_frame(key)
+            elif action == "frame" and len(parts) > 1:
+                if parts[1] in server.static_frames:
+                    await server.send_static_frame(parts[1])
+                else:
+                    print(f"可用的固定畫面: {', '.join(server.static_frames.names())}")
             elif action == "full" and len(parts) > 1:
                 await server.send_full_screen_800x480(parts[1])
             elif action == "tile" and len(parts) > 1:
                 await server.send_tiled_image_800(parts[1])
+            elif action == "anim" and len(parts) > 1:
+                path, _, loops = parts[1].partition(' ')
+                with open(path, 'rb') as f:
+                    animation = await server.render_animation(server.processor_800, f.read())
+                server.start_animation(server.processor_800, animation, int(loops) if loops else None,
+                                       legacy_codecs=(RawCodec.name,))
+            elif action == "stop":
+                server.stop_animation()
             elif action == "web":
                 local_ip = get_local_ip()
                 print(f"\n🌐 網頁控制介面:")
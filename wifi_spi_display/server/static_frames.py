@@ -0,0 +1,227 @@
+"""
+固定畫面模組
+測試圖案、全白 / 全黑與開機畫面只渲染、打包、編碼一次，
+之後每次發送只需改寫封包序號，不再經過 ImageDraw / 抖動 / 編碼
+"""
+
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+from frame_cache import frame_digest
+from image_processor import ImageProcessor
+
+
+class StaticFrame(NamedTuple):
+    """已打包的固定畫面"""
+    name: str
+    width: int
+    height: int
+    data: bytes     # 打包後的 1-bit 畫面
+    digest: bytes   # frame_digest(data)
+
+
+class StaticFrameRegistry:
+    """
+    固定畫面登錄表
+    
+    畫面在 prebuild() 或第一次使用時渲染；編碼後的封包以 (名稱, 編碼參數) 快取，
+    發送時以 Protocol.with_seq_id() 換上目前的序號即可
+    """
+    
+    def __init__(self):
+        self._builders: Dict[str, Tuple[int, int, Callable[[], bytes]]] = {}
+        self._frames: Dict[str, StaticFrame] = {}
+        self._packets: Dict[Tuple, bytes] = {}
+    
+    def register(self, name: str, width: int, height: int, builder: Callable[[], bytes]):
+        """
+        登錄固定畫面（重新登錄會清除舊的畫面與封包）
+        
+        Args:
+            name: 畫面名稱
+            width: 畫面寬度
+            height: 畫面高度
+            builder: 產生打包畫面的函式（無參數）
+        """
+        self._builders[name] = (width, height, builder)
+        self._frames.pop(name, None)
+        self._packets = {key: packet for key, packet in self._packets.items() if key[0] != name}
+    
+    def names(self) -> Tuple[str, ...]:
+        """已登錄的畫面名稱"""
+        return tuple(self._builders)
+    
+    def __contains__(self, name):
+        return name in self._builders
+    
+    def get(self, name: str) -> StaticFrame:
+        """
+        取得固定畫面（第一次使用時渲染）
+        
+        Args:
+            name: 畫面名稱
+        
+        Returns:
+            StaticFrame
+        """
+        frame = self._frames.get(name)
+        if frame is not None:
+            return frame
+        
+        if name not in self._builders:
+            raise KeyError(f"未知的固定畫面: {name}")
+        
+        width, height, builder = self._builders[name]
+        data = bytes(builder())
+        if len(data) != width * height // 8:
+            raise ValueError(f"固定畫面 {name} 大小錯誤: 預期 {width * height // 8} bytes, 實際 {len(data)} bytes")
+        
+        frame = StaticFrame(name, width, height, data, frame_digest(data))
+        self._frames[name] = frame
+        return frame
+    
+    def packet(self, name: str, encode: Callable[[StaticFrame], bytes], variant: Tuple = ()) -> bytes:
+        """
+        取得固定畫面的已編碼封包（第一次使用時以 encode 編碼）
+        
+        Args:
+            name: 畫面名稱
+            encode: 將 StaticFrame 編碼為完整封包的函式（序號之後會被改寫）
+            variant: 影響編碼結果的參數（編碼模式、可用編碼器等）
+        
+        Returns:
+            完整封包
+        """
+        key = (name,) + tuple(variant)
+        packet = self._packets.get(key)
+        if packet is None:
+            packet = encode(self.get(name))
+            self._packets[key] = packet
+        return packet
+    
+    def prebuild(self, names: Optional[Tuple[str, ...]] = None):
+        """
+        預先渲染畫面（伺服器啟動時呼叫）
+        
+        Args:
+            names: 要渲染的畫面（None 表示全部）
+        """
+        for name in names or self.names():
+            self.get(name)
+    
+    def stats(self) -> dict:
+        """
+        取得統計
+        
+        Returns:
+            統計字典
+        """
+        return {
+            'frames': len(self._builders),
+            'built': len(self._frames),
+            'packets': len(self._packets),
+            'bytes': sum(len(frame.data) for frame in self._frames.values()) +
+                     sum(len(packet) for packet in self._packets.values()),
+        }
+
+
+def solid_frame(processor: ImageProcessor, white: bool) -> bytes:
+    """
+    全白 / 全黑畫面（白 = 1）
+    
+    Args:
+        processor: 目標尺寸的處理器
+        white: True 為全白
+    
+    Returns:
+        打包後的畫面
+    """
+    return (b'\xff' if white else b'\x00') * processor.total_bytes
+
+
+def pattern_frame(processor: ImageProcessor) -> bytes:
+    """
+    測試圖案畫面
+    
+    Args:
+        processor: 目標尺寸的處理器
+    
+    Returns:
+        打包後的畫面
+    """
+    return processor.image_to_bytes(processor.create_test_pattern())
+
+
+def splash_frame(processor: ImageProcessor, image_path: Optional[str] = None,
+                 text: str = "WiFi e-Paper") -> bytes:
+    """
+    開機畫面：指定圖片時渲染圖片，否則以自動排版顯示文字
+    
+    Args:
+        processor: 目標尺寸的處理器
+        image_path: 圖片路徑（None 則顯示文字）
+        text: 文字
+    
+    Returns:
+        打包後的畫面
+    """
+    if image_path:
+        with Image.open(image_path) as img:
+            return processor.render_packed(img)
+    return processor.image_to_bytes(processor.create_fitted_text_image(text))
+
+
+def default_static_frames(processor: ImageProcessor, processor_800: ImageProcessor,
+                          splash_image: Optional[str] = None,
+                          splash_text: str = "WiFi e-Paper") -> StaticFrameRegistry:
+    """
+    建立伺服器使用的固定畫面
+    
+    - test_400x240 / test_800x480: 測試圖案
+    - white_* / black_*: 全白 / 全黑
+    - splash: 800×480 開機畫面
+    
+    Args:
+        processor: 400×240 處理器
+        processor_800: 800×480 處理器
+        splash_image: 開機畫面圖片路徑
+        splash_text: 未指定圖片時的開機文字
+    
+    Returns:
+        StaticFrameRegistry
+    """
+    registry = StaticFrameRegistry()
+    for proc in (processor, processor_800):
+        size = f"{proc.width}x{proc.height}"
+        registry.register(f"test_{size}", proc.width, proc.height, lambda p=proc: pattern_frame(p))
+        registry.register(f"white_{size}", proc.width, proc.height, lambda p=proc: solid_frame(p, True))
+        registry.register(f"black_{size}", proc.width, proc.height, lambda p=proc: solid_frame(p, False))
+    registry.register("splash", processor_800.width, processor_800.height,
+                      lambda: splash_frame(processor_800, splash_image, splash_text))
+    return registry
+
+
+if __name__ == "__main__":
+    # 測試程式
+    import time
+    
+    print("=== 固定畫面測試 ===")
+    
+    registry = default_static_frames(ImageProcessor(400, 240), ImageProcessor(800, 480))
+    
+    start = time.perf_counter()
+    registry.prebuild()
+    print(f"預先渲染 {len(registry.names())} 個畫面: {(time.perf_counter() - start) * 1000:.1f} ms")
+    
+    for name in registry.names():
+        frame = registry.get(name)
+        print(f"  {name:14s} {frame.width}x{frame.height} {len(frame.data)} bytes")
+    
+    start = time.perf_counter()
+    for _ in range(1000):
+        registry.get("test_800x480")
+    print(f"取用: {(time.perf_counter() - start) * 1000:.3f} µs/次 (1000 次)")
+    print(f"統計: {registry.stats()}")
+    
+    print("\n測試完成！")
@@ -26,7 +26,7 @@ print("✅ RLE 壓縮測試通過")
 print("\n【測試 2】影像處理")
 print("-" * 50)
 from image_processor import ImageProcessor
-processor = ImageProcessor()
+processor = ImageProcessor(800, 480)
 img = processor.create_text_image("Hello World")
 print(f"影像尺寸: {img.size}")
 img_1bit = processor.convert_to_1bit(img)
@@ -63,7 +63,7 @@ img_bytes = processor.image_to_bytes(processor.convert_to_1bit(img))
 compressed = compressor.compress(img_bytes)
 ratio = len(compressed) / len(img_bytes) * 100
 print(f"原始影像: {len(img_bytes)} bytes")
-print(f"壓縮後: {compressed} bytes")
+print(f"壓縮後: {len(compressed)} bytes")
 print(f"壓縮率: {ratio:.1f}%")
 decompressed = compressor.decompress(compressed)
 assert decompressed == img_bytes
@@ -73,6 +73,7 @@ print("✅ 完整壓縮流程測試通過")
 print("\n【測試 5】Delta 壓縮")
 print("-" * 50)
 from compressor import DeltaCompressor
+import numpy as np
 delta_comp = DeltaCompressor()
 old_data = bytes([0xFF] * 48000)
 new_data = bytes([0xFF] * 1000 + [0x00] * 100 + [0xFF] * 46900)
@@ -87,11 +88,600 @@ print("第一幀: 完整資料")
 diff2, full2 = delta_comp.compress(new_data)
 assert diff2 is not None
 assert full2 is None
-print(f"第二幀: {len(diff2)} 個差異點")
+print(f"第二幀: {len(diff2)} 個差異區段, {sum(length for _, length, _ in diff2)} 個差異 bytes")
+assert diff2 == [(1000, 100, new_data[1000:1100])]
 ratio = delta_comp.get_diff_ratio(diff2, len(new_data))
 print(f"差異比例: {ratio:.2f}%")
+starts, lengths = DeltaCompressor.find_spans(np.frombuffer(old_data, dtype=np.uint8),
+                                             np.frombuffer(new_data, dtype=np.uint8))
+packed = DeltaCompressor.pack_spans(np.frombuffer(new_data, dtype=np.uint8), starts, lengths)
+print(f"打包後: {len(packed)} bytes")
+assert DeltaCompressor.apply_packed(old_data, packed) == new_data
 print("✅ Delta 壓縮測試通過")
 
+# 測試 6: 向量化 RLE 與逐 byte 版本一致
+print("\n【測試 6】向量化 RLE 一致性")
+print("-" * 50)
+rng = np.random.default_rng(0)
+samples = [
+    b'',
+    bytes([0x5A]),
+    bytes([0xFF] * 600 + [0x00] * 255 + [0xFF] * 256),
+    bytes(rng.integers(0, 256, 1000, dtype=np.uint8)),
+    img_bytes,
+]
+for sample in samples:
+    assert compressor.compress(sample) == compressor._compress_python(sample)
+print(f"{len(samples)} 組樣本輸出完全相同")
+print("✅ 向量化 RLE 測試通過")
+
+# 測試 7: 向量化 RLE 解壓縮（寫入既有緩衝區）
+print("\n【測試 7】RLE 解壓縮到緩衝區")
+print("-" * 50)
+compressed = compressor.compress(img_bytes)
+frame_buffer = bytearray(48000)
+written = compressor.decompress_into(compressed, frame_buffer, expected_size=48000)
+assert written == 48000
+assert bytes(frame_buffer) == img_bytes
+for bad_data, size in [(compressed[:-1], None), (compressed, 47999)]:
+    try:
+        compressor.decompress(bad_data, size)
+        raise AssertionError("應拒絕錯誤的 RLE 資料")
+    except ValueError as e:
+        print(f"正確拒絕: {e}")
+print("✅ RLE 解壓縮到緩衝區測試通過")
+
+# 測試 8: 分塊 RLE（受限於 client 緩衝區）
+print("\n【測試 8】分塊 RLE")
+print("-" * 50)
+rebuilt = bytearray(len(img_bytes))
+chunk_count = 0
+for offset, chunk in compressor.iter_chunks(img_bytes, max_chunk_size=1000, max_decoded_size=16000):
+    assert len(chunk) <= 1000
+    written = compressor.decompress_into(chunk, memoryview(rebuilt)[offset:])
+    assert written <= 16000
+    chunk_count += 1
+assert bytes(rebuilt) == img_bytes
+print(f"{chunk_count} 個 chunk，皆可獨立解碼")
+rebuilt = bytearray(len(img_bytes))
+for offset, chunk in compressor.iter_chunks(img_bytes, max_chunk_size=1000, max_decoded_size=16000, align=100):
+    assert offset % 100 == 0 and len(chunk) <= 1000
+    written = compressor.decompress_into(chunk, memoryview(rebuilt)[offset:])
+    assert written % 100 == 0
+assert bytes(rebuilt) == img_bytes
+# 第一個對齊單位就放不下時不可送出超過上限的 chunk
+noisy_rows = np.random.default_rng(0).integers(0, 256, 95 * 6, dtype=np.uint8).tobytes()
+try:
+    list(compressor.iter_chunks(noisy_rows, max_chunk_size=119, max_decoded_size=515, align=95))
+    assert False, "應拒絕放不下對齊單位的 max_chunk_size"
+except ValueError:
+    pass
+print("對齊整列的 chunk 皆可獨立解碼")
+print("✅ 分塊 RLE 測試通過")
+
+# 測試 9: 變化區域偵測（時鐘類小範圍更新）
+print("\n【測試 9】變化區域偵測")
+print("-" * 50)
+from compressor import DirtyRectDetector
+detector = DirtyRectDetector(800, 480)
+before = np.full((480, 100), 0xFF, dtype=np.uint8)
+after = before.copy()
+after[200:240, 40:60] = 0x00   # 模擬時鐘數字改變
+after[10, 5] = 0x0F
+regions = detector.regions(before.tobytes(), after.tobytes())
+rebuilt = before.copy()
+for x, y, w, h, data in regions:
+    assert x % 8 == 0 and w % 8 == 0
+    rebuilt[y:y + h, x // 8:(x + w) // 8] = np.frombuffer(data, dtype=np.uint8).reshape(h, w // 8)
+assert (rebuilt == after).all()
+rects = detector.detect(before.tobytes(), after.tobytes())
+assert DirtyRectDetector.packed_size(rects) == DirtyRectDetector.payload_size(regions)
+delta_packet = protocol.pack_delta(2, regions)
+print(f"{len(regions)} 個區域, 差分封包 {len(delta_packet)} bytes (完整畫面 48000 bytes)")
+assert len(delta_packet) < 2000
+print("✅ 變化區域偵測測試通過")
+
+# 測試 10: 編碼大小估算
+print("\n【測試 10】編碼大小估算")
+print("-" * 50)
+from compressor import HybridCompressor
+estimate = HybridCompressor.estimate(np.frombuffer(old_data, dtype=np.uint8),
+                                     np.frombuffer(new_data, dtype=np.uint8))
+print(f"估算: {estimate}")
+assert estimate['rle_size'] == len(compressor.compress(new_data))
+assert estimate['delta_size'] == len(packed)
+assert estimate['delta_spans'] == 1 and estimate['delta_bytes'] == 100
+assert compressor.estimate_size(img_bytes) == len(compressor.compress(img_bytes))
+print("✅ 編碼大小估算測試通過")
+
+# 測試 11: PackBits（抖動照片）
+print("\n【測試 11】PackBits 壓縮")
+print("-" * 50)
+from compressor import PackBitsCompressor
+from PIL import Image
+photo = processor.image_to_bytes(processor.convert_to_1bit(Image.open("CAT_800.png"), dither=True))
+packbits = PackBitsCompressor.compress(photo)
+print(f"抖動照片: RLE {len(compressor.compress(photo))} bytes, PackBits {len(packbits)} bytes")
+assert PackBitsCompressor.decompress(packbits, len(photo)) == photo
+noise = bytes(rng.integers(0, 256, 48000, dtype=np.uint8))
+worst = PackBitsCompressor.compress(noise)
+print(f"隨機資料: {len(worst)} bytes (上限 {48000 + 48000 // 128})")
+assert len(worst) <= 48000 + 48000 // 128
+assert PackBitsCompressor.decompress(worst) == noise
+print("✅ PackBits 壓縮測試通過")
+
+# 測試 12: 列預測濾波 + RLE
+print("\n【測試 12】列預測濾波")
+print("-" * 50)
+from compressor import RowFilter
+pattern = processor.image_to_bytes(processor.create_test_pattern())
+filtered = RowFilter.compress(pattern, row_bytes=100)
+print(f"測試圖案: RLE {len(compressor.compress(pattern))} bytes, Up 濾波 + RLE {len(filtered)} bytes")
+assert filtered[0] == RowFilter.FILTER_UP
+assert len(filtered) < len(compressor.compress(pattern))
+assert RowFilter.decompress(filtered, len(pattern)) == pattern
+print("✅ 列預測濾波測試通過")
+
+# 測試 13: 編碼器註冊表與自動選擇
+print("\n【測試 13】編碼器註冊表")
+print("-" * 50)
+from compressor import CodecRegistry, CodecSelector
+registry = CodecRegistry.default()
+print(f"已註冊: {registry.names()}")
+for codec in registry:
+    payload = codec.encode(pattern, previous=img_bytes)
+    assert codec.decode(payload, len(pattern), previous=img_bytes) == pattern
+    assert registry.get(codec.codec_id) is codec
+selector = CodecSelector(registry)
+chosen, payload = selector.encode(photo)
+print(f"抖動照片選用: {chosen.name} ({len(payload)} bytes)")
+assert chosen.name == 'packbits'
+packet = protocol.pack_encoded_frame(3, chosen.codec_id, len(photo), payload)
+codec_id, raw_size, body = protocol.unpack_encoded_frame(packet[protocol.HEADER_SIZE:])
+assert registry.get(codec_id).decode(body, raw_size) == photo
+print("✅ 編碼器註冊表測試通過")
+
+# 測試 14: 已編碼 payload 快取
+print("\n【測試 14】Payload 快取")
+print("-" * 50)
+from frame_cache import PayloadCache, frame_digest
+cache = PayloadCache(max_bytes=len(payload) * 2)
+key = PayloadCache.make_key(frame_digest(photo), ('auto', 100, None))
+assert cache.get(key) is None
+cache.put_payload(key, chosen, payload)
+assert cache.get(key) == (chosen, payload)
+cache.put_payload(PayloadCache.make_key(frame_digest(pattern), ('rle',)), 'rle', bytes(len(payload)))
+cache.put_payload(PayloadCache.make_key(frame_digest(img_bytes), ('rle',)), 'rle', bytes(len(payload)))
+assert key not in cache   # 超過大小上限，最久未使用者被淘汰
+stats = cache.stats()
+print(f"統計: {stats}")
+assert stats['hits'] == 1 and stats['misses'] == 1 and stats['evictions'] == 1
+print("✅ Payload 快取測試通過")
+
+# 測試 15: 抖動演算法
+print("\n【測試 15】抖動演算法")
+print("-" * 50)
+gradient = Image.fromarray(np.tile(np.linspace(0, 255, 800).astype(np.uint8), (480, 1)))
+for mode in ImageProcessor.DITHER_MODES:
+    dithered = processor.convert_to_1bit(gradient, dither_mode=mode)
+    assert dithered.mode == '1' and dithered.size == (800, 480)
+    white_ratio = np.asarray(dithered).mean()
+    print(f"{mode:16s} 白色比例: {white_ratio:.3f}")
+    assert abs(white_ratio - 0.5) < 0.02, f"{mode} 平均亮度偏差過大"
+assert sorted(ImageProcessor.bayer_matrix(4).flatten().tolist()) == list(range(16))
+assert sorted(ImageProcessor.bayer_matrix(8).flatten().tolist()) == list(range(64))
+
+# 波前誤差擴散需與逐點掃描結果一致
+small = np.random.default_rng(1).integers(0, 256, (12, 20)).astype(np.uint8)
+for kernel in (ImageProcessor.FLOYD_STEINBERG_KERNEL, ImageProcessor.ATKINSON_KERNEL):
+    buf = small.astype(np.float64)
+    expected = np.zeros(small.shape, dtype=bool)
+    for y in range(12):
+        for x in range(20):
+            expected[y, x] = buf[y, x] >= 128
+            error = buf[y, x] - (255 if expected[y, x] else 0)
+            for dx, dy, weight in kernel:
+                if 0 <= x + dx < 20 and y + dy < 12:
+                    buf[y + dy, x + dx] += error * weight
+    assert np.array_equal(ImageProcessor.error_diffusion(small, kernel), expected)
+print("✅ 抖動演算法測試通過")
+
+# 測試 16: 快速縮放（draft + reduce）
+print("\n【測試 16】快速縮放")
+print("-" * 50)
+import io
+fast = ImageProcessor(800, 480, resample='BILINEAR', max_intermediate_size=2000)
+assert fast.reduce_factors((4032, 3024)) == (3, 3)     # 保留 2 倍解析度給最終濾波器
+assert fast.reduce_factors((9000, 480)) == (5, 1)      # 中間圖像不超過 2000
+assert fast.reduce_factors((800, 480)) == (1, 1)
+jpeg = io.BytesIO()
+photo_rgb = Image.open("CAT_800.png").convert('RGB').resize((3200, 1920))
+photo_rgb.save(jpeg, format='JPEG', quality=90)
+source = Image.open(io.BytesIO(jpeg.getvalue()))
+resized = fast.resize_to_target(source)
+print(f"{photo_rgb.size} JPEG → draft {source.size} → {resized.size} {resized.mode}")
+assert resized.size == (800, 480) and resized.mode == 'L'
+assert source.size == (800, 480)    # draft 在解碼時已縮小為 1/4
+legacy = np.asarray(photo_rgb.resize((800, 480), Image.Resampling.LANCZOS).convert('L'), dtype=np.float32)
+assert np.abs(np.asarray(resized, dtype=np.float32) - legacy).mean() < 4
+print("✅ 快速縮放測試通過")
+
+# 測試 17: render_packed 一次完成渲染
+print("\n【測試 17】render_packed")
+print("-" * 50)
+from image_processor import RenderParams
+cat = Image.open("CAT_800.png")
+for mode in ImageProcessor.DITHER_MODES:
+    chained = processor.image_to_bytes(processor.convert_to_1bit(cat, dither_mode=mode))
+    packed = processor.render_packed(cat, RenderParams(dither_mode=mode))
+    assert packed == chained and len(packed) == 48000, mode
+    # 與直接打包 1-bit 圖片的 bool 陣列一致
+    bits = np.asarray(processor.convert_to_1bit(cat, dither_mode=mode))
+    assert np.packbits(bits, axis=1).tobytes() == packed, mode
+print("✅ render_packed 測試通過")
+
+# 測試 18: 已渲染畫面快取
+print("\n【測試 18】畫面快取")
+print("-" * 50)
+from frame_cache import FrameCache
+with open("CAT_800.png", 'rb') as f:
+    cat_source = f.read()
+frames = FrameCache(2 * processor.total_bytes, max_entries=2)
+first, hit = frames.render(processor, cat_source)
+assert not hit and first == processor.render_packed(Image.open("CAT_800.png"))
+second, hit = frames.render(processor, cat_source)
+assert hit and second is first
+# 不同的抖動模式 / 目標尺寸是不同的 key
+_, hit = frames.render(processor, cat_source, RenderParams(dither_mode='bayer8'))
+assert not hit
+small_frame, hit = frames.render(ImageProcessor(400, 240), cat_source)
+assert not hit and len(small_frame) == 12000
+assert len(frames) == 2     # 超過張數上限，最久未使用者被淘汰
+print(f"統計: {frames.stats()}")
+print("✅ 畫面快取測試通過")
+
+# 測試 19: 背景渲染不阻塞事件迴圈
+print("\n【測試 19】背景渲染與事件迴圈延遲")
+print("-" * 50)
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+from render_pool import RenderPool, measure_loop_lag
+upload = jpeg.getvalue()    # 測試 16 的 3200x1920 JPEG，模擬大型上傳
+atkinson = RenderParams(dither_mode='atkinson')
+expected_frame = processor.render_packed(Image.open(io.BytesIO(upload)), atkinson)
+
+async def lag_for(mode):
+    pool = RenderPool(mode)
+    try:
+        result = {}
+        
+        async def render():
+            result['frame'] = await pool.render_source(processor, upload, atkinson)
+        
+        lag = await measure_loop_lag(render())
+        assert result['frame'] == expected_frame
+        return lag
+    finally:
+        pool.shutdown()
+
+inline_lag = asyncio.run(lag_for('inline'))
+process_lag = asyncio.run(lag_for('process'))
+print(f"事件迴圈最大延遲: inline {inline_lag:.1f} ms, process {process_lag:.1f} ms")
+assert process_lag < inline_lag / 2
+
+async def recover_broken_pool():
+    # worker 被終止（例如 OOM）後重建程序池：該次請求失敗，之後的請求照常處理
+    pool = RenderPool('process')
+    try:
+        old_pids = pool.worker_pids
+        try:
+            await pool.run(os._exit, 1)
+            assert False, "worker 結束時應回報 BrokenProcessPool"
+        except BrokenProcessPool:
+            pass
+        assert await pool.run(os.getpid) in pool.worker_pids and pool.worker_pids != old_pids
+    finally:
+        pool.shutdown()
+
+asyncio.run(recover_broken_pool())
+print("worker 程序意外結束後可重建")
+print("✅ 背景渲染測試通過")
+
+# 測試 20: 條帶渲染（STRIP_RENDERING）
+print("\n【測試 20】條帶串流渲染")
+print("-" * 50)
+streaming = ImageProcessor(800, 480, resample='BILINEAR', max_intermediate_size=2000, strip_height=7)
+gray = np.asarray(streaming.resize_to_target(Image.open(io.BytesIO(upload))))
+for mode in ('none', 'bayer4', 'bayer8', 'floyd-steinberg', 'atkinson'):
+    strips = list(streaming.iter_packed_strips(Image.open(io.BytesIO(upload)), RenderParams(mode), 7))
+    assert [y for y, _ in strips] == list(range(0, 480, 7))   # 最後一條帶只有 4 列
+    assert all(len(data) == min(7, 480 - y) * 100 for y, data in strips)
+    if mode == 'none':
+        expected_bits = gray >= 128
+    elif mode.startswith('bayer'):
+        expected_bits = ImageProcessor.ordered_dither(gray, int(mode[-1]))
+    else:
+        kernel = ImageProcessor.ATKINSON_KERNEL if mode == 'atkinson' else ImageProcessor.FLOYD_STEINBERG_KERNEL
+        expected_bits = ImageProcessor.error_diffusion(gray, kernel)
+    # 逐條帶結果（含跨條帶誤差）需與整張處理相同
+    assert b''.join(data for _, data in strips) == np.packbits(expected_bits, axis=1).tobytes(), mode
+assert streaming.render_packed(Image.open("CAT_800.png"), RenderParams('bayer8')) == \
+    processor.render_packed(Image.open("CAT_800.png"), RenderParams('bayer8'))
+print("✅ 條帶串流渲染測試通過")
+
+# 測試 21: 字體與字形尺寸快取
+print("\n【測試 21】字體快取")
+print("-" * 50)
+import os
+from PIL import ImageDraw
+from image_processor import load_font, text_bbox, resolve_system_font
+font_path = resolve_system_font()
+print(f"系統字體: {font_path}")
+assert font_path is None or os.path.exists(font_path)
+small = ImageProcessor(400, 240)
+small.create_text_image("12:00")
+fonts_before, metrics_before = load_font.cache_info(), text_bbox.cache_info()
+for _ in range(10):
+    small.create_text_image("12:00")
+assert load_font.cache_info().misses == fonts_before.misses      # 不再從磁碟載入字體
+assert text_bbox.cache_info().hits == metrics_before.hits + 10   # 不再重新量測
+assert load_font(None, 48) is load_font(None, 48)
+draw = ImageDraw.Draw(Image.new('1', (1, 1)))
+assert text_bbox("Test\nCompression", None, 32) == draw.textbbox((0, 0), "Test\nCompression", font=load_font(None, 32))
+print("✅ 字體快取測試通過")
+
+# 測試 22: 自動排版
+print("\n【測試 22】自動排版")
+print("-" * 50)
+from image_processor import fit_text, wrap_text, text_width
+short = fit_text("Hello", 784, 464, None, 480, 12)
+long_text = "The quick brown fox jumps over the lazy dog. " * 4
+paragraph = fit_text(long_text, 784, 464, None, 480, 12)
+print(f"短文字: {short.font_size}px {short.lines}, 長文字: {paragraph.font_size}px {len(paragraph.lines)} 行")
+assert short.font_size > paragraph.font_size and len(paragraph.lines) > 1
+for layout in (short, paragraph):
+    assert max(layout.line_widths) <= 784
+    assert len(layout.lines) * layout.line_height - layout.spacing <= 464
+assert " ".join(paragraph.lines) == long_text.strip()
+assert [line for line, _ in wrap_text("溫度 23°C\n濕度 60%", 10000)] == ["溫度 23°C", "濕度 60%"]
+assert all(width <= 100 for _, width in wrap_text("中文每個字都可以斷行", 100, None, 24))
+widths_before = text_width.cache_info()
+assert fit_text(long_text, 784, 464, None, 480, 12) is paragraph   # 排版結果快取
+wrap_text(long_text, 784, None, paragraph.font_size)
+assert text_width.cache_info().misses == widths_before.misses      # 單字寬度快取
+text_img = ImageProcessor(800, 480).create_fitted_text_image(long_text)
+assert text_img.size == (800, 480) and text_img.mode == '1'
+print("✅ 自動排版測試通過")
+
+# 測試 23: 固定畫面
+print("\n【測試 23】固定畫面")
+print("-" * 50)
+from static_frames import StaticFrameRegistry, default_static_frames, pattern_frame
+static = default_static_frames(ImageProcessor(400, 240), ImageProcessor(800, 480))
+static.prebuild()
+print(f"固定畫面: {', '.join(static.names())}")
+assert static.get("white_800x480").data == b'\xff' * 48000
+assert static.get("black_400x240").data == b'\x00' * 12000
+assert static.get("test_800x480").data == pattern_frame(ImageProcessor(800, 480))
+assert len(static.get("splash").data) == 48000
+assert static.get("test_800x480") is static.get("test_800x480")   # 只渲染一次
+encodes = []
+def encode_static(frame):
+    encodes.append(frame.name)
+    return Protocol.pack_full_frame(0, frame.data)
+for seq in (7, 8):
+    packet = Protocol.with_seq_id(static.packet("white_400x240", encode_static), seq)
+    assert Protocol.unpack_header(packet)[2] == seq and packet[Protocol.HEADER_SIZE:] == b'\xff' * 12000
+assert encodes == ["white_400x240"]                                 # 只編碼一次
+try:
+    static.get("missing")
+    assert False
+except KeyError:
+    pass
+print(f"統計: {static.stats()}")
+print("✅ 固定畫面測試通過")
+
+# 測試 24: 打包畫面條帶切割
+print("\n【測試 24】打包畫面條帶切割")
+print("-" * 50)
+cat_1bit = processor.convert_to_1bit(cat)
+cat_frame = processor.image_to_bytes(cat_1bit)
+bands = list(processor.iter_bands(cat_frame))
+legacy_tiles = processor.split_image_to_tiles(cat_1bit)
+assert [(y, height) for y, height, _ in bands] == [(0, 160), (160, 160), (320, 160)]
+for index, (_, _, band) in enumerate(bands):
+    assert band.obj is cat_frame                                    # 不複製資料
+    assert band == processor.process_tile(legacy_tiles[index], dither=False)
+bands_30 = list(processor.iter_bands(cat_frame, 30))
+bands_100 = list(processor.iter_bands(cat_frame, 100))
+assert len(bands_30) == 16 and b"".join(bands_30[i][2] for i in range(16)) == cat_frame
+assert bands_100[-1][:2] == (400, 80)                               # 最後一條較矮
+packet = Protocol.pack_band(9, 400, 80, bands_100[-1][2])
+assert Protocol.get_packet_info(packet)['type'] == 'BAND_UPDATE'
+assert Protocol.unpack_band(packet[Protocol.HEADER_SIZE:]) == (400, 80, cat_frame[40000:])
+rows = Protocol.band_rows(12000, 100)
+assert rows == 119 and len(Protocol.pack_band(1, 0, rows, b'\x00' * rows * 100)) <= 12000
+print(f"160 列: {len(bands)} 條帶, 30 列: {len(bands_30)} 條帶, 12000 bytes 封包: {rows} 列")
+print("✅ 條帶切割測試通過")
+
+# 測試 25: 批次轉換
+print("\n【測試 25】批次轉換")
+print("-" * 50)
+import tempfile
+from pathlib import Path
+from batch_convert import batch_convert, load_manifest
+with tempfile.TemporaryDirectory() as folder:
+    source_dir, output_dir = Path(folder) / "images", Path(folder) / "packed"
+    (source_dir / "sub").mkdir(parents=True)
+    cat.save(source_dir / "cat.png")
+    Image.new('L', (200, 120), 255).save(source_dir / "sub" / "white.jpg")
+    batch = ImageProcessor(400, 240, dither_mode='bayer8')
+    quiet = lambda *args: None
+    
+    first = batch_convert(source_dir, output_dir, batch, workers=2, log=quiet)
+    assert first['converted'] == 2
+    assert (output_dir / "cat.png.bin").read_bytes() == batch.render_packed(Image.open(source_dir / "cat.png"))
+    manifest = load_manifest(output_dir)
+    assert manifest['frames']['sub/white.jpg']['frame_hash'] == frame_digest(b'\xff' * 12000).hex()
+    assert not list(output_dir.rglob("*.enc"))                        # 編碼在發送時進行，不另外輸出
+    
+    assert batch_convert(source_dir, output_dir, batch, log=quiet)['unchanged'] == 2
+    os.utime(source_dir / "cat.png", ns=(0, 0))                        # 只改 mtime
+    assert batch_convert(source_dir, output_dir, batch, log=quiet)['rehashed'] == 1
+    (source_dir / "sub" / "white.jpg").unlink()
+    Image.new('L', (200, 120), 0).save(source_dir / "black.png")
+    stats = batch_convert(source_dir, output_dir, batch, log=quiet)
+    assert (stats['converted'], stats['unchanged'], stats['removed']) == (1, 1, 1)
+    assert not (output_dir / "sub" / "white.jpg.bin").exists()
+    # 設定改變時全部重新轉換
+    assert batch_convert(source_dir, output_dir, ImageProcessor(400, 240, dither_mode='none'), log=quiet)['converted'] == 2
+    # 來源變更後轉換失敗：不留下舊的輸出
+    (source_dir / "cat.png").write_bytes(b"not an image")
+    assert batch_convert(source_dir, output_dir, batch, log=quiet)['failed'] == 1
+    assert not (output_dir / "cat.png.bin").exists()
+    assert 'cat.png' not in load_manifest(output_dir)['frames']
+    print(f"第一次: {first}, 變更後: {stats}")
+print("✅ 批次轉換測試通過")
+
+# 測試 26: 畫面儲存檔
+print("\n【測試 26】畫面儲存檔 (mmap)")
+print("-" * 50)
+from frame_store import FrameStore
+with tempfile.TemporaryDirectory() as folder:
+    store_path = Path(folder) / "frames.dat"
+    store = FrameStore(store_path, 48000)
+    white_frame, cat_slot = b'\xff' * 48000, store.append(cat_frame, "cat.png")
+    assert (cat_slot, store.append(white_frame, "white"), store.append(cat_frame)) == (0, 1, 0)  # 相同內容只存一份
+    view = store.lookup("cat.png")
+    assert isinstance(view, memoryview) and view.readonly and view == cat_frame
+    assert store.lookup(frame_digest(white_frame)) == white_frame
+    assert store.find(frame_digest(cat_frame).hex()[:12]) == 0 and store.find(-1) == 1
+    assert store.lookup("missing") is None
+    store.append(bytes(48000), "black")                               # 檔案變大後舊的 view 仍可用
+    assert view == cat_frame and store.lookup("black") == bytes(48000)
+    del view                                                          # 沒有 view 在使用的舊 mmap 下次變大時釋放
+    store.append(b'\xaa' * 48000, "gray")
+    assert store.lookup("gray") == b'\xaa' * 48000 and not store._retired
+    store.close()
+    
+    # 重新開啟：索引與資料都還在；寫入中斷留下的不完整資料會被截斷
+    with open(store_path, 'ab') as f:
+        f.write(b'partial')
+    store = FrameStore(store_path, 48000)
+    assert len(store) == 4 and store.lookup("white") == white_frame
+    assert os.path.getsize(store_path) == 4 * 48000
+    print(f"統計: {store.stats()}")
+    store.close()
+    
+    store = FrameStore(store_path, 48000, max_frames=4)                   # 存滿後只接受已有的內容
+    assert store.append(bytes([0x0F]) * 48000, "new") is None and store.append(white_frame, "white2") == 1
+    assert len(store) == 4 and os.path.getsize(store_path) == 4 * 48000
+    store.close()
+print("✅ 畫面儲存檔測試通過")
+
+# 測試 27: 動畫（多幀 GIF 與幀間差分）
+print("\n【測試 27】動畫差分編碼")
+print("-" * 50)
+from animation import encode_animation, frame_count, render_frame_range, split_ranges
+from protocol import PacketType
+anim_processor = ImageProcessor(400, 240, dither_mode='bayer8')
+gif_frames = []
+for i in range(6):
+    gif_frame = Image.new('L', (400, 240), 255)
+    gif_frame.paste(0, (20 + i * 50, 100, 60 + i * 50, 140))
+    gif_frames.append(gif_frame)
+gif_buffer = io.BytesIO()
+gif_frames[0].save(gif_buffer, format='GIF', save_all=True, append_images=gif_frames[1:], duration=150, loop=0)
+gif_source = gif_buffer.getvalue()
+assert frame_count(gif_source) == 6 and frame_count(cat_source) == 1
+mpo_buffer = io.BytesIO()                                             # 手機相機的 MPO：多幀但不是動畫
+gif_frames[0].convert('RGB').save(mpo_buffer, format='MPO', save_all=True,
+                                  append_images=[gif_frames[1].convert('RGB')])
+assert Image.open(io.BytesIO(mpo_buffer.getvalue())).n_frames == 2 and frame_count(mpo_buffer.getvalue()) == 1
+
+assert split_ranges(6, 4) == [(0, 1), (1, 3), (3, 4), (4, 6)] and split_ranges(2, 8) == [(0, 1), (1, 2)]
+rendered = render_frame_range(anim_processor, gif_source, 0, 6)
+assert [item for start, stop in split_ranges(6, 3)                    # 分段渲染與依序渲染結果相同
+        for item in render_frame_range(anim_processor, gif_source, start, stop)] == rendered
+assert all(duration == 150 for _, duration in rendered)
+
+animation = encode_animation([frame for frame, _ in rendered], [duration for _, duration in rendered], 400, 240)
+assert [packet[1] for packet in animation.packets] == [PacketType.DELTA_UPDATE] * 6  # 第 0 幀為循環用差分
+assert animation.digests[2] == frame_digest(animation.frames[2])
+assert animation.payload_bytes() < len(animation.frames[0])
+print(f"6 幀循環一輪: {animation.payload_bytes()} bytes (完整畫面 {6 * anim_processor.total_bytes} bytes)")
+
+still = encode_animation([rendered[0][0]], [100], 400, 240)
+assert still.packets == (None,) and still.payload_bytes() == 0   # 單幀無變化
+print("✅ 動畫差分編碼測試通過")
+
+# 測試 28: 黑白來源快速路徑
+print("\n【測試 28】黑白來源快速路徑")
+print("-" * 50)
+screenshot = Image.new('RGB', (1600, 960), 'white')
+screenshot_draw = ImageDraw.Draw(screenshot)
+for row in range(20):
+    screenshot_draw.text((20, 10 + row * 45), "Hello e-Paper 0123456789 " * 3, font=load_font(None, 28), fill='black')
+gradient = Image.radial_gradient('L').resize((800, 480))
+assert processor.is_bilevel(screenshot) and not processor.is_bilevel(gradient)
+assert processor.is_bilevel(Image.new('1', (64, 64), 1))                # 全白也是黑白
+
+bilevel = RenderParams(detect_bilevel=True)
+frame, path = processor.render_packed_info(screenshot, bilevel)
+expected = screenshot.resize((800, 480), Image.Resampling.NEAREST).convert('L').point(lambda v: 255 if v >= 128 else 0)
+assert path == 'bilevel' and frame == processor.image_to_bytes(expected.convert('1'))
+assert processor.render_packed_info(gradient, bilevel)[1] == processor.dither_mode
+assert processor.render_packed_info(screenshot)[1] == processor.dither_mode  # 預設不偵測，輸出不變
+strip_processor = ImageProcessor(800, 480, strip_height=30)
+assert strip_processor.render_packed(screenshot, bilevel) == frame       # 條帶渲染結果相同
+assert FrameCache.make_key(b'x', processor, bilevel) != FrameCache.make_key(b'x', processor, RenderParams())
+# 條帶高度與中間圖上限會改變抖動結果，不可共用快取
+assert FrameCache.make_key(b'x', processor, bilevel) != FrameCache.make_key(b'x', strip_processor, bilevel)
+assert FrameCache.make_key(b'x', processor, bilevel) != FrameCache.make_key(
+    b'x', ImageProcessor(800, 480, max_intermediate_size=2000), bilevel)
+print("✅ 黑白來源快速路徑測試通過")
+
+# 測試 29: 伺服器端裁切 / 放入 / 旋轉
+print("\n【測試 29】伺服器端裁切 / 放入 / 旋轉")
+print("-" * 50)
+from PIL import ExifTags
+layout_processor = ImageProcessor(800, 480, dither_mode='bayer8')
+assert layout_processor.fit_layout((1600, 960)) == ((0, 0, 1600, 960), (800, 480), (800, 480))
+box, content, frame = layout_processor.fit_layout((2000, 2000), RenderParams(crop=(0, 0, 1000, 1000), fit='contain'))
+assert content == (480, 480) and frame == (800, 480)
+box, content, frame = layout_processor.fit_layout((2000, 2000), RenderParams(crop=(0, 0, 1000, 1000), fit='cover'))
+assert box == (0, 200, 1000, 800) and content == frame == (800, 480)  # 從中央裁掉上下
+assert layout_processor.fit_layout((2000, 2000), RenderParams(rotate=90))[2] == (480, 800)
+
+# 左半黑、右半白的來源：裁切右半 → 全白；旋轉 90 度 → 上半黑
+halves = Image.new('L', (1600, 960), 255)
+halves.paste(0, (0, 0, 800, 960))
+gray = layout_processor.resize_to_target(halves, RenderParams(crop=(800, 0, 800, 960)))
+assert gray.size == (800, 480) and np.asarray(gray).min() == 255
+gray = np.asarray(layout_processor.resize_to_target(halves, RenderParams(rotate=90)))
+assert gray[:200].max() == 0 and gray[280:].min() == 255
+gray = np.asarray(layout_processor.resize_to_target(halves, RenderParams(crop=(700, 0, 200, 960), fit='contain')))
+assert gray[:, :300].min() == 255 and gray[:, 500:].min() == 255  # 左右留白
+
+# JPEG 只解碼到裁切範圍所需的 DCT 倍率；裁切座標為套用 EXIF 方向後的座標
+exif = Image.Exif()
+exif[ExifTags.Base.Orientation] = 6                                      # 順時針旋轉 90 度顯示
+jpeg_buffer = io.BytesIO()
+halves.convert('RGB').resize((3200, 1920)).save(jpeg_buffer, format='JPEG', exif=exif)
+jpeg = Image.open(io.BytesIO(jpeg_buffer.getvalue()))
+prepared, box, content, _ = layout_processor.prepare(jpeg, RenderParams(crop=(0, 800, 1920, 1600)))
+assert prepared.size == (960, 1600) and box == (0, 400, 960, 1200)       # 1/2 解碼，已轉為直向
+gray = np.asarray(layout_processor.resize_to_target(Image.open(io.BytesIO(jpeg_buffer.getvalue())),
+                                                    RenderParams(crop=(0, 800, 1920, 1600))))
+assert gray[:200].mean() < 20 and gray[280:].mean() > 235              # 直向顯示時黑色在上半
+
+# 低記憶體模式與黑白快速路徑也套用相同幾何
+assert len(ImageProcessor(800, 480, strip_height=30).render_packed(halves, RenderParams(crop=(800, 0, 800, 960)))) == 48000
+frame, path = layout_processor.render_packed_info(halves, RenderParams(detect_bilevel=True, rotate=90))
+assert path == 'bilevel' and frame == layout_processor.render_packed(halves, RenderParams('none', rotate=90))
+print("✅ 伺服器端裁切 / 放入 / 旋轉測試通過")
+
 # 總結
 print("\n" + "=" * 50)
 print("✅ 所有測試通過！")